@@ -0,0 +1,488 @@
+"""
+Asyncio-native IMAP4rev1 client core.
+
+Unlike imaplib, commands are not serialized: each command gets a tag and a
+future, is written as soon as the connection is free to write, and
+completes when its tagged response arrives. Many commands can be
+outstanding on one connection, and many connections can share one event
+loop, so concurrent fetches across folders and accounts don't need a
+thread each. Every command accepts a timeout and can be cancelled; a
+cancelled command's late responses are read and discarded. A command cut
+off while it was being written (say, waiting for a literal's go-ahead)
+leaves the server mid-command, so the connection is marked broken and
+closed; later commands fail at once and the caller reconnects.
+
+compress() negotiates COMPRESS=DEFLATE (RFC 4978) like the imaplib
+connections do, and traffic is reported to the same instrumentation
+counters (bytes_*, payload_bytes_*, round_trips).
+
+Untagged responses are attributed to the oldest outstanding command, which
+matches how servers answer pipelined commands in order.
+
+From Qt code, run the client on an AsyncioBridge (qt_asyncio.py), as the
+body prefetch does.
+"""
+
+import asyncio
+import ssl
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import instrumentation
+from email_handler import message_to_record
+from imap_parser import parse_data, parse_fetch, quote
+from logging_config import get_logger
+
+logger = get_logger("async_imap")
+
+Untagged = Tuple[bytes, List[bytes]]
+
+
+class IMAPError(Exception):
+    pass
+
+
+class IMAPCommandError(IMAPError):
+    """The server answered NO or BAD"""
+
+    def __init__(self, response):
+        super().__init__(f"{response.name} failed: {response.status} {response.text}")
+        self.response = response
+
+
+class IMAPTimeout(IMAPError):
+    pass
+
+
+class Response:
+    def __init__(self, name: str, tag: str, status: str, text: str,
+                 untagged: List[Untagged]):
+        self.name = name
+        self.tag = tag
+        self.status = status
+        self.text = text
+        self.untagged = untagged
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "OK"
+
+    def responses(self, kind: str) -> List[Untagged]:
+        """Untagged responses of one kind, e.g. 'SEARCH' or 'FETCH'.
+
+        The returned data starts after the keyword (or after the number
+        for numbered responses such as '* 3 EXISTS').
+        """
+        kind = kind.upper().encode()
+        found = []
+        for data, literals in self.untagged:
+            words = data.split(b" ", 3)
+            if len(words) > 1 and words[1].upper() == kind:
+                found.append((data[len(words[0]) + len(words[1]) + 2:], literals))
+            elif len(words) > 2 and words[1].isdigit() and words[2].upper() == kind:
+                found.append((words[1] + b" " + (words[3] if len(words) > 3 else b""),
+                              literals))
+        return found
+
+
+class _InflatingReader:
+    """readline()/readexactly() over a COMPRESS=DEFLATE response stream"""
+
+    def __init__(self, raw: asyncio.StreamReader):
+        self.raw = raw
+        self.inflater = zlib.decompressobj(-15)
+        self.buffer = bytearray()
+
+    async def _fill(self) -> bool:
+        chunk = await self.raw.read(65536)
+        if not chunk:
+            return False
+        instrumentation.count("bytes_received", len(chunk))
+        self.buffer += self.inflater.decompress(chunk)
+        return True
+
+    async def readline(self) -> bytes:
+        while True:
+            end = self.buffer.find(b"\n")
+            if end >= 0:
+                line = bytes(self.buffer[:end + 1])
+                del self.buffer[:end + 1]
+                return line
+            if not await self._fill():
+                line = bytes(self.buffer)
+                self.buffer.clear()
+                return line
+
+    async def readexactly(self, size: int) -> bytes:
+        while len(self.buffer) < size:
+            if not await self._fill():
+                raise asyncio.IncompleteReadError(bytes(self.buffer), size)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+class _PendingCommand:
+    __slots__ = ("tag", "name", "future", "untagged")
+
+    def __init__(self, tag: str, name: str, future: asyncio.Future):
+        self.tag = tag
+        self.name = name
+        self.future = future
+        self.untagged: List[Untagged] = []
+
+
+class AsyncIMAPClient:
+    def __init__(self, host: str, port: int = 993, tls: str = "ssl",
+                 timeout: float = 30.0, ssl_context: Optional[ssl.SSLContext] = None):
+        self.host = host
+        self.port = port
+        self.tls = tls
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        self.capabilities = set()
+        self.unsolicited: List[Untagged] = []
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._pending: "OrderedDict[str, _PendingCommand]" = OrderedDict()
+        self._write_lock = asyncio.Lock()
+        self._continuation: Optional[asyncio.Future] = None
+        self._tag_counter = 0
+        self._select_lock = asyncio.Lock()
+        self.selected: Optional[str] = None
+        # The stream is out of step with the server; don't reuse it
+        self.broken = False
+        # Tag of a COMPRESS command awaiting its reply, and the outgoing
+        # half of the stream once the server has agreed
+        self._compress_tag: Optional[str] = None
+        self._deflater = None
+        self._awaiting_response = False
+
+    # Connection lifecycle
+
+    async def connect(self):
+        context = self.ssl_context or ssl.create_default_context()
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host, self.port,
+                ssl=context if self.tls == "ssl" else None,
+                server_hostname=self.host if self.tls == "ssl" else None,
+            ),
+            self.timeout,
+        )
+        greeting, _ = await asyncio.wait_for(self._read_response(), self.timeout)
+        if not greeting.startswith(b"* OK"):
+            raise IMAPError(f"Unexpected greeting: {greeting!r}")
+
+        if self.tls == "starttls":
+            await self._starttls(context)
+
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+        await self.refresh_capabilities()
+
+    async def _starttls(self, context):
+        # Runs before the reader task exists, so read the reply inline
+        self._send(b"S0 STARTTLS\r\n")
+        await self._writer.drain()
+        while True:
+            line, _ = await asyncio.wait_for(self._read_response(), self.timeout)
+            if line.startswith(b"S0 "):
+                break
+        if not line.startswith(b"S0 OK"):
+            raise IMAPError(f"STARTTLS failed: {line!r}")
+        if not hasattr(self._writer, "start_tls"):
+            raise IMAPError("STARTTLS needs Python 3.11 or newer")
+        await self._writer.start_tls(context, server_hostname=self.host)
+
+    async def close(self):
+        self._abort(IMAPError("Connection closed"))
+        if self._writer:
+            try:
+                await self._writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+
+    def _abort(self, error: IMAPError):
+        """Mark the connection broken, close it and fail what's outstanding."""
+        self.broken = True
+        self.selected = None
+        if self._reader_task and self._reader_task is not asyncio.current_task():
+            self._reader_task.cancel()
+        if self._writer:
+            self._writer.close()
+        self._fail_pending(error)
+
+    # Writing
+
+    def _send(self, data: bytes):
+        payload = len(data)
+        if self._deflater is not None:
+            data = self._deflater.compress(data) + self._deflater.flush(zlib.Z_SYNC_FLUSH)
+        self._writer.write(data)
+        instrumentation.count("bytes_sent", len(data))
+        instrumentation.count("payload_bytes_sent", payload)
+        self._awaiting_response = True
+
+    # Reading
+
+    def _count_received(self, size: int):
+        instrumentation.count("payload_bytes_received", size)
+        if self._deflater is None:
+            instrumentation.count("bytes_received", size)
+
+    async def _read_response(self) -> Untagged:
+        """Read one response line, including any literals it carries."""
+        data = bytearray()
+        literals = []
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                raise IMAPError("Connection closed by server")
+            if self._awaiting_response:
+                # First response line after a command went out
+                self._awaiting_response = False
+                instrumentation.count("round_trips")
+            self._count_received(len(line))
+            if line.endswith(b"}\r\n") and b"{" in line:
+                size = line[line.rindex(b"{") + 1:-3]
+                if size.isdigit():
+                    data += line[:-2]
+                    literals.append(await self._reader.readexactly(int(size)))
+                    self._count_received(int(size))
+                    continue
+            data += line[:-2] if line.endswith(b"\r\n") else line
+            return bytes(data), literals
+
+    async def _read_loop(self):
+        try:
+            while True:
+                data, literals = await self._read_response()
+                self._dispatch(data, literals)
+                if self._compress_tag and data.startswith(self._compress_tag.encode() + b" "):
+                    # Everything after a successful reply is compressed
+                    if data.split(b" ", 2)[1].upper() == b"OK":
+                        self._start_compression()
+                    self._compress_tag = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug("Reader stopped: %s", e)
+            self._abort(e if isinstance(e, IMAPError) else IMAPError(str(e)))
+
+    def _start_compression(self):
+        self._deflater = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self._reader = _InflatingReader(self._reader)
+
+    def _dispatch(self, data: bytes, literals: List[bytes]):
+        if data.startswith(b"* "):
+            if self._pending:
+                next(iter(self._pending.values())).untagged.append((data, literals))
+            else:
+                self.unsolicited.append((data, literals))
+            return
+        if data.startswith(b"+"):
+            if self._continuation and not self._continuation.done():
+                self._continuation.set_result(data)
+            return
+        tag, _, rest = data.partition(b" ")
+        pending = self._pending.pop(tag.decode(), None)
+        if pending is None:
+            logger.debug("Response for unknown tag %s", tag)
+            return
+        status, _, text = rest.partition(b" ")
+        if not pending.future.done():
+            pending.future.set_result(Response(
+                pending.name, pending.tag, status.decode().upper(),
+                text.decode("utf-8", "replace"), pending.untagged,
+            ))
+
+    def _fail_pending(self, error: Exception):
+        for pending in self._pending.values():
+            if not pending.future.done():
+                pending.future.set_exception(error)
+        self._pending.clear()
+        if self._continuation and not self._continuation.done():
+            self._continuation.set_exception(error)
+
+    # Commands
+
+    def _next_tag(self) -> str:
+        self._tag_counter += 1
+        return f"A{self._tag_counter:04d}"
+
+    async def command(self, name: str, *args, timeout: Optional[float] = None,
+                      check: bool = True) -> Response:
+        """Send a command and wait for its tagged completion.
+
+        str arguments are sent verbatim (use quote() for strings), bytes
+        arguments are sent as literals. Several command() calls may be
+        awaited concurrently; they are pipelined on the connection.
+        """
+        if self._writer is None:
+            raise IMAPError("Not connected")
+        if self.broken:
+            raise IMAPError("Connection broken")
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        tag = self._next_tag()
+        pending = _PendingCommand(tag, name, loop.create_future())
+
+        async with self._write_lock:
+            if self.broken:
+                raise IMAPError("Connection broken")
+            self._pending[tag] = pending
+            try:
+                await self._write_command(tag, name, args, timeout)
+            except BaseException as e:
+                # Part of the command may be on the wire; the server would
+                # read whatever we send next as the rest of it
+                self._pending.pop(tag, None)
+                self._abort(IMAPError(f"{name} interrupted while sending: {e!r}"))
+                if isinstance(e, asyncio.TimeoutError):
+                    raise IMAPTimeout(f"{name} timed out while sending") from None
+                raise
+
+        try:
+            response = await asyncio.wait_for(pending.future, timeout)
+        except asyncio.TimeoutError:
+            raise IMAPTimeout(f"{name} timed out after {timeout}s") from None
+        if check and not response.ok:
+            raise IMAPCommandError(response)
+        return response
+
+    async def _write_command(self, tag, name, args, timeout):
+        literal_plus = "LITERAL+" in self.capabilities
+        line = f"{tag} {name}".encode()
+        for arg in args:
+            if isinstance(arg, bytes):
+                if literal_plus:
+                    line += b" {%d+}\r\n" % len(arg) + arg
+                    continue
+                # Synchronizing literal: wait for the server's go-ahead
+                self._continuation = asyncio.get_running_loop().create_future()
+                self._send(line + b" {%d}\r\n" % len(arg))
+                await self._writer.drain()
+                await asyncio.wait_for(self._continuation, timeout)
+                line = arg
+            else:
+                line += b" " + str(arg).encode()
+        self._send(line + b"\r\n")
+        await self._writer.drain()
+
+    # High-level helpers
+
+    async def refresh_capabilities(self):
+        response = await self.command("CAPABILITY")
+        for data, _ in response.responses("CAPABILITY"):
+            self.capabilities = {c.upper() for c in data.decode().split()}
+        return self.capabilities
+
+    async def login(self, username: str, password: str):
+        await self.command("LOGIN", quote(username), quote(password))
+        await self.refresh_capabilities()
+
+    async def compress(self) -> bool:
+        """Negotiate COMPRESS=DEFLATE (RFC 4978); returns True when active."""
+        if self._deflater is not None:
+            return True
+        if "COMPRESS=DEFLATE" not in self.capabilities:
+            return False
+        # Hold the write lock until the reply: whatever is written next
+        # must be compressed only if the server agreed
+        async with self._write_lock:
+            if self.broken:
+                raise IMAPError("Connection broken")
+            tag = self._next_tag()
+            pending = _PendingCommand(tag, "COMPRESS", asyncio.get_running_loop().create_future())
+            self._pending[tag] = pending
+            self._compress_tag = tag
+            try:
+                await self._write_command(tag, "COMPRESS", ("DEFLATE",), self.timeout)
+                response = await asyncio.wait_for(pending.future, self.timeout)
+            except BaseException as e:
+                # The server may or may not be compressing by now
+                self._pending.pop(tag, None)
+                self._abort(IMAPError(f"COMPRESS interrupted: {e!r}"))
+                if isinstance(e, asyncio.TimeoutError):
+                    raise IMAPTimeout("COMPRESS timed out") from None
+                raise
+        return response.ok
+
+    async def logout(self):
+        try:
+            await self.command("LOGOUT", check=False, timeout=5)
+        except IMAPError:
+            pass
+        finally:
+            await self.close()
+
+    async def select(self, folder: str = "INBOX", readonly: bool = False) -> Dict:
+        # A failed SELECT leaves no folder selected
+        self.selected = None
+        response = await self.command("EXAMINE" if readonly else "SELECT", quote(folder))
+        self.selected = folder
+        info = {}
+        for data, _ in response.untagged:
+            words = data.split()
+            if len(words) >= 3 and words[2] in (b"EXISTS", b"RECENT"):
+                info[words[2].decode()] = int(words[1])
+            elif b"[" in data:
+                code = data[data.index(b"[") + 1:data.index(b"]")].split()
+                if len(code) == 2 and code[1].isdigit():
+                    info[code[0].decode()] = int(code[1])
+        return info
+
+    async def status(self, folder: str, items=("MESSAGES", "UNSEEN", "UIDNEXT")) -> Dict:
+        response = await self.command("STATUS", quote(folder), f"({' '.join(items)})")
+        for data, literals in response.responses("STATUS"):
+            tokens = parse_data(data, literals)
+            values = tokens[-1]
+            return {values[i]: values[i + 1] for i in range(0, len(values) - 1, 2)}
+        return {}
+
+    async def uid_search(self, *criteria) -> List[int]:
+        response = await self.command("UID SEARCH", *(criteria or ("ALL",)))
+        uids = []
+        for data, _ in response.responses("SEARCH"):
+            uids.extend(int(n) for n in data.split())
+        return uids
+
+    async def uid_fetch(self, uid_set: str, items: str) -> Dict[int, Dict]:
+        """FETCH by UID; returns {uid: {item: value}}."""
+        response = await self.command("UID FETCH", uid_set, items)
+        results = {}
+        for data, literals in response.responses("FETCH"):
+            _, attributes = parse_fetch(data, literals)
+            if "UID" in attributes:
+                results[attributes["UID"]] = attributes
+        return results
+
+    async def fetch_bodies(self, uids: List[int], folder: str = "INBOX") -> Dict[int, bytes]:
+        """Full messages by UID, without setting \\Seen; {uid: raw bytes}."""
+        async with self._select_lock:
+            # Concurrent fetches share one EXAMINE
+            if self.selected != folder:
+                await self.select(folder, readonly=True)
+        fetched = await self.uid_fetch(",".join(map(str, uids)), "(UID BODY.PEEK[])")
+        return {
+            uid: attributes["BODY[]"] for uid, attributes in fetched.items()
+            if isinstance(attributes.get("BODY[]"), bytes)
+        }
+
+    async def fetch_recent(self, folder: str = "INBOX", limit: int = 50,
+                           batch_size: int = 50) -> List[Dict]:
+        """Fetch the newest messages with all batches pipelined at once."""
+        await self.select(folder, readonly=True)
+        uids = (await self.uid_search("ALL"))[-limit:]
+        batches = [uids[i:i + batch_size] for i in range(0, len(uids), batch_size)]
+        results = await asyncio.gather(*(
+            self.uid_fetch(",".join(map(str, batch)), "(UID BODY.PEEK[])")
+            for batch in batches
+        ))
+        records = []
+        for fetched in results:
+            for uid in sorted(fetched):
+                records.append(message_to_record(str(uid), fetched[uid]["BODY[]"]))
+        return records
@@ -0,0 +1,271 @@
+"""
+End-to-end throughput benchmark for EmailHandler and EmailWorker.
+
+Starts the in-process fake IMAP/SMTP server, seeds it with a synthetic
+mailbox and drives login, cold sync, incremental refresh, search, body
+prefetch (imaplib and the asyncio client) and send against it. Results are written as JSON so runs can be compared.
+
+Example:
+    python benchmark_email.py --messages 2000 --latency 0.02 --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import mime_decoder
+from async_imap import AsyncIMAPClient
+from email_worker import EmailWorker
+from fake_mail_server import FakeMailServer
+from synthetic_mail import SIZE_DISTRIBUTIONS, generate_message, generate_messages
+
+SEARCH_TERMS = ["invoice", "meeting", "alice", "schedule", "nonexistent-term"]
+
+# Messages per prefetch batch, PrefetchScheduler's default
+PREFETCH_BATCH = 5
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class PhaseRecorder:
+    """Collects latency samples and server traffic for one benchmark phase"""
+
+    def __init__(self, server, name):
+        self.server = server
+        self.name = name
+        self.latencies = []
+        self.messages = 0
+
+    def __enter__(self):
+        self.server.reset_stats()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.started
+
+    def measure(self, operation):
+        """Run one operation; it returns the number of messages it handled."""
+        start = time.perf_counter()
+        count = operation()
+        self.latencies.append(time.perf_counter() - start)
+        self.messages += count
+        return count
+
+    def result(self):
+        stats = self.server.stats()
+        return {
+            "operations": len(self.latencies),
+            "messages": self.messages,
+            "seconds": round(self.elapsed, 6),
+            "messages_per_sec": round(self.messages / self.elapsed, 2) if self.elapsed else 0.0,
+            "bytes_sent": stats["bytes_in"],
+            "bytes_received": stats["bytes_out"],
+            "compression_ratio": round(stats["payload_out"] / stats["bytes_out"], 2)
+            if stats["bytes_out"] else 1.0,
+            "commands": stats["commands"],
+            "round_trips": stats["round_trips"],
+            "latency_ms": {
+                "p50": round(percentile(self.latencies, 0.50) * 1000, 3),
+                "p99": round(percentile(self.latencies, 0.99) * 1000, 3),
+                "max": round(max(self.latencies, default=0) * 1000, 3),
+            },
+        }
+
+
+def make_worker():
+    """Create a worker that records what it emits"""
+    worker = EmailWorker()
+    worker.results = {}
+    worker.connected.connect(lambda ok, handler: worker.results.update(connected=ok))
+    worker.emails_fetched.connect(lambda emails: worker.results.update(emails=emails))
+    worker.email_sent.connect(lambda ok: worker.results.update(sent=ok))
+    worker.error.connect(lambda message: worker.results.update(error=message))
+    return worker
+
+
+def run(args):
+    server = FakeMailServer(latency=args.latency, bandwidth=args.bandwidth).start()
+    store = server.store
+    store.seed(generate_messages(args.messages, args.distribution, args.seed))
+    profile = server.profile(**({"fetch_batch_size": args.batch_size} if args.batch_size else {}))
+    options = {
+        "pipelining": not args.no_pipelining,
+        "compression": not args.no_compression,
+    }
+    if args.decode_workers:
+        mime_decoder.WORKERS = args.decode_workers
+    rng = random.Random(args.seed + 1)
+    phases = {}
+
+    try:
+        with PhaseRecorder(server, "login") as phase:
+            for _ in range(args.repeat):
+                worker = make_worker()
+
+                def login():
+                    worker.connect_account(store.username, store.password, profile, **options)
+                    if not worker.results.get("connected"):
+                        raise RuntimeError("login failed")
+                    return 0
+
+                phase.measure(login)
+                worker.handler.disconnect()
+        phases["login"] = phase.result()
+
+        worker = make_worker()
+        worker.connect_account(store.username, store.password, profile, **options)
+        handler = worker.handler
+
+        def fetch(limit, headers_only=False):
+            worker.results.pop("emails", None)
+            worker.fetch_emails(limit, headers_only)
+            if "error" in worker.results:
+                raise RuntimeError(worker.results["error"])
+            return len(worker.results.get("emails", []))
+
+        with PhaseRecorder(server, "cold_sync") as phase:
+            for _ in range(args.repeat):
+                phase.measure(lambda: fetch(args.sync_limit or args.messages))
+        phases["cold_sync"] = phase.result()
+
+        with PhaseRecorder(server, "header_sync") as phase:
+            for _ in range(args.repeat):
+                phase.measure(lambda: fetch(args.sync_limit or args.messages, headers_only=True))
+        phases["header_sync"] = phase.result()
+
+        with PhaseRecorder(server, "incremental_refresh") as phase:
+            for _ in range(args.repeat * 3):
+                inbox = store.folder("INBOX")
+                with store.lock:
+                    for _ in range(args.new_messages):
+                        inbox.append(generate_message(inbox.next_uid, rng, args.distribution))
+                phase.measure(lambda: fetch(args.refresh_limit))
+        phases["incremental_refresh"] = phase.result()
+
+        with PhaseRecorder(server, "search") as phase:
+            for _ in range(args.repeat):
+                for term in SEARCH_TERMS:
+                    phase.measure(lambda: len(handler.search_emails(term)))
+        phases["search"] = phase.result()
+
+        folders = sorted(store.folders)
+        with PhaseRecorder(server, "folder_status") as phase:
+            for _ in range(args.repeat):
+                phase.measure(lambda: len(handler.folder_status(folders)))
+        phases["folder_status"] = phase.result()
+
+        # Bodies of the newest messages in prefetch-sized batches, as the
+        # window fetches them after a header sync
+        uids = handler.uid_index["INBOX"][1][-args.refresh_limit:]
+        batches = [uids[i:i + PREFETCH_BATCH] for i in range(0, len(uids), PREFETCH_BATCH)]
+        with PhaseRecorder(server, "prefetch") as phase:
+            for _ in range(args.repeat):
+                phase.measure(lambda: sum(
+                    len(handler.fetch_bodies(batch)) for batch in batches
+                ))
+        phases["prefetch"] = phase.result()
+
+        loop = asyncio.new_event_loop()
+        client = AsyncIMAPClient(server.host, server.imap_port, "none")
+        loop.run_until_complete(client.connect())
+        loop.run_until_complete(client.login(store.username, store.password))
+        if options["compression"]:
+            loop.run_until_complete(client.compress())
+
+        async def prefetch_async():
+            fetched = await asyncio.gather(*(client.fetch_bodies(batch) for batch in batches))
+            return sum(map(len, fetched))
+
+        with PhaseRecorder(server, "async_prefetch") as phase:
+            for _ in range(args.repeat):
+                phase.measure(lambda: loop.run_until_complete(prefetch_async()))
+        phases["async_prefetch"] = phase.result()
+        loop.run_until_complete(client.logout())
+        loop.close()
+
+        with PhaseRecorder(server, "send") as phase:
+            for i in range(args.repeat * 3):
+                def send():
+                    worker.send_email(store.username, f"Benchmark {i}", "x" * 2000)
+                    if not worker.results.get("sent"):
+                        raise RuntimeError("send failed")
+                    return 1
+
+                phase.measure(send)
+        phases["send"] = phase.result()
+
+        handler.disconnect()
+    finally:
+        server.stop()
+
+    return {
+        "config": {
+            "messages": args.messages,
+            "distribution": args.distribution,
+            "latency": args.latency,
+            "bandwidth": args.bandwidth,
+            "batch_size": profile.fetch_batch_size,
+            "pipelining": not args.no_pipelining,
+            "compression": not args.no_compression,
+            "decode_workers": mime_decoder.WORKERS,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "phases": phases,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=1000,
+                        help="messages seeded into INBOX")
+    parser.add_argument("--distribution", choices=SIZE_DISTRIBUTIONS, default="mixed",
+                        help="message size distribution")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds injected per network round trip")
+    parser.add_argument("--bandwidth", type=int, default=None,
+                        help="server to client bandwidth cap in bytes/sec")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="override the profile's fetch batch size")
+    parser.add_argument("--sync-limit", type=int, default=None,
+                        help="messages fetched by the cold sync (default: all)")
+    parser.add_argument("--refresh-limit", type=int, default=50,
+                        help="messages fetched by each refresh, like the app")
+    parser.add_argument("--new-messages", type=int, default=5,
+                        help="messages delivered before each refresh")
+    parser.add_argument("--no-pipelining", action="store_true",
+                        help="wait for each IMAP reply before sending the next command")
+    parser.add_argument("--no-compression", action="store_true",
+                        help="don't negotiate COMPRESS=DEFLATE")
+    parser.add_argument("--decode-workers", type=int, default=None,
+                        help="MIME decode processes for large syncs (1 decodes inline)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
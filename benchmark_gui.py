@@ -0,0 +1,224 @@
+"""
+GUI responsiveness benchmark for EmailWindow.
+
+Runs offscreen, feeds EmailWindow.handle_emails_fetched with synthetic
+mailboxes and measures list population, incremental refresh,
+per-keystroke filtering, delegate paint cost during scripted scrolling and
+event-loop stalls. Results are written as JSON, including frame-time
+histograms.
+
+Example:
+    python benchmark_gui.py --sizes 1000,10000 --output gui.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QElapsedTimer, QEventLoop, QTimer
+from PyQt6.QtWidgets import QApplication
+
+from benchmark_email import percentile
+from email_window import EmailItemDelegate, EmailWindow
+from synthetic_mail import generate_records
+
+# Upper bounds in milliseconds of the frame/stall histogram buckets
+HISTOGRAM_BUCKETS_MS = (4, 8, 16, 33, 50, 100, 250, 1000)
+
+SEARCH_QUERY = "invoice"
+
+
+def histogram(samples_ms):
+    buckets = {f"<={bound}ms": 0 for bound in HISTOGRAM_BUCKETS_MS}
+    buckets[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] = 0
+    for sample in samples_ms:
+        for bound in HISTOGRAM_BUCKETS_MS:
+            if sample <= bound:
+                buckets[f"<={bound}ms"] += 1
+                break
+        else:
+            buckets[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] += 1
+    return buckets
+
+
+def summarize(samples, scale=1000.0, digits=3):
+    """p50/p99/max of samples in seconds, scaled (to ms by default)."""
+    return {
+        "samples": len(samples),
+        "p50": round(percentile(samples, 0.50) * scale, digits),
+        "p99": round(percentile(samples, 0.99) * scale, digits),
+        "max": round(max(samples, default=0) * scale, digits),
+    }
+
+
+class TimedDelegate(EmailItemDelegate):
+    """EmailItemDelegate that records how long each row takes to paint"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.samples = []
+
+    def paint(self, painter, option, index):
+        start = time.perf_counter()
+        super().paint(painter, option, index)
+        self.samples.append(time.perf_counter() - start)
+
+
+class StallMonitor:
+    """Heartbeat timer that records how late the event loop serviced it"""
+
+    def __init__(self, interval_ms=2, threshold_ms=16):
+        self.interval_ms = interval_ms
+        self.threshold_ms = threshold_ms
+        self.gaps_ms = []
+        self.clock = QElapsedTimer()
+        self.timer = QTimer()
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.beat)
+
+    def start(self):
+        self.gaps_ms.clear()
+        self.clock.start()
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def beat(self):
+        self.gaps_ms.append(self.clock.restart() - self.interval_ms)
+
+    def result(self):
+        stalls = [gap for gap in self.gaps_ms if gap > self.threshold_ms]
+        return {
+            "threshold_ms": self.threshold_ms,
+            "count": len(stalls),
+            "total_ms": round(sum(stalls), 3),
+            "max_ms": round(max(stalls, default=0), 3),
+            "histogram": histogram(stalls),
+        }
+
+
+def run_in_loop(action, settle_ms=20):
+    """Run an action from the event loop, then let queued events drain."""
+    loop = QEventLoop()
+    result = {}
+
+    def step():
+        start = time.perf_counter()
+        action()
+        result["seconds"] = time.perf_counter() - start
+        QTimer.singleShot(settle_ms, loop.quit)
+
+    QTimer.singleShot(0, step)
+    loop.exec()
+    return result["seconds"]
+
+
+def wait_until(predicate, timeout_ms=10000):
+    clock = QElapsedTimer()
+    clock.start()
+    while not predicate():
+        if clock.elapsed() > timeout_ms:
+            raise TimeoutError("EmailWindow did not finish setting up")
+        QApplication.processEvents(QEventLoop.ProcessEventsFlag.AllEvents, 10)
+
+
+def bench_size(count, scroll_steps):
+    window = EmailWindow("bench@local.test")
+    window.resize(1000, 700)
+    window.show()
+    wait_until(lambda: getattr(window, "ui_ready", False))
+
+    delegate = TimedDelegate(window.email_list)
+    window.email_list.setItemDelegate(delegate)
+
+    populate_samples = []
+    original_populate = window.populate_email_list
+
+    def timed_populate():
+        start = time.perf_counter()
+        original_populate()
+        populate_samples.append(time.perf_counter() - start)
+
+    window.populate_email_list = timed_populate
+
+    monitor = StallMonitor()
+    monitor.start()
+
+    records = generate_records(count)
+    fetched_seconds = run_in_loop(lambda: window.handle_emails_fetched(records))
+
+    # A periodic refresh where one message arrived and the oldest went away
+    refreshed = [dict(record) for record in records[1:]]
+    refreshed.append(dict(records[-1], id=str(count + 1)))
+    refresh_seconds = run_in_loop(lambda: window.handle_emails_fetched(refreshed))
+
+    # Type the query one character at a time, then clear it again
+    keystrokes = []
+    for length in list(range(1, len(SEARCH_QUERY) + 1)) + [0]:
+        text = SEARCH_QUERY[:length]
+        keystrokes.append(run_in_loop(
+            lambda: window.search_widget.search_input.setText(text), settle_ms=5
+        ))
+
+    # Scroll through the list and force a synchronous repaint per frame
+    delegate.samples.clear()
+    scrollbar = window.email_list.verticalScrollBar()
+    frames = []
+    for step in range(scroll_steps):
+        value = scrollbar.maximum() * step // max(1, scroll_steps - 1)
+
+        def frame():
+            scrollbar.setValue(value)
+            window.email_list.viewport().repaint()
+
+        frames.append(run_in_loop(frame, settle_ms=1))
+
+    monitor.stop()
+    frame_ms = [seconds * 1000 for seconds in frames]
+    result = {
+        "messages": count,
+        "handle_emails_fetched_ms": round(fetched_seconds * 1000, 3),
+        "refresh_one_new_ms": round(refresh_seconds * 1000, 3),
+        "populate_email_list_ms": summarize(populate_samples),
+        "filter_keystroke_ms": summarize(keystrokes),
+        "paint_us_per_row": summarize(delegate.samples, scale=1_000_000, digits=1),
+        "scroll_frame_ms": dict(summarize(frames), histogram=histogram(frame_ms)),
+        "event_loop_stalls": monitor.result(),
+    }
+    window.close()
+    window.deleteLater()
+    QApplication.processEvents()
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma separated mailbox sizes")
+    parser.add_argument("--scroll-steps", type=int, default=200,
+                        help="frames in the scripted scroll")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    results = []
+    for size in args.sizes.split(","):
+        results.append(bench_size(int(size), args.scroll_steps))
+    text = json.dumps({"platform": app.platformName(), "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Startup benchmark: time to first paint of the login and inbox windows.
+
+Each run is a fresh Python process (imports are only slow once), running
+offscreen. The child imports main, shows the LoginWindow and waits for its
+first paint, then opens an EmailWindow, hands it a synthetic mailbox and
+waits for the first paint of the message list with rows in it. Paints are
+observed with an application-wide event filter, so the same benchmark can
+be pointed at an older checkout with --repo to compare.
+
+Example:
+    python benchmark_startup.py --runs 10 --output startup.json
+"""
+
+import time
+
+_START = time.perf_counter()
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+METRICS = ("import_main_ms", "login_painted_ms", "inbox_rows_painted_ms",
+           "inbox_open_to_rows_ms")
+
+
+def since_start():
+    return round((time.perf_counter() - _START) * 1000, 3)
+
+
+def run_child(messages):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    result = {}
+    import main
+    result["import_main_ms"] = since_start()
+
+    from PyQt6.QtCore import QElapsedTimer, QEvent, QEventLoop, QObject
+    from PyQt6.QtWidgets import QApplication
+
+    class PaintWatcher(QObject):
+        def __init__(self):
+            super().__init__()
+            self.window = None
+            self.painted = set()
+
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Type.Paint:
+                if obj is login and "login" not in self.painted:
+                    self.painted.add("login")
+                    result["login_painted_ms"] = since_start()
+                email_list = getattr(self.window, "email_list", None)
+                if email_list is not None and obj is email_list.viewport() \
+                        and email_list.count() and "inbox" not in self.painted:
+                    self.painted.add("inbox")
+                    result["inbox_rows_painted_ms"] = since_start()
+            return False
+
+    def wait_for(name, timeout_ms=20000):
+        clock = QElapsedTimer()
+        clock.start()
+        while name not in watcher.painted:
+            if clock.elapsed() > timeout_ms:
+                raise TimeoutError(f"No {name} paint")
+            QApplication.processEvents(QEventLoop.ProcessEventsFlag.AllEvents, 5)
+
+    app = QApplication(sys.argv[:1])
+    watcher = PaintWatcher()
+    app.installEventFilter(watcher)
+
+    login = main.LoginWindow()
+    login.show()
+    wait_for("login")
+
+    opened = time.perf_counter()
+    from email_window import EmailWindow
+    from synthetic_mail import generate_records
+    window = EmailWindow("bench@local.test")
+    watcher.window = window
+    window.resize(1000, 700)
+    window.show()
+    window.handle_emails_fetched(generate_records(messages))
+    wait_for("inbox")
+    result["inbox_open_to_rows_ms"] = round((time.perf_counter() - opened) * 1000, 3)
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to time")
+    parser.add_argument("--messages", type=int, default=50,
+                        help="messages in the synthetic inbox")
+    parser.add_argument("--repo", default=HERE,
+                        help="checkout to import main and email_window from")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        sys.path.insert(0, os.path.abspath(args.repo))
+        os.chdir(args.repo)
+        print(json.dumps(run_child(args.messages)))
+        return 0
+
+    # Not imported at the top: the child must not preload the mail modules
+    from benchmark_email import percentile
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child",
+             "--repo", args.repo, "--messages", str(args.messages)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    summary = {
+        metric: {
+            "p50": round(percentile([run[metric] for run in runs], 0.50), 3),
+            "max": round(max(run[metric] for run in runs), 3),
+        }
+        for metric in METRICS
+    }
+    text = json.dumps({"repo": os.path.abspath(args.repo), "runs": len(runs),
+                       "summary": summary}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""
+Two-tier cache for decoded message bodies.
+
+Recently used bodies stay in an in-memory LRU bounded by bytes. Anything
+evicted from memory (and everything put) is also kept on disk as a
+compressed blob, so reopening an older message costs a file read instead
+of a download. The disk tier is bounded too and evicts least recently
+written blobs first.
+
+Blobs are compressed with zstd when the ``zstandard`` package is installed
+and with zlib otherwise.
+"""
+
+import hashlib
+import os
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from logging_config import get_logger
+
+logger = get_logger("body_cache")
+
+CACHE_DIR = os.environ.get(
+    "MAIL_BUDDY_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+)
+
+_ZSTD_SUFFIX = ".zst"
+_ZLIB_SUFFIX = ".zz"
+
+
+def body_key(record: Dict) -> str:
+    """Cache key for a header-sync record: folder, UIDVALIDITY and UID."""
+    return f"{record.get('folder', 'INBOX')}/{record.get('uidvalidity', 0)}/{record['uid']}"
+
+
+class BodyCache:
+    def __init__(self, directory: Optional[str] = None,
+                 memory_bytes: int = 8 * 1024 * 1024,
+                 disk_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory or os.path.join(CACHE_DIR, "bodies")
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.lock = threading.Lock()
+
+        self.memory: "OrderedDict[str, str]" = OrderedDict()
+        self.memory_used = 0
+        # Blob name -> size on disk, oldest first
+        self.disk: "OrderedDict[str, int]" = OrderedDict()
+        self.disk_used = 0
+        self.counters = dict.fromkeys(
+            ("memory_hits", "disk_hits", "misses", "memory_evictions", "disk_evictions"), 0
+        )
+
+        if zstandard is not None:
+            self.suffix = _ZSTD_SUFFIX
+            self._compressor = zstandard.ZstdCompressor(level=3)
+            self._decompressor = zstandard.ZstdDecompressor()
+        else:
+            self.suffix = _ZLIB_SUFFIX
+        self._load_index()
+
+    @classmethod
+    def for_account(cls, email_address: str, **limits) -> "BodyCache":
+        """Cache in a per-account directory under CACHE_DIR."""
+        account = hashlib.sha1(email_address.lower().encode("utf-8")).hexdigest()[:16]
+        return cls(os.path.join(CACHE_DIR, "bodies", account), **limits)
+
+    @staticmethod
+    def _size(text: str) -> int:
+        return sys.getsizeof(text)
+
+    def _blob_name(self, key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest() + self.suffix
+
+    def _load_index(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(self.suffix):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name, stat.st_size))
+        except OSError as e:
+            logger.warning("Body cache directory unavailable: %s", e)
+            return
+        for _, name, size in sorted(entries):
+            self.disk[name] = size
+            self.disk_used += size
+
+    def __contains__(self, key: str) -> bool:
+        with self.lock:
+            return key in self.memory or self._blob_name(key) in self.disk
+
+    def peek(self, key: str) -> Optional[str]:
+        """Return a body only if it is in memory, without touching stats or order."""
+        with self.lock:
+            return self.memory.get(key)
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            text = self.memory.get(key)
+            if text is not None:
+                self.memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return text
+            name = self._blob_name(key)
+            if name not in self.disk:
+                self.counters["misses"] += 1
+                return None
+
+        text = self._read_blob(name)
+        with self.lock:
+            if text is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["disk_hits"] += 1
+            self._remember(key, text)
+            return text
+
+    def put(self, key: str, text: str):
+        if text is None:
+            return
+        name = self._blob_name(key)
+        with self.lock:
+            self._remember(key, text)
+            on_disk = name in self.disk
+        if not on_disk:
+            self._write_blob(name, text)
+
+    def discard(self, key: str):
+        name = self._blob_name(key)
+        with self.lock:
+            text = self.memory.pop(key, None)
+            if text is not None:
+                self.memory_used -= self._size(text)
+            size = self.disk.pop(name, None)
+            if size is not None:
+                self.disk_used -= size
+        if size is not None:
+            self._remove_blob(name)
+
+    def clear(self):
+        with self.lock:
+            names = list(self.disk)
+            self.memory.clear()
+            self.disk.clear()
+            self.memory_used = 0
+            self.disk_used = 0
+        for name in names:
+            self._remove_blob(name)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            stats = dict(self.counters)
+            stats.update(
+                memory_entries=len(self.memory),
+                memory_bytes=self.memory_used,
+                disk_entries=len(self.disk),
+                disk_bytes=self.disk_used,
+                codec="zstd" if self.suffix == _ZSTD_SUFFIX else "zlib",
+            )
+        return stats
+
+    # Memory tier (callers hold the lock)
+
+    def _remember(self, key: str, text: str):
+        previous = self.memory.pop(key, None)
+        if previous is not None:
+            self.memory_used -= self._size(previous)
+        size = self._size(text)
+        if size > self.memory_bytes:
+            return
+        self.memory[key] = text
+        self.memory_used += size
+        while self.memory_used > self.memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_used -= self._size(evicted)
+            self.counters["memory_evictions"] += 1
+
+    # Disk tier
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.suffix == _ZSTD_SUFFIX:
+            return self._compressor.compress(data)
+        return zlib.compress(data, 6)
+
+    def _decompress(self, data: bytes) -> bytes:
+        if self.suffix == _ZSTD_SUFFIX:
+            return self._decompressor.decompress(data)
+        return zlib.decompress(data)
+
+    def _read_blob(self, name: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                return self._decompress(f.read()).decode("utf-8")
+        except (OSError, ValueError, zlib.error) as e:
+            logger.debug("Dropping unreadable cache blob %s: %s", name, e)
+            with self.lock:
+                size = self.disk.pop(name, None)
+                if size is not None:
+                    self.disk_used -= size
+            return None
+
+    def _write_blob(self, name: str, text: str):
+        blob = self._compress(text.encode("utf-8"))
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path + ".tmp", "wb") as f:
+                f.write(blob)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning("Could not write cache blob: %s", e)
+            return
+
+        evicted = []
+        with self.lock:
+            self.disk[name] = len(blob)
+            self.disk_used += len(blob)
+            while self.disk_used > self.disk_bytes and len(self.disk) > 1:
+                old, size = self.disk.popitem(last=False)
+                self.disk_used -= size
+                self.counters["disk_evictions"] += 1
+                evicted.append(old)
+        for old in evicted:
+            self._remove_blob(old)
+
+    def _remove_blob(self, name: str):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
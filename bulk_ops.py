@@ -0,0 +1,191 @@
+"""
+Bulk moves and deletes, such as "archive everything from this sender" or
+"delete all mail older than a year".
+
+A BulkJob names its messages by UID, from the window's local indexes, and
+optionally by SEARCH criteria. The criteria also reach mail the window has
+not loaded yet. BulkWorker runs the job on its own IMAP connection. It does
+one UID SEARCH, then moves the messages in range-compressed chunks of at
+most ``chunk_size`` messages. It uses UID MOVE, or COPY + STORE \\Deleted +
+UID EXPUNGE where the server has no MOVE. After each chunk it reports the
+UIDs that left the folder, and the window drops exactly those rows, so the
+local view stays in step with the server. Cancelling stops after the chunk
+in flight.
+"""
+
+import socket
+import threading
+from typing import NamedTuple, Optional, Tuple
+
+from PyQt6.QtCore import Qt, QObject, QThread, pyqtSignal, pyqtSlot
+
+from email_handler import EmailHandler, is_connection_error
+from logging_config import get_logger
+
+logger = get_logger("bulk_ops")
+
+# Messages per UID MOVE
+DEFAULT_CHUNK_SIZE = 500
+
+ACTIONS = ("archive", "delete", "move")
+
+# Stopped threads that were still busy, with their workers, kept until they
+# finish: a QThread destroyed while running aborts the process
+_stopping = set()
+
+
+def _release(thread: QThread, worker: "BulkWorker"):
+    thread.wait()
+    _stopping.discard((thread, worker))
+
+
+def resolve_target(handler: EmailHandler, action: str, folder: str,
+                   target: Optional[str] = None) -> Optional[str]:
+    """Folder an action sends messages to; None deletes them outright."""
+    if action == "move":
+        return target
+    folders = handler.special_folders()
+    if action == "archive":
+        archive = folders.get("\\Archive")
+        if archive is None:
+            raise RuntimeError("the server has no archive folder")
+        return archive
+    # Delete to the trash, or for good when already there or there is none
+    trash = folders.get("\\Trash")
+    return trash if trash and trash != folder else None
+
+
+class BulkJob(NamedTuple):
+    """Messages to act on, and what to do with them"""
+    action: str
+    uids: Tuple[int, ...] = ()
+    # SEARCH criteria for messages not loaded locally, e.g. ("FROM", '"a@b.c"')
+    criteria: Tuple[str, ...] = ()
+    # Target folder of a "move"
+    target: Optional[str] = None
+
+
+class BulkWorker(QObject):
+    """Runs bulk jobs on its own IMAP connection in a background thread"""
+
+    requested = pyqtSignal(object)
+    # UIDs moved by one chunk, messages done so far, total
+    progress = pyqtSignal(list, int, int)
+    # Messages done; empty error on success; whether the server was unreachable
+    finished = pyqtSignal(int, str, bool)
+
+    def __init__(self, base_handler: EmailHandler, folder: str,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__()
+        self.base_handler = base_handler
+        self.folder = folder
+        self.chunk_size = chunk_size
+        self.handler = None
+        self.cancel_event = threading.Event()
+        self.requested.connect(self.run)
+
+    @pyqtSlot(object)
+    def run(self, job: BulkJob):
+        done = 0
+        try:
+            if self.handler is None:
+                # Connect lazily, inside the worker thread
+                self.handler = self.base_handler.clone_imap()
+            target = resolve_target(self.handler, job.action, self.folder, job.target)
+            uids = set(job.uids)
+            if job.criteria:
+                uids.update(self.handler.search_uids(job.criteria, self.folder))
+            uids = sorted(uids)
+            for start in range(0, len(uids), self.chunk_size):
+                if self.cancel_event.is_set():
+                    self.finished.emit(done, "cancelled", False)
+                    return
+                chunk = uids[start:start + self.chunk_size]
+                self.handler.move_messages(chunk, target, self.folder)
+                done += len(chunk)
+                self.progress.emit(chunk, done, len(uids))
+            self.finished.emit(done, "", False)
+        except Exception as e:
+            logger.warning("Bulk %s stopped after %s messages: %s", job.action, done, e)
+            # Reconnect on the next job
+            self.close()
+            self.finished.emit(done, str(e), is_connection_error(e))
+
+    def close(self):
+        if self.handler:
+            self.handler.disconnect()
+            self.handler = None
+
+    def interrupt(self):
+        """Unblock a chunk waiting on the server; called from another thread."""
+        handler = self.handler
+        try:
+            handler.imap.sock.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):
+            pass
+
+
+class BulkOperations(QObject):
+    """Runs one bulk job at a time and relays its progress"""
+
+    progress = pyqtSignal(list, int, int)
+    finished = pyqtSignal(object, int, str, bool)
+
+    def __init__(self, handler: EmailHandler, folder: str = "INBOX",
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, parent=None):
+        super().__init__(parent)
+        self.job: Optional[BulkJob] = None
+
+        self.thread = QThread()
+        self.worker = BulkWorker(handler, folder, chunk_size)
+        self.worker.moveToThread(self.thread)
+        self.worker.progress.connect(self.progress)
+        self.worker.finished.connect(self.handle_finished)
+        self.thread.start()
+
+    @property
+    def busy(self) -> bool:
+        return self.job is not None
+
+    def start(self, job: BulkJob) -> bool:
+        """Run a job; False if another one is still running."""
+        if job.action not in ACTIONS:
+            raise ValueError(f"Unknown bulk action {job.action!r}")
+        if self.busy or self.worker is None:
+            return False
+        self.job = job
+        self.worker.cancel_event.clear()
+        self.worker.requested.emit(job)
+        return True
+
+    def cancel(self):
+        """Stop the running job once the chunk in flight is done."""
+        if self.worker is not None:
+            self.worker.cancel_event.set()
+
+    def handle_finished(self, done: int, error: str, offline: bool):
+        job, self.job = self.job, None
+        self.finished.emit(job, done, error, offline)
+
+    def stop(self):
+        """Cancel any running job and close the connection, without waiting.
+
+        A chunk in flight is interrupted; the server may or may not have
+        moved it, which the next sync shows. The thread is kept until it
+        finishes and logs out.
+        """
+        if self.worker is None:
+            return
+        self.cancel()
+        thread, worker = self.thread, self.worker
+        worker.progress.disconnect(self.progress)
+        worker.finished.disconnect(self.handle_finished)
+        # Log out in the worker's thread once it is done
+        thread.finished.connect(worker.close, Qt.ConnectionType.DirectConnection)
+        _stopping.add((thread, worker))
+        thread.finished.connect(lambda: _release(thread, worker))
+        thread.quit()
+        if self.busy:
+            worker.interrupt()
+            self.job = None
+        self.worker = None
@@ -4,9 +4,12 @@ from PyQt6.QtCore import Qt
 
 
 class ComposeDialog(QDialog):
-    def __init__(self, email_handler, parent=None):
+    def __init__(self, email_handler, parent=None, outbox=None):
         super().__init__(parent)
         self.email_handler = email_handler
+        # Queues a message to be sent in the background, if given
+        self.outbox = outbox
+        self.setObjectName("compose_dialog")
         self.setWindowTitle("Compose Email")
         self.setMinimumSize(600, 500)
         
@@ -55,47 +58,6 @@ class ComposeDialog(QDialog):
         self.send_button.clicked.connect(self.send_email)
         self.cancel_button.clicked.connect(self.reject)
         
-        # Apply styling
-        self.setStyleSheet("""
-            QDialog {
-                background-color: #f5f5f5;
-            }
-            QLineEdit, QTextEdit {
-                background-color: white;
-                border: 1px solid #ddd;
-                border-radius: 4px;
-                padding: 8px;
-                font-size: 13px;
-            }
-            QLineEdit:focus, QTextEdit:focus {
-                border: 1px solid #0078d4;
-            }
-            QLabel {
-                color: #444;
-                font-size: 13px;
-            }
-            QPushButton {
-                padding: 8px;
-                border-radius: 4px;
-                font-weight: bold;
-            }
-            QPushButton#send_button {
-                background-color: #0078d4;
-                color: white;
-                border: none;
-            }
-            QPushButton#send_button:hover {
-                background-color: #106ebe;
-            }
-            QPushButton#cancel_button {
-                background-color: #f0f0f0;
-                border: 1px solid #ddd;
-            }
-            QPushButton#cancel_button:hover {
-                background-color: #e5e5e5;
-            }
-        """)
-        
         # Set object names for styling
         self.send_button.setObjectName("send_button")
         self.cancel_button.setObjectName("cancel_button")
@@ -113,7 +75,10 @@ class ComposeDialog(QDialog):
             )
             return
         
-        if self.email_handler.send_email(to_addr, subject, body):
+        if self.outbox is not None:
+            self.outbox(to_addr, subject, body)
+            self.accept()
+        elif self.email_handler.send_email(to_addr, subject, body):
             self.accept()
         else:
             QMessageBox.warning(
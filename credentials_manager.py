@@ -2,6 +2,10 @@ import json
 import os
 from base64 import b64encode, b64decode
 
+from logging_config import get_logger
+
+logger = get_logger("credentials_manager")
+
 class CredentialsManager:
     def __init__(self):
         self.credentials_file = os.path.join(
@@ -25,7 +29,7 @@ class CredentialsManager:
                 # If not remembering, delete any existing credentials
                 os.remove(self.credentials_file)
         except Exception as e:
-            print(f"Failed to save credentials: {str(e)}")
+            logger.error("Failed to save credentials: %s", e)
     
     def load_credentials(self):
         """Load saved credentials if they exist"""
@@ -36,7 +40,7 @@ class CredentialsManager:
                     password = b64decode(data["password"].encode()).decode()
                     return data["email"], password
         except Exception as e:
-            print(f"Failed to load credentials: {str(e)}")
+            logger.error("Failed to load credentials: %s", e)
             if os.path.exists(self.credentials_file):
                 os.remove(self.credentials_file)
         return None, None
@@ -47,4 +51,4 @@ class CredentialsManager:
             if os.path.exists(self.credentials_file):
                 os.remove(self.credentials_file)
         except Exception as e:
-            print(f"Failed to clear credentials: {str(e)}") 
\ No newline at end of file
+            logger.error("Failed to clear credentials: %s", e)
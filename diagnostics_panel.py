@@ -0,0 +1,141 @@
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
+                            QTableWidget, QTableWidgetItem, QCheckBox,
+                            QPushButton, QHeaderView)
+from PyQt6.QtCore import Qt, QTimer
+
+import instrumentation
+import logging_config
+
+
+class DiagnosticsPanel(QDialog):
+    """Live view of per-phase latencies and traffic for recent refreshes"""
+
+    COLUMNS = ["Phase", "Count", "Last (ms)", "p50 (ms)", "p99 (ms)", "Total (ms)"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setObjectName("diagnostics_panel")
+        self.setWindowTitle("Diagnostics")
+        self.setMinimumSize(560, 420)
+        self.setup_ui()
+
+        # Only poll the recorder while the panel is open
+        self.update_timer = QTimer(self)
+        self.update_timer.setInterval(1000)
+        self.update_timer.timeout.connect(self.update_view)
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+        layout.setSpacing(10)
+        layout.setContentsMargins(15, 15, 15, 15)
+
+        self.enabled_checkbox = QCheckBox("Record timings")
+        self.enabled_checkbox.setChecked(instrumentation.is_enabled())
+        self.enabled_checkbox.toggled.connect(instrumentation.set_enabled)
+
+        self.debug_log_checkbox = QCheckBox("Debug logging")
+        self.debug_log_checkbox.setChecked(logging_config.debug_enabled())
+        self.debug_log_checkbox.toggled.connect(self.toggle_debug_logging)
+
+        self.refresh_label = QLabel("No refresh recorded yet")
+        self.refresh_label.setWordWrap(True)
+
+        self.sources_label = QLabel("")
+        self.sources_label.setWordWrap(True)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(
+            QHeaderView.ResizeMode.Stretch
+        )
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(self.reset)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.accept)
+        button_layout.addWidget(reset_button)
+        button_layout.addWidget(close_button)
+
+        layout.addWidget(self.enabled_checkbox)
+        layout.addWidget(self.debug_log_checkbox)
+        layout.addWidget(self.refresh_label)
+        layout.addWidget(self.sources_label)
+        layout.addWidget(self.table)
+        layout.addLayout(button_layout)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_view()
+        self.update_timer.start()
+
+    def hideEvent(self, event):
+        self.update_timer.stop()
+        super().hideEvent(event)
+
+    def toggle_debug_logging(self, enabled):
+        logging_config.set_level("DEBUG" if enabled else logging_config.DEFAULT_LEVEL)
+
+    def reset(self):
+        instrumentation.recorder.reset()
+        self.update_view()
+
+    def update_view(self):
+        """Redraw the table from the recorder's current statistics"""
+        stats = instrumentation.recorder.phase_stats()
+        # Known phases first in pipeline order, then anything else recorded
+        names = [p for p in instrumentation.PHASES if p in stats]
+        names += sorted(n for n in stats if n not in instrumentation.PHASES)
+
+        self.table.setRowCount(len(names))
+        for row, name in enumerate(names):
+            phase = stats[name]
+            values = [
+                name,
+                str(phase["count"]),
+                f"{phase['last_ms']:.2f}",
+                f"{phase['p50_ms']:.2f}",
+                f"{phase['p99_ms']:.2f}",
+                f"{phase['total_ms']:.1f}",
+            ]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column:
+                    item.setTextAlignment(
+                        Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+                    )
+                self.table.setItem(row, column, item)
+
+        lines = []
+        milestones = dict(instrumentation.recorder.milestones)
+        if milestones:
+            lines.append("Startup: " + ", ".join(
+                f"{name.replace('_', ' ')} {ms:.0f} ms" for name, ms in milestones.items()
+            ))
+        for name, values in instrumentation.source_stats().items():
+            parts = [
+                f"{key.replace('_', ' ')} {value:,}" if isinstance(value, int)
+                else f"{key.replace('_', ' ')} {value}"
+                for key, value in values.items()
+            ]
+            lines.append(f"{name}: " + ", ".join(parts))
+        self.sources_label.setText("\n".join(lines))
+
+        refresh = instrumentation.recorder.last_refresh()
+        if refresh:
+            counters = refresh["counters"]
+            text = (
+                f"Last refresh: {refresh['duration_ms']:.0f} ms, "
+                f"{counters.get('bytes_received', 0):,} bytes received, "
+                f"{counters.get('bytes_sent', 0):,} bytes sent, "
+                f"{counters.get('round_trips', 0)} round trips"
+            )
+            ratio = refresh.get("compression_ratio")
+            if ratio and ratio > 1:
+                text += f", compressed {ratio:.1f}:1"
+            self.refresh_label.setText(text)
+        elif not instrumentation.is_enabled():
+            self.refresh_label.setText("Timing is off. Enable it to record refreshes.")
@@ -1,19 +1,226 @@
 import imaplib
+import io
 import smtplib
 import email
+import zlib
+from bisect import bisect_left
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence, Tuple
+
+import header_decoder
+import instrumentation
+import mime_decoder
+import snippets
+from imap_parser import iter_imaplib_responses, parse_data, parse_fetch, quote, sequence_set
+from logging_config import get_logger
+from provider_profiles import ProviderProfile, ProviderProfileManager
+from rules_engine import RuleSet
+
+logger = get_logger("email_handler")
+
+# Headers fetched by header-only sync
+HEADER_FIELDS = ("SUBJECT", "FROM", "TO", "DATE")
+
+# UIDs per UID STORE, keeping command lines short even when the UIDs
+# don't compress into ranges
+STORE_BATCH_SIZE = 1000
+
+# Folders tried, in order, for a special use the server doesn't mark
+# with a RFC 6154 attribute
+SPECIAL_FOLDER_NAMES = {
+    "\\Archive": ("Archive", "Archives", "[Gmail]/All Mail"),
+    "\\Trash": ("Trash", "Deleted Items", "Deleted Messages", "[Gmail]/Trash"),
+    "\\Sent": ("Sent", "Sent Items", "Sent Messages", "[Gmail]/Sent Mail"),
+}
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """Whether error means the server couldn't be reached, as opposed to
+    it refusing a command. SMTP refusals are OSErrors too, so are excluded."""
+    if isinstance(error, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+        return isinstance(error, smtplib.SMTPConnectError)
+    return isinstance(error, (OSError, EOFError, imaplib.IMAP4.abort))
+
+
+class _InflatingReader(io.RawIOBase):
+    """Raw stream that inflates a COMPRESS=DEFLATE response stream"""
+    
+    def __init__(self, raw):
+        self.raw = raw
+        self.inflater = zlib.decompressobj(-15)
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        while True:
+            if self.inflater.unconsumed_tail:
+                data = self.inflater.decompress(self.inflater.unconsumed_tail, len(buffer))
+            else:
+                chunk = self.raw.read1(65536)
+                if not chunk:
+                    return 0
+                instrumentation.count("bytes_received", len(chunk))
+                data = self.inflater.decompress(chunk, len(buffer))
+            if data:
+                buffer[:len(data)] = data
+                return len(data)
+    
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+class _InstrumentedIMAPMixin:
+    """Reports bytes and round trips of an imaplib connection
+    
+    bytes_* count what crosses the network, payload_bytes_* the protocol
+    data; they only differ once compress() has enabled COMPRESS=DEFLATE.
+    """
+    
+    _awaiting_response = False
+    _deflater = None
+    
+    def send(self, data):
+        payload = len(data)
+        if self._deflater is not None:
+            data = self._deflater.compress(data) + self._deflater.flush(zlib.Z_SYNC_FLUSH)
+        super().send(data)
+        instrumentation.count("bytes_sent", len(data))
+        instrumentation.count("payload_bytes_sent", payload)
+        self._awaiting_response = True
+    
+    def read(self, size):
+        data = super().read(size)
+        self._count_received(len(data))
+        return data
+    
+    def readline(self):
+        line = super().readline()
+        if self._awaiting_response:
+            # First response line after a command went out
+            self._awaiting_response = False
+            instrumentation.count("round_trips")
+        self._count_received(len(line))
+        return line
+    
+    def _count_received(self, size):
+        instrumentation.count("payload_bytes_received", size)
+        if self._deflater is None:
+            instrumentation.count("bytes_received", size)
+    
+    def compress(self) -> bool:
+        """Negotiate COMPRESS=DEFLATE (RFC 4978); returns True when active."""
+        if self._deflater is not None:
+            return True
+        if "COMPRESS=DEFLATE" not in self.capabilities:
+            return False
+        typ, _ = self.xatom("COMPRESS", "DEFLATE")
+        if typ != "OK":
+            return False
+        self._deflater = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self.file = io.BufferedReader(_InflatingReader(self.file))
+        return True
+
+
+class InstrumentedIMAP4(_InstrumentedIMAPMixin, imaplib.IMAP4):
+    pass
+
+
+class InstrumentedIMAP4_SSL(_InstrumentedIMAPMixin, imaplib.IMAP4_SSL):
+    pass
+
+
+def message_to_record(msg_id: str, raw_message: bytes) -> Dict:
+    """Parse a raw RFC 822 message into the dict shape used by the UI."""
+    with instrumentation.span("mime_parse"):
+        email_message = email.message_from_bytes(raw_message)
+        
+        # Extract email details, decoding encoded words once here
+        subject = header_decoder.decode_value(email_message["subject"])
+        sender = header_decoder.sender_fields(email_message["from"])
+        date = email_message["date"]
+        
+        # Get email content
+        content = ""
+        if email_message.is_multipart():
+            for part in email_message.walk():
+                if part.get_content_type() == "text/plain":
+                    content = part.get_payload(decode=True).decode()
+                    break
+        else:
+            content = email_message.get_payload(decode=True).decode()
+    
+    return {
+        "id": msg_id,
+        "subject": subject,
+        **sender,
+        "date": date,
+        "content": content,
+        "snippet": snippets.clean_text(content[:snippets.SNIPPET_BYTES])
+    }
+
+
+def headers_to_record(uid: int, header_bytes: bytes, flags, size: int,
+                      folder: str = "INBOX", uidvalidity: int = 0,
+                      rule_headers: Sequence[str] = ()) -> Dict:
+    """Build a list record from a header-only fetch; the body comes later.
+    
+    rule_headers names extra fetched headers that rules test for; the ones
+    present are listed under "headers".
+    """
+    with instrumentation.span("mime_parse"):
+        headers = email.message_from_bytes(header_bytes)
+    record = {
+        "id": str(uid),
+        "uid": uid,
+        "subject": header_decoder.decode_value(headers["subject"]),
+        **header_decoder.sender_fields(headers["from"]),
+        "date": headers["date"],
+        "content": "",
+        "flags": list(flags),
+        "size": size,
+        "folder": folder,
+        "uidvalidity": uidvalidity,
+    }
+    if headers["to"]:
+        record["to"] = header_decoder.decode_value(headers["to"])
+    present = tuple(name for name in rule_headers if headers[name] is not None)
+    if present:
+        record["headers"] = present
+    return record
 
 
 class EmailHandler:
-    def __init__(self, email_address: str, password: str):
+    def __init__(self, email_address: str, password: str,
+                 profile: Optional[ProviderProfile] = None,
+                 pipelining: bool = True, compression: bool = True,
+                 rules: Optional[RuleSet] = None):
         self.email_address = email_address
         self.password = password
-        self.imap_server = "imap.gmail.com"  # Default to Gmail
-        self.smtp_server = "smtp.gmail.com"
-        self.imap_port = 993
-        self.smtp_port = 587
+        if profile is None:
+            profile = ProviderProfileManager().profile_for_address(email_address)
+        self.profile = profile
+        self.imap_server = profile.imap.host
+        self.smtp_server = profile.smtp.host
+        self.imap_port = profile.imap.port
+        self.smtp_port = profile.smtp.port
+        self.capabilities = set(profile.capabilities)
+        # Send independent IMAP commands back-to-back instead of one per round trip
+        self.pipelining = pipelining
+        self.uidvalidity = 0
+        # Negotiate COMPRESS=DEFLATE when the server offers it
+        self.compression = compression
+        self.selected_folder = None
+        # Folder -> (UIDVALIDITY, sorted UIDs) from the last UID SEARCH ALL
+        self.uid_index: Dict[str, Tuple[int, List[int]]] = {}
+        # Special use (\\Archive, \\Trash, ...) -> folder name, from LIST
+        self._special_folders: Optional[Dict[str, str]] = None
+        # Local rules run over each header sync
+        self.rules = rules if rules is not None else RuleSet.load(email_address=email_address)
+        # The last attempt to reach the server failed; the next one reconnects
+        self.offline = False
         
         self.imap = None
         self.smtp = None
@@ -21,22 +228,193 @@ class EmailHandler:
     def connect(self) -> bool:
         """Connect to both IMAP and SMTP servers."""
         try:
-            # Connect to IMAP
-            self.imap = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
-            self.imap.login(self.email_address, self.password)
-            
-            # Connect to SMTP
-            self.smtp = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            self.smtp.starttls()
-            self.smtp.login(self.email_address, self.password)
-            
+            with instrumentation.span("connect"):
+                self.imap = self.connect_imap()
+                self.smtp = self.connect_smtp()
             return True
         except Exception as e:
-            print(f"Connection error: {str(e)}")
+            logger.error("Connection error: %s", e)
             return False
     
+    def connect_imap(self) -> imaplib.IMAP4:
+        """Open and authenticate an IMAP session using the profile settings."""
+        settings = self.profile.imap
+        if settings.tls == "ssl":
+            imap = InstrumentedIMAP4_SSL(settings.host, settings.port)
+        else:
+            imap = InstrumentedIMAP4(settings.host, settings.port)
+            if settings.tls == "starttls":
+                imap.starttls()
+        
+        username = settings.resolve_username(self.email_address)
+        if settings.auth == "password":
+            imap.login(username, self.password)
+        elif settings.auth == "plain":
+            credentials = f"\0{username}\0{self.password}".encode()
+            imap.authenticate("PLAIN", lambda _: credentials)
+        elif settings.auth == "cram-md5":
+            imap.login_cram_md5(username, self.password)
+        
+        # Servers often advertise more once authenticated
+        typ, data = imap.capability()
+        if typ == "OK" and data and data[-1]:
+            imap.capabilities = tuple(data[-1].decode().upper().split())
+        
+        # The live capability list replaces the profile's hints
+        self.capabilities = {cap.upper() for cap in imap.capabilities}
+        if self.compression and imap.compress():
+            logger.debug("IMAP compression enabled")
+        return imap
+    
+    def connect_smtp(self) -> smtplib.SMTP:
+        """Open and authenticate an SMTP session using the profile settings."""
+        settings = self.profile.smtp
+        if settings.tls == "ssl":
+            smtp = smtplib.SMTP_SSL(settings.host, settings.port)
+        else:
+            smtp = smtplib.SMTP(settings.host, settings.port)
+            if settings.tls == "starttls":
+                smtp.starttls()
+        
+        if settings.auth != "none":
+            # smtplib picks the strongest mechanism the server offers
+            smtp.login(settings.resolve_username(self.email_address), self.password)
+        return smtp
+    
+    def clone_imap(self) -> "EmailHandler":
+        """Open a second IMAP session for the same account (no SMTP)."""
+        handler = EmailHandler(self.email_address, self.password, self.profile,
+                               pipelining=self.pipelining, compression=self.compression,
+                               rules=self.rules.copy())
+        handler.imap = handler.connect_imap()
+        return handler
+    
+    def reconnect_imap(self):
+        """Replace a dropped IMAP session with a fresh one; raises if the server is still away."""
+        self.selected_folder = None
+        if self.imap:
+            try:
+                self.imap.shutdown()
+            except Exception:
+                pass
+            self.imap = None
+        with instrumentation.span("connect"):
+            self.imap = self.connect_imap()
+        self.offline = False
+    
+    def has_capability(self, name: str) -> bool:
+        return name.upper() in self.capabilities
+    
+    def pipeline(self, commands: Sequence[Tuple]) -> List[Tuple[str, Dict[str, list]]]:
+        """Send IMAP commands back-to-back, then read each tagged reply.
+        
+        Each command is a tuple like ("STATUS", mailbox, "(MESSAGES)").
+        Returns (status, untagged responses) per command, in order. The
+        server answers in order, so untagged data read before a tag
+        completes belongs to that tag. Commands must not depend on each
+        other's results or carry literals.
+        """
+        imap = self.imap
+        # Queue the commands and write them together so they share packets
+        chunks = []
+        imap.send = chunks.append
+        try:
+            tags = [imap._command(*command) for command in commands]
+        finally:
+            del imap.send
+        imap.send(b"".join(chunks))
+        results = []
+        for command, tag in zip(commands, tags):
+            imap.untagged_responses = {}
+            try:
+                typ, _ = imap._command_complete(command[0], tag)
+            except imap.abort:
+                raise
+            except imap.error as e:
+                # BAD for one command; keep reading the others' replies
+                logger.warning("Pipelined %s failed: %s", command[0], e)
+                typ = "BAD"
+            results.append((typ, imap.untagged_responses))
+        imap.untagged_responses = {}
+        return results
+    
+    def select_folder(self, folder: str):
+        """SELECT a folder, skipping the round trip if it is already selected."""
+        if self.pipelining and folder == self.selected_folder:
+            return
+        typ, data = self.imap.select(quote(folder))
+        if typ != "OK":
+            self.selected_folder = None
+            raise imaplib.IMAP4.error(f"SELECT {folder} failed: {data}")
+        self.selected_folder = folder
+        _, validity = self.imap.response("UIDVALIDITY")
+        self.uidvalidity = int(validity[-1]) if validity and validity[-1] else 0
+    
+    def folder_status(self, folders: Sequence[str],
+                      items: str = "(MESSAGES UNSEEN UIDNEXT)") -> Dict[str, Dict]:
+        """STATUS for several folders, pipelined into one round trip."""
+        if not self.imap:
+            return {}
+        
+        try:
+            with instrumentation.span("status"):
+                if self.pipelining:
+                    replies = self.pipeline([("STATUS", quote(f), items) for f in folders])
+                    responses = [untagged.get("STATUS", []) for _, untagged in replies]
+                else:
+                    responses = [self.imap.status(quote(f), items)[1] for f in folders]
+            
+            statuses = {}
+            for folder, parts in zip(folders, responses):
+                for data, literals in iter_imaplib_responses(parts):
+                    tokens = parse_data(data, literals)
+                    if len(tokens) < 2 or not isinstance(tokens[-1], list):
+                        continue
+                    # Prefer the mailbox name the server echoed back
+                    name = tokens[0]
+                    if isinstance(name, bytes):
+                        name = name.decode("utf-8", "replace")
+                    values = tokens[-1]
+                    statuses[name if name in folders else folder] = {
+                        values[i]: values[i + 1] for i in range(0, len(values) - 1, 2)
+                    }
+            return statuses
+        except Exception as e:
+            logger.error("Error reading folder status: %s", e)
+            return {}
+    
+    def special_folders(self) -> Dict[str, str]:
+        """Folders for each special use, e.g. {"\\Trash": "Deleted Items"}.
+        
+        Read once from LIST: RFC 6154 attributes where the server sets them,
+        otherwise the first folder with a well-known name.
+        """
+        if self._special_folders is None:
+            found: Dict[str, str] = {}
+            names: Dict[str, str] = {}
+            typ, data = self.imap.list()
+            for line, literals in iter_imaplib_responses(data if typ == "OK" and data else []):
+                tokens = parse_data(line, literals)
+                if len(tokens) < 3 or not isinstance(tokens[0], list):
+                    continue
+                name = tokens[2]
+                if isinstance(name, bytes):
+                    name = name.decode("utf-8", "replace")
+                names[name.lower()] = name
+                for attribute in tokens[0]:
+                    if isinstance(attribute, str) and attribute.title() in SPECIAL_FOLDER_NAMES:
+                        found.setdefault(attribute.title(), name)
+            for use, candidates in SPECIAL_FOLDER_NAMES.items():
+                if use not in found:
+                    match = next((names[c.lower()] for c in candidates if c.lower() in names), None)
+                    if match:
+                        found[use] = match
+            self._special_folders = found
+        return self._special_folders
+    
     def disconnect(self):
         """Disconnect from both servers."""
+        self.selected_folder = None
         if self.imap:
             try:
                 self.imap.logout()
@@ -49,65 +427,405 @@ class EmailHandler:
                 pass
     
     def get_emails(self, folder: str = "INBOX", limit: int = 10) -> List[Dict]:
-        """Fetch emails from specified folder."""
+        """Fetch emails from specified folder.
+        
+        Raises when the server can't be reached, so a dropped connection
+        isn't mistaken for an empty folder.
+        """
         if not self.imap:
             return []
         
         try:
-            self.imap.select(folder)
-            _, messages = self.imap.search(None, "ALL")
-            email_list = []
+            if self.offline:
+                self.reconnect_imap()
+            with instrumentation.span("select"):
+                self.select_folder(folder)
+            with instrumentation.span("search"):
+                _, messages = self.imap.search(None, "ALL")
             
-            # Get the last 'limit' number of emails
-            message_numbers = messages[0].split()
-            for num in message_numbers[-limit:]:
-                _, msg_data = self.imap.fetch(num, "(RFC822)")
-                email_body = msg_data[0][1]
-                email_message = email.message_from_bytes(email_body)
-                
-                # Extract email details
-                subject = email_message["subject"]
-                from_addr = email_message["from"]
-                date = email_message["date"]
-                
-                # Get email content
-                content = ""
-                if email_message.is_multipart():
-                    for part in email_message.walk():
-                        if part.get_content_type() == "text/plain":
-                            content = part.get_payload(decode=True).decode()
-                            break
+            # Get the last 'limit' number of emails, fetched in batches
+            # sized for the provider's throttling limits; PEEK leaves
+            # \Seen alone, so downloading is not reading
+            message_numbers = messages[0].split()[-limit:]
+            batch_size = self.profile.fetch_batch_size
+            batches = [
+                b",".join(message_numbers[start:start + batch_size])
+                for start in range(0, len(message_numbers), batch_size)
+            ]
+            with instrumentation.span("fetch"):
+                if self.pipelining and batches:
+                    replies = self.pipeline([("FETCH", batch, "(BODY.PEEK[])") for batch in batches])
+                    responses = [untagged.get("FETCH", []) for _, untagged in replies]
                 else:
-                    content = email_message.get_payload(decode=True).decode()
-                
-                email_list.append({
-                    "id": num.decode(),
-                    "subject": subject,
-                    "from": from_addr,
-                    "date": date,
-                    "content": content
-                })
+                    responses = [self.imap.fetch(batch, "(BODY.PEEK[])")[1] for batch in batches]
+            fetched = [
+                (part[0].split()[0].decode(), part[1])
+                for msg_data in responses for part in msg_data if isinstance(part, tuple)
+            ]
             
+            # Large batches are decoded across processes, off the GIL
+            return mime_decoder.decode_messages(fetched)
+        except Exception as e:
+            if is_connection_error(e):
+                self.offline = True
+                raise
+            logger.error("Error fetching emails: %s", e)
+            return []
+    
+    def get_headers(self, folder: str = "INBOX", limit: int = 10,
+                    before_uid: Optional[int] = None) -> List[Dict]:
+        """Fetch headers, flags and sizes of the newest messages, without bodies.
+        
+        With before_uid, fetch the newest messages older than that UID
+        instead, for paging back through history. Raises when the server
+        can't be reached.
+        """
+        if not self.imap:
+            return []
+        
+        try:
+            if self.offline:
+                self.reconnect_imap()
+            with instrumentation.span("select"):
+                self.select_folder(folder)
+            index = self.uid_index.get(folder)
+            if before_uid is None or index is None or index[0] != self.uidvalidity:
+                # Paging reuses the last search so each page costs one FETCH
+                with instrumentation.span("search"):
+                    _, data = self.imap.uid("SEARCH", "ALL")
+                found = sorted(int(uid) for uid in data[0].split()) if data and data[0] else []
+                index = self.uid_index[folder] = (self.uidvalidity, found)
+            uids = index[1]
+            if before_uid is not None:
+                uids = uids[:bisect_left(uids, before_uid)]
+            uids = [str(uid).encode() for uid in uids[-limit:]] if limit > 0 else []
+            
+            # The first bytes of part 1 give most messages their preview
+            # snippet in the same FETCH
+            rule_headers = self.rules.header_fields
+            fields = " ".join(HEADER_FIELDS + tuple(
+                name.upper() for name in rule_headers if name.upper() not in HEADER_FIELDS
+            ))
+            # MODSEQ lets offline changes be checked against later server edits
+            modseq = " MODSEQ" if self.has_capability("CONDSTORE") else ""
+            items = (f"(UID FLAGS{modseq} RFC822.SIZE BODYSTRUCTURE "
+                     f"BODY.PEEK[HEADER.FIELDS ({fields})] "
+                     f"BODY.PEEK[1]<0.{snippets.SNIPPET_BYTES}>)")
+            email_list = []
+            # Section -> records whose preview text is in a nested part
+            nested: Dict[str, List[Tuple[Dict, snippets.TextPart]]] = {}
+            for attributes in self._uid_fetch(uids, items):
+                header = next((value for key, value in attributes.items()
+                               if key.startswith("BODY[HEADER")), b"")
+                record = headers_to_record(
+                    attributes["UID"], header or b"",
+                    attributes.get("FLAGS") or [], attributes.get("RFC822.SIZE", 0),
+                    folder, self.uidvalidity, rule_headers
+                )
+                if attributes.get("MODSEQ"):
+                    record["modseq"] = attributes["MODSEQ"][0]
+                structure = attributes.get("BODYSTRUCTURE")
+                part = snippets.text_part(structure) if structure else None
+                if structure is None or (part is not None and part.section == "1"):
+                    record["snippet"] = snippets.make_snippet(
+                        attributes.get("BODY[1]<0>") or b"", part
+                    )
+                elif part is not None:
+                    nested.setdefault(part.section, []).append((record, part))
+                email_list.append(record)
+            for section, pending in nested.items():
+                self._fetch_snippets(section, pending)
+            if self.rules and uids:
+                # The page holds every message from its lowest UID up to
+                # before_uid (or the newest)
+                high = before_uid - 1 if before_uid is not None else int(uids[-1])
+                self.apply_rules(email_list, folder, int(uids[0]), high)
             return email_list
         except Exception as e:
-            print(f"Error fetching emails: {str(e)}")
+            if is_connection_error(e):
+                self.offline = True
+                raise
+            logger.error("Error fetching headers: %s", e)
             return []
     
+    def _fetch_snippets(self, section: str, pending: List[Tuple[Dict, snippets.TextPart]]):
+        """Fill in snippets of records whose text is in a nested part."""
+        by_uid = {record["uid"]: (record, part) for record, part in pending}
+        key = f"BODY[{section}]<0>"
+        items = f"(UID BODY.PEEK[{section}]<0.{snippets.SNIPPET_BYTES}>)"
+        for attributes in self._uid_fetch([str(uid).encode() for uid in by_uid], items):
+            record, part = by_uid.get(attributes["UID"], (None, None))
+            if record is not None:
+                record["snippet"] = snippets.make_snippet(attributes.get(key) or b"", part)
+    
+    def apply_rules(self, records: List[Dict], folder: str, low: int, high: int):
+        """Run the local rules over freshly synced records covering UIDs low..high.
+        
+        Labels and hiding are recorded on the records. Messages the rules
+        haven't acted on before get their flag changes and moves sent to
+        the server: one UID STORE for everything marked read and one UID
+        MOVE per target folder, pipelined together (see move_messages for
+        servers without MOVE). Moved records are hidden. Records whose
+        actions the server refused are left as they are and not recorded
+        as applied, so the next sync tries them again.
+        """
+        mark_read: List[Dict] = []
+        moves: Dict[str, List[Dict]] = {}
+        with instrumentation.span("rules"):
+            for record in records:
+                result = self.rules.match(record)
+                if result.labels:
+                    record["labels"] = list(result.labels)
+                if result.hide:
+                    record["hidden"] = True
+                if self.rules.applied(folder, record["uidvalidity"], record["uid"]):
+                    continue
+                if result.mark_read and "\\Seen" not in record["flags"]:
+                    mark_read.append(record)
+                if result.move and result.move != folder:
+                    moves.setdefault(result.move, []).append(record)
+        
+        commands = []
+        if mark_read:
+            commands.append(("UID", "STORE", sequence_set([record["uid"] for record in mark_read]),
+                             "+FLAGS.SILENT", "(\\Seen)"))
+        # Without MOVE each target takes a COPY first, so those go one by one
+        targets = list(moves)
+        pipelined_moves = self.has_capability("MOVE")
+        if pipelined_moves:
+            for target in targets:
+                uids = [record["uid"] for record in moves[target]]
+                commands.append(("UID", "MOVE", sequence_set(uids), quote(target)))
+        
+        statuses = []
+        try:
+            if self.pipelining and commands:
+                statuses = [typ for typ, _ in self.pipeline(commands)]
+            else:
+                statuses = [self.imap.uid(*command[1:])[0] for command in commands]
+        except Exception as e:
+            if is_connection_error(e):
+                # Nothing recorded as applied; the next sync tries again
+                raise
+            logger.error("Error applying rules: %s", e)
+            statuses = ["NO"] * len(commands)
+        # UIDs whose actions didn't go through; they are tried again
+        failed = set()
+        if mark_read and statuses[0] != "OK":
+            logger.warning("Rules could not mark %s messages read", len(mark_read))
+            failed.update(record["uid"] for record in mark_read)
+        elif mark_read:
+            # Shown read only once the server has them read
+            for record in mark_read:
+                record["flags"].append("\\Seen")
+        if pipelined_moves:
+            move_statuses = statuses[len(commands) - len(targets):]
+        else:
+            move_statuses = []
+            for target in targets:
+                try:
+                    self.move_messages([record["uid"] for record in moves[target]], target, folder)
+                    move_statuses.append("OK")
+                except Exception as e:
+                    if is_connection_error(e):
+                        raise
+                    logger.error("Error moving messages to %s: %s", target, e)
+                    move_statuses.append("NO")
+        
+        moved = set()
+        for target, status in zip(targets, move_statuses):
+            if status != "OK":
+                logger.warning("Rules could not move messages to %s", target)
+                failed.update(record["uid"] for record in moves[target])
+                continue
+            for record in moves[target]:
+                record["hidden"] = True
+                record["moved_to"] = target
+                moved.add(record["uid"])
+        # Moved messages are gone from the folder; keep paging consistent
+        index = self.uid_index.get(folder)
+        if moved and index is not None:
+            self.uid_index[folder] = (index[0], [uid for uid in index[1] if uid not in moved])
+        logger.debug("Rules marked %s read and moved %s", len(mark_read), len(moved))
+        self.rules.mark_applied(folder, self.uidvalidity, low, high, failed)
+    
+    def search_uids(self, criteria: Sequence[str], folder: str = "INBOX") -> List[int]:
+        """UIDs of messages matching SEARCH criteria, e.g. ["FROM", quote(address)]."""
+        with instrumentation.span("search"):
+            self.select_folder(folder)
+            typ, data = self.imap.uid("SEARCH", *criteria)
+        if typ != "OK":
+            raise imaplib.IMAP4.error(f"UID SEARCH failed: {data}")
+        return sorted(int(uid) for uid in data[0].split()) if data and data[0] else []
+    
+    def move_messages(self, uids: Sequence[int], target: Optional[str],
+                      folder: str = "INBOX"):
+        """Move messages to target by UID, or delete them for good if target is None.
+        
+        Uses UID MOVE where the server has it. Otherwise the messages are
+        copied, flagged \\Deleted and removed with UID EXPUNGE (plain
+        EXPUNGE without UIDPLUS), and nothing is removed unless the copy
+        succeeded. Raises on failure.
+        """
+        uid_set = sequence_set(uids)
+        with instrumentation.span("store"):
+            self.select_folder(folder)
+            if target is not None and self.has_capability("MOVE"):
+                typ, data = self.imap.uid("MOVE", uid_set, quote(target))
+                if typ != "OK":
+                    raise imaplib.IMAP4.error(f"UID MOVE failed: {data}")
+                return
+            if target is not None:
+                typ, data = self.imap.uid("COPY", uid_set, quote(target))
+                if typ != "OK":
+                    raise imaplib.IMAP4.error(f"UID COPY failed: {data}")
+            commands = [("UID", "STORE", uid_set, "+FLAGS.SILENT", "(\\Deleted)")]
+            if self.has_capability("UIDPLUS"):
+                commands.append(("UID", "EXPUNGE", uid_set))
+            else:
+                commands.append(("EXPUNGE",))
+            if self.pipelining:
+                statuses = [typ for typ, _ in self.pipeline(commands)]
+            else:
+                statuses = [self.imap.uid(*command[1:])[0] if command[0] == "UID"
+                            else self.imap.expunge()[0] for command in commands]
+        if any(status != "OK" for status in statuses):
+            raise imaplib.IMAP4.error(f"Removing moved messages failed: {statuses}")
+    
+    def store_flags(self, changes: Sequence[Tuple[int, str, bool]],
+                    folder: str = "INBOX") -> List[Tuple[int, str, bool]]:
+        """Set or clear flags by UID; returns the changes the server refused.
+        
+        Changes are (uid, flag, add) and are grouped into one UID STORE per
+        flag and direction, with the UIDs range-compressed, so thousands
+        of messages cost a few commands. The commands are pipelined.
+        """
+        groups: Dict[Tuple[str, bool], set] = {}
+        for uid, flag, add in changes:
+            groups.setdefault((flag, add), set()).add(uid)
+        commands, batches = [], []
+        for (flag, add), uids in groups.items():
+            uids = sorted(uids)
+            for start in range(0, len(uids), STORE_BATCH_SIZE):
+                batch = uids[start:start + STORE_BATCH_SIZE]
+                commands.append(("UID", "STORE", sequence_set(batch),
+                                 "+FLAGS.SILENT" if add else "-FLAGS.SILENT", f"({flag})"))
+                batches.append((flag, add, batch))
+        if not commands:
+            return []
+        
+        with instrumentation.span("store"):
+            self.select_folder(folder)
+            if self.pipelining:
+                statuses = [typ for typ, _ in self.pipeline(commands)]
+            else:
+                statuses = [self.imap.uid(*command[1:])[0] for command in commands]
+        failed = []
+        for (flag, add, batch), status in zip(batches, statuses):
+            if status != "OK":
+                logger.warning("UID STORE %s%s on %s messages failed",
+                               "+" if add else "-", flag, len(batch))
+                failed.extend((uid, flag, add) for uid in batch)
+        return failed
+    
+    def message_state(self, uids: Sequence[int],
+                      folder: str = "INBOX") -> Dict[int, Tuple[set, int]]:
+        """Current (flags, modseq) of the messages still in folder, by UID.
+        
+        The modseq is 0 where the server has no CONDSTORE. UIDs missing
+        from the result were expunged or moved away.
+        """
+        if not uids:
+            return {}
+        self.select_folder(folder)
+        modseq = " MODSEQ" if self.has_capability("CONDSTORE") else ""
+        uid_set = sequence_set(uids).encode()
+        return {
+            attributes["UID"]: (set(attributes.get("FLAGS") or ()),
+                                (attributes.get("MODSEQ") or [0])[0])
+            for attributes in self._uid_fetch([uid_set], f"(UID FLAGS{modseq})")
+        }
+    
+    def fetch_bodies(self, uids: Sequence[int], folder: str = "INBOX") -> Dict[int, Dict]:
+        """Fetch full messages by UID without setting \\Seen."""
+        self.select_folder(folder)
+        fetched = [
+            (str(attributes["UID"]), attributes["BODY[]"])
+            for attributes in self._uid_fetch([str(uid).encode() for uid in uids],
+                                              "(UID BODY.PEEK[])")
+            if isinstance(attributes.get("BODY[]"), bytes)
+        ]
+        records = mime_decoder.decode_messages(fetched)
+        return {int(record["id"]): record for record in records}
+    
+    def _uid_fetch(self, uids: Sequence[bytes], items: str) -> List[Dict]:
+        """UID FETCH in provider-sized batches; returns each message's items."""
+        batch_size = self.profile.fetch_batch_size
+        batches = [
+            b",".join(uids[start:start + batch_size])
+            for start in range(0, len(uids), batch_size)
+        ]
+        with instrumentation.span("fetch"):
+            if self.pipelining and batches:
+                replies = self.pipeline([("UID", "FETCH", batch, items) for batch in batches])
+                responses = [untagged.get("FETCH", []) for _, untagged in replies]
+            else:
+                responses = [self.imap.uid("FETCH", batch, items)[1] for batch in batches]
+        
+        results = []
+        for parts in responses:
+            for data, literals in iter_imaplib_responses(parts):
+                _, attributes = parse_fetch(data, literals)
+                if "UID" in attributes:
+                    results.append(attributes)
+        return results
+    
+    def search_emails(self, query: str, folder: str = "INBOX") -> List[int]:
+        """Return UIDs of messages whose text contains the query (server-side)."""
+        if not self.imap:
+            return []
+        
+        try:
+            self.select_folder(folder)
+            # Send the query as a literal so quoting and non-ASCII text work
+            self.imap.literal = query.encode("utf-8")
+            typ, data = self.imap.uid("SEARCH", "CHARSET", "UTF-8", "TEXT")
+            if typ != "OK":
+                raise imaplib.IMAP4.error(f"UID SEARCH failed: {data}")
+            return sorted(int(uid) for uid in data[0].split()) if data and data[0] else []
+        except Exception as e:
+            logger.error("Error searching emails: %s", e)
+            return []
+    
+    def deliver(self, to_addr: str, subject: str, body: str):
+        """Send an email, connecting to SMTP first if needed; raises on failure.
+        
+        Servers drop idle SMTP sessions, so a dropped one is reopened and
+        the message sent once more.
+        """
+        msg = MIMEMultipart()
+        msg["From"] = self.email_address
+        msg["To"] = to_addr
+        msg["Subject"] = subject
+        
+        msg.attach(MIMEText(body, "plain"))
+        
+        try:
+            if self.smtp is None:
+                self.smtp = self.connect_smtp()
+            self.smtp.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.smtp = self.connect_smtp()
+            self.smtp.send_message(msg)
+    
     def send_email(self, to_addr: str, subject: str, body: str) -> bool:
         """Send an email."""
         if not self.smtp:
             return False
         
         try:
-            msg = MIMEMultipart()
-            msg["From"] = self.email_address
-            msg["To"] = to_addr
-            msg["Subject"] = subject
-            
-            msg.attach(MIMEText(body, "plain"))
-            
-            self.smtp.send_message(msg)
+            self.deliver(to_addr, subject, body)
             return True
         except Exception as e:
-            print(f"Error sending email: {str(e)}")
+            logger.error("Error sending email: %s", e)
             return False 
\ No newline at end of file
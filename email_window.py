@@ -1,44 +1,75 @@
+from bisect import bisect_left, bisect_right
+
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
     QListWidget, QTextEdit, QPushButton, QListWidgetItem, QMessageBox,
-    QFrame, QSplitter, QStyledItemDelegate, QStyle
+    QFrame, QSplitter, QStyledItemDelegate, QStyle, QComboBox, QInputDialog,
+    QAbstractItemView, QProgressDialog
 )
-from PyQt6.QtCore import Qt, QTimer, QDateTime, QThread, QSize, QRect
-from PyQt6.QtGui import QCursor, QPainter, QFont, QColor, QIcon
+from PyQt6.QtCore import Qt, QTimer, QDate, QDateTime, QTime, QThread, QSize, QRect, QEvent
+from PyQt6.QtGui import QCursor, QPainter, QFont, QIcon, QKeySequence
 from email_handler import EmailHandler
-from compose_dialog import ComposeDialog
 from search_filter_widget import CompactSearchWidget
 from email_worker import EmailWorker
+from body_cache import BodyCache, body_key
+from prefetch import PrefetchScheduler
+from qt_asyncio import AsyncioBridge
+from history_loader import HistoryLoader
+from journal_sync import JournalSync
+from offline_journal import OfflineJournal
+from bulk_ops import BulkJob, BulkOperations
+from imap_parser import quote, search_date
+from search_index import TrigramIndex
+from header_table import HeaderTable
+from sort_index import SORT_ORDERS, SortIndex, row_key, sort_key
+from smart_folders import SavedSearch, SmartFolders
+import instrumentation
+import styles
+from logging_config import get_logger
+
+logger = get_logger("email_window")
+
+# Pages of older mail fetched on their own when a page doesn't fill the
+# list (e.g. under a filter) before the user has to scroll or ask for more
+HISTORY_AUTO_PAGES = 2
 
 
 class EmailItemDelegate(QStyledItemDelegate):
     """Custom delegate for rendering email list items with proper formatting"""
     def __init__(self, parent=None):
         super().__init__(parent)
+        # Colours and fonts are built once, not per painted row
+        self.row_style = styles.RowStyle(parent.font() if parent is not None else QFont())
         
     def paint(self, painter, option, index):
+        with instrumentation.span("paint"):
+            self.paint_email(painter, option, index)
+    
+    def paint_email(self, painter, option, index):
         # Get the email data from the item
         email_data = index.data(Qt.ItemDataRole.UserRole)
         if not email_data:
             super().paint(painter, option, index)
             return
             
+        style = self.row_style
+        
         # Draw the selection background if selected
         if option.state & QStyle.StateFlag.State_Selected:
-            painter.fillRect(option.rect, QColor("#e1f0ff"))
+            painter.fillRect(option.rect, style.selected)
             # Draw a left border for selected items
             painter.fillRect(
                 QRect(option.rect.left(), option.rect.top(), 3, option.rect.height()),
-                QColor("#0078d4")
+                style.selected_edge
             )
         elif option.state & QStyle.StateFlag.State_MouseOver:
             # Highlight on hover
-            painter.fillRect(option.rect, QColor("#f5f5f5"))
+            painter.fillRect(option.rect, style.hover)
         else:
-            painter.fillRect(option.rect, QColor("white"))
+            painter.fillRect(option.rect, style.background)
             
         # Draw bottom border
-        painter.setPen(QColor("#ccc"))
+        painter.setPen(style.divider)
         painter.drawLine(
             option.rect.left(), option.rect.bottom(),
             option.rect.right(), option.rect.bottom()
@@ -51,21 +82,42 @@ class EmailItemDelegate(QStyledItemDelegate):
         margin = 12
         rect = option.rect.adjusted(margin, margin, -margin, -margin)
         
-        # Draw sender name (bold)
-        font = painter.font()
-        font.setBold(True)
-        font.setPointSize(10)
-        painter.setFont(font)
-        painter.setPen(QColor("#000"))
+        # Draw sender name (bold while unread)
+        flags = email_data.get('flags', ())
+        if '\\Seen' in flags:
+            sender_font, sender_metrics = style.read_sender_font, style.read_sender_metrics
+        else:
+            sender_font, sender_metrics = style.sender_font, style.sender_metrics
+        painter.setFont(sender_font)
+        painter.setPen(style.sender_color)
         sender_rect = QRect(rect.left(), rect.top(), rect.width(), 20)
-        painter.drawText(
-            sender_rect, Qt.AlignmentFlag.AlignLeft, email_data['from']
-        )
+        sender = email_data.get('from_name') or email_data['from']
+        painter.drawText(sender_rect, Qt.AlignmentFlag.AlignLeft, sender)
+        
+        offset = sender_metrics.horizontalAdvance(sender or "")
+        
+        # Star for flagged messages after the sender
+        if '\\Flagged' in flags and offset < sender_rect.width():
+            painter.setPen(style.star_color)
+            painter.drawText(sender_rect.adjusted(offset, 0, 0, 0),
+                             Qt.AlignmentFlag.AlignLeft, " ★")
+            painter.setPen(style.sender_color)
+            offset += sender_metrics.horizontalAdvance(" ★")
+        
+        # Labels added by rules (accent colour) after the sender
+        labels = email_data.get('labels')
+        if labels:
+            if offset < sender_rect.width():
+                painter.setFont(style.subject_font)
+                painter.setPen(style.label_color)
+                painter.drawText(
+                    sender_rect.adjusted(offset, 0, 0, 0),
+                    Qt.AlignmentFlag.AlignLeft, "   " + " · ".join(labels)
+                )
+                painter.setPen(style.sender_color)
         
         # Draw subject (normal)
-        font.setBold(False)
-        font.setPointSize(9)
-        painter.setFont(font)
+        painter.setFont(style.subject_font)
         subject_rect = QRect(
             rect.left(), sender_rect.bottom() + 6, rect.width(), 20
         )
@@ -73,14 +125,25 @@ class EmailItemDelegate(QStyledItemDelegate):
             subject_rect, Qt.AlignmentFlag.AlignLeft, email_data['subject']
         )
         
+        # Preview snippet (gray) after the subject, clipped to the row
+        snippet = email_data.get('snippet')
+        if snippet:
+            offset = style.subject_metrics.horizontalAdvance(email_data['subject'] or "")
+            if offset < subject_rect.width():
+                painter.setPen(style.snippet_color)
+                painter.drawText(
+                    subject_rect.adjusted(offset, 0, 0, 0),
+                    Qt.AlignmentFlag.AlignLeft, " — " + snippet
+                )
+        
         # Draw date (gray) - use consistent format
         formatted_date = "Date not available"
         try:
             if 'date' in email_data and email_data['date']:
                 date_str = email_data['date']
                 
-                # Parse date using the helper function
-                date = parse_date(date_str)
+                # Dates are parsed once at ingest; parse here only if missing
+                date = email_data.get('parsed_date') or parse_date(date_str)
                 
                 # Format date consistently
                 if date.isValid():
@@ -90,13 +153,12 @@ class EmailItemDelegate(QStyledItemDelegate):
                     # Just use the raw date string as fallback
                     formatted_date = date_str
             else:
-                print("Date field missing in email data")
+                logger.debug("Date field missing in email data")
         except Exception as e:
-            print(f"Error formatting date: {str(e)}")
+            logger.error("Error formatting date: %s", e)
             
-        font.setPointSize(8)
-        painter.setFont(font)
-        painter.setPen(QColor("#666"))
+        painter.setFont(style.date_font)
+        painter.setPen(style.date_color)
         date_rect = QRect(
             rect.left(), subject_rect.bottom() + 6, rect.width(), 20
         )
@@ -128,18 +190,58 @@ class EmailListItem(QListWidgetItem):
 
 class EmailWindow(QMainWindow):
     def __init__(self, email):
-        print("[EmailWindow.__init__] Starting initialization")
+        logger.debug("Starting initialization")
         super().__init__()
         self.email = email
+        self.setObjectName("email_window")
+        # No-op when main() already set it; covers windows built without main()
+        styles.apply()
         self._email_handler = None
+        self.emails = []
         self.filtered_emails = []
+        # Sort keys parallel to emails/filtered_emails, for bisect
+        self.email_keys = []
+        self.filtered_keys = []
+        # Dates and senders of emails as NumPy columns
+        self.header_table = HeaderTable()
+        # emails stay in date order; other display orders picked so far
+        # are kept as sort indexes, by SORT_ORDERS name
+        self.sort_order = "date"
+        self.sort_indexes = {}
+        # Saved searches with members kept current at ingest; smart_folder
+        # is the one being shown, or None for the whole mailbox
+        self.smart_folders = SmartFolders(text_matches=self.matches_text)
+        self.smart_folder = None
         self.search_text = ""
+        # Fuzzy index over senders and subjects, kept in step with emails;
+        # search_hits holds the current query's matches as {key: score}
+        self.search_index = TrigramIndex()
+        self.search_hits = None
         self.start_date = None
         self.end_date = None
+        # The date filter as [start, end) in seconds since the epoch
+        self.date_bounds = None
         self.worker = None
         self.thread = None
+        self.prefetcher = None
+        # Asyncio loop thread the prefetch connection runs on
+        self.bridge = None
+        self.history_loader = None
+        self.journal_sync = None
+        self.bulk_ops = None
+        self.bulk_progress = None
+        # Oldest UID synced so far, including messages rules kept off the list
+        self.oldest_uid = None
+        # Pages fetched on their own since the user last scrolled or asked
+        self.history_auto_pages = 0
+        # Bodies fetched after a header-only sync live here, not in the records
+        self.body_cache = BodyCache.for_account(email)
+        instrumentation.register_source("Body cache", self.body_cache.stats)
+        # Changes waiting for the server, kept on disk across restarts
+        self.journal = OfflineJournal.for_account(email)
+        self.displayed_uid = None
         
-        print("[EmailWindow.__init__] Setting window properties")
+        logger.debug("Setting window properties")
         self.setWindowTitle(f"Mail Buddy - {email}")
         # Set window icon to bear emoji
         self.setWindowIcon(QIcon("icon.png"))
@@ -148,8 +250,14 @@ class EmailWindow(QMainWindow):
         # Setup menu bar
         self.setup_menu()
         
+        # Offline state and changes waiting to sync, beside the status messages
+        self.sync_label = QLabel()
+        self.sync_label.setObjectName("sync_label")
+        self.statusBar().addPermanentWidget(self.sync_label)
+        self.sync_label.hide()
+        
         # Create central widget and main layout
-        print("[EmailWindow.__init__] Creating central widget")
+        logger.debug("Creating central widget")
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
         self.main_layout = QVBoxLayout(self.central_widget)
@@ -157,22 +265,16 @@ class EmailWindow(QMainWindow):
         self.main_layout.setContentsMargins(0, 0, 0, 0)
         
         # Add loading indicator
-        print("[EmailWindow.__init__] Adding loading indicator")
+        logger.debug("Adding loading indicator")
         self.loading_label = QLabel("Loading email client...")
         self.loading_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.loading_label.setStyleSheet("""
-            QLabel {
-                color: #666;
-                font-size: 16px;
-                padding: 20px;
-            }
-        """)
+        self.loading_label.setObjectName("loading_label")
         self.main_layout.addWidget(self.loading_label)
         
         # Setup UI in the next event loop iteration
-        print("[EmailWindow.__init__] Scheduling UI setup")
+        logger.debug("Scheduling UI setup")
         QTimer.singleShot(0, self.setup_ui)
-        print("[EmailWindow.__init__] Basic initialization complete")
+        logger.debug("Basic initialization complete")
     
     def set_loading(self, is_loading):
         """Set the loading state of the window"""
@@ -188,7 +290,7 @@ class EmailWindow(QMainWindow):
     @email_handler.setter
     def email_handler(self, handler):
         """Set the email handler and start fetching emails"""
-        print("[EmailWindow.email_handler] Setting email handler")
+        logger.debug("Setting email handler")
         if handler:
             self._email_handler = handler
             
@@ -199,19 +301,60 @@ class EmailWindow(QMainWindow):
             self.worker = EmailWorker()
             self.worker.handler = handler
             
+            # Bodies are downloaded in the background after header sync
+            if self.prefetcher:
+                self.prefetcher.stop()
+                self.prefetcher.deleteLater()
+            if self.bridge is None:
+                self.bridge = AsyncioBridge(self)
+            self.prefetcher = PrefetchScheduler(handler, bridge=self.bridge, parent=self)
+            self.prefetcher.bodies_ready.connect(self.handle_bodies_ready)
+            self.prefetcher.fetch_failed.connect(self.handle_prefetch_failed)
+            
+            # Older mail is paged in as the user scrolls down
+            if self.history_loader:
+                self.history_loader.stop()
+                self.history_loader.deleteLater()
+            self.history_loader = HistoryLoader(handler, parent=self)
+            self.history_loader.page_loaded.connect(self.handle_history_page)
+            self.history_loader.load_failed.connect(self.handle_history_failed)
+            
+            # Flag changes, moves and outgoing mail are applied here at once,
+            # journaled, and replayed on the server in batches once it answers
+            if self.journal_sync:
+                self.journal_sync.stop()
+                self.journal_sync.deleteLater()
+            self.journal_sync = JournalSync(handler, self.journal, parent=self)
+            self.journal_sync.failed.connect(self.handle_flags_failed)
+            self.journal_sync.unmoved.connect(self.handle_moves_failed)
+            self.journal_sync.sent.connect(self.handle_message_sent)
+            self.journal_sync.unsent.connect(self.handle_message_unsent)
+            self.journal_sync.state_changed.connect(self.handle_sync_state)
+            self.handle_sync_state(True, self.journal_sync.pending)
+            
+            # Bulk archive and delete run in chunks on their own connection
+            if self.bulk_ops:
+                # A job cut off here reports nothing more
+                self.bulk_ops.stop()
+                self.bulk_ops.deleteLater()
+                self.close_bulk_progress()
+            self.bulk_ops = BulkOperations(handler, parent=self)
+            self.bulk_ops.progress.connect(self.handle_bulk_progress)
+            self.bulk_ops.finished.connect(self.handle_bulk_finished)
+            
             # Start refresh timer
-            print("[EmailWindow.email_handler] Starting refresh timer")
+            logger.debug("Starting refresh timer")
             self.refresh_timer = QTimer()
             self.refresh_timer.timeout.connect(self.refresh_emails)
             self.refresh_timer.start(60000)  # Refresh every minute
             
             # Start initial refresh
-            print("[EmailWindow.email_handler] Starting initial refresh")
+            logger.debug("Starting initial refresh")
             self.refresh_emails()
     
     def cleanup_thread(self):
         """Clean up thread and worker after operation is complete"""
-        print("[EmailWindow.cleanup_thread] Starting cleanup")
+        logger.debug("Starting cleanup")
         
         # Disconnect any signals to prevent memory leaks
         if hasattr(self, 'worker') and self.worker:
@@ -219,102 +362,320 @@ class EmailWindow(QMainWindow):
                 self.worker.finished.disconnect()
                 self.worker.emails_fetched.disconnect()
                 self.worker.error.disconnect()
+                self.worker.disconnected.disconnect()
             except Exception:
                 pass  # Ignore if signals weren't connected
         
         # Stop and wait for thread
         if hasattr(self, 'thread') and self.thread and self.thread.isRunning():
-            print("[EmailWindow.cleanup_thread] Cleaning up thread")
+            logger.debug("Cleaning up thread")
             self.thread.quit()
             if not self.thread.wait(1000):  # Wait up to 1 second
-                print("[EmailWindow.cleanup_thread] Thread did not quit, terminating")
+                logger.warning("Thread did not quit, terminating")
                 self.thread.terminate()
                 self.thread.wait()
         
         # Delete worker
         if hasattr(self, 'worker') and self.worker:
-            print("[EmailWindow.cleanup_thread] Cleaning up worker")
+            logger.debug("Cleaning up worker")
             self.worker.deleteLater()
             self.worker = None
         
         # Delete thread
         if hasattr(self, 'thread') and self.thread:
-            print("[EmailWindow.cleanup_thread] Deleting thread")
+            logger.debug("Deleting thread")
             self.thread.deleteLater()
             self.thread = None
             
-        print("[EmailWindow.cleanup_thread] Cleanup complete")
+        logger.debug("Cleanup complete")
     
     def handle_emails_fetched(self, emails):
         """Handle fetched emails"""
-        print(f"[EmailWindow.handle_emails_fetched] Received {len(emails)} emails")
+        logger.debug("Received %s emails", len(emails))
+        if self.journal_sync:
+            # The server is back: replay what waited for it
+            self.journal_sync.retry_now()
+            self.handle_sync_state(True, self.journal_sync.pending)
         
         if not hasattr(self, 'ui_ready') or not self.ui_ready:
-            print("[EmailWindow.handle_emails_fetched] UI not ready, storing emails for later")
+            logger.debug("UI not ready, storing emails for later")
             self.pending_emails = emails
             return
             
-        print("[EmailWindow.handle_emails_fetched] UI ready, processing emails")
+        logger.debug("UI ready, processing emails")
+        
+        emails = self.visible_emails(emails)
+        self.prepare_emails(emails)
+        
+        list_ready = getattr(self, 'email_list', None) is not None \
+            and self.email_list.count() == len(self.filtered_emails)
+        if self.emails and list_ready:
+            # Patch the existing rows instead of rebuilding the list
+            self.merge_emails(emails)
+        else:
+            emails.sort(key=sort_key)
+            self.emails = emails
+            self.email_keys = [sort_key(email) for email in emails]
+            self.header_table.build(emails)
+            self.reindex_emails()
+            self.smart_folders.rebuild(emails)
+            self.sort_indexes = {}
+            if self.sort_order != "date":
+                with instrumentation.span("sort"):
+                    self.sort_indexes[self.sort_order] = SortIndex(
+                        SORT_ORDERS[self.sort_order].key, emails
+                    )
+            self.filtered_emails, self.filtered_keys = self.filter_rows()
+            
+            # If email list is ready, populate it
+            if getattr(self, 'email_list', None) is not None:
+                logger.debug("Email list ready, displaying emails, id: %s", id(self.email_list))
+                self.populate_email_list()
+            else:
+                logger.debug("Email list not ready, will display later")
+                # Try to find the email list
+                try:
+                    for child in self.findChildren(QListWidget, "email_list"):
+                        self.email_list = child
+                        logger.debug("Found email list widget, id: %s", id(self.email_list))
+                        self.populate_email_list()
+                        break
+                except Exception as e:
+                    logger.error("Error finding email list: %s", e)
+        self.statusBar().showMessage(f"Last updated: {QDateTime.currentDateTime().toString()}")
         
-        # Sort emails by date (newest first)
+        logger.debug("Processed %s emails", len(emails))
+        self.update_folder_labels()
+        self.set_loading(False)
+        instrumentation.end_refresh()
+        self.schedule_prefetch()
+        self.load_more_history()
+    
+    def visible_emails(self, emails):
+        """Drop records that rules hid or moved away and deleted messages,
+        noting how far back they go, and apply changes still journaled"""
+        uids = [email['uid'] for email in emails if 'uid' in email]
+        if uids:
+            self.oldest_uid = min(uids) if self.oldest_uid is None else min(self.oldest_uid, *uids)
+        emails = self.journal.overlay(emails)
+        return [email for email in emails
+                if not email.get('hidden') and '\\Deleted' not in email.get('flags', ())]
+    
+    def prepare_emails(self, emails):
+        """Parse dates and register body sizes for newly fetched records"""
+        # Parse dates once; the list is kept sorted newest first
+        known = {row_key(email): email for email in self.emails}
         try:
-            # Convert string dates to QDateTime objects for sorting
             for email in emails:
-                if 'date' in email and email['date']:
-                    date_str = email['date']
-                    date = parse_date(date_str)
-                    # Store the parsed date for sorting
-                    email['parsed_date'] = date
+                previous = known.get(row_key(email))
+                if previous is not None and previous.get('date') == email.get('date'):
+                    email['parsed_date'] = previous['parsed_date']
+                elif 'date' in email and email['date']:
+                    email['parsed_date'] = parse_date(email['date'])
                 else:
                     # If no date, use epoch start (will appear at the end)
                     email['parsed_date'] = QDateTime.fromSecsSinceEpoch(0)
-            
-            # Sort emails by parsed_date in descending order (newest first)
-            emails.sort(key=lambda x: x['parsed_date'].toSecsSinceEpoch(), reverse=True)
         except Exception as e:
-            print(f"[EmailWindow.handle_emails_fetched] Error sorting emails: {str(e)}")
+            logger.error("Error parsing dates: %s", e)
         
-        self.emails = emails
-        self.filtered_emails = emails.copy()  # Store a copy for filtering
-        self.statusBar().showMessage(f"Last updated: {QDateTime.currentDateTime().toString()}")
+        # Bodies already in the cache don't need prefetching
+        if self.prefetcher:
+            lazy = [email for email in emails if 'uid' in email]
+            self.prefetcher.set_sizes({email['uid']: email.get('size', 0) for email in lazy})
+            self.prefetcher.mark_loaded(
+                email['uid'] for email in lazy if body_key(email) in self.body_cache
+            )
+    
+    def merge_emails(self, fresh):
+        """Apply a refresh as a keyed diff: insert, remove and update rows in place"""
+        with instrumentation.span("populate"):
+            anchor = self._scroll_anchor()
+            fresh_by_key = {row_key(email): email for email in fresh}
+            current = {row_key(email): email for email in self.emails}
+            inserted = removed = updated = 0
+            
+            # A refresh covers the newest messages only; older pages loaded
+            # by scrolling are outside its UID range and stay put
+            floor = None
+            if fresh and all('uid' in email for email in fresh):
+                floor = min(email['uid'] for email in fresh)
+            for key, email in current.items():
+                if key not in fresh_by_key and (floor is None or email.get('uid', floor) >= floor):
+                    self._remove_email(email)
+                    removed += 1
+            
+            for key, email in fresh_by_key.items():
+                old = current.get(key)
+                if old is None:
+                    self._insert_email(email)
+                    inserted += 1
+                elif any(old.get(field) != value for field, value in email.items()
+                         if field != 'parsed_date'):
+                    self._remove_email(old)
+                    old.update(email)
+                    self._insert_email(old)
+                    updated += 1
+            
+            self._restore_scroll(anchor)
+        instrumentation.count("rows_inserted", inserted)
+        instrumentation.count("rows_removed", removed)
+        instrumentation.count("rows_updated", updated)
+        logger.debug("Merged refresh: %s new, %s removed, %s updated", inserted, removed, updated)
+    
+    def reindex_emails(self):
+        """Rebuild the fuzzy search index (and current matches) from emails"""
+        with instrumentation.span("index"):
+            self.search_index.clear()
+            for email in self.emails:
+                self.search_index.add(row_key(email), index_text(email))
+        if self.search_hits is not None:
+            self.search_hits = self.search_widget.search(self.search_text)
+    
+    def _insert_email(self, email):
+        self.search_index.add(row_key(email), index_text(email))
+        if self.search_hits is not None:
+            score = self.search_index.score(row_key(email), self.search_text)
+            if score:
+                self.search_hits[row_key(email)] = score
+        key = sort_key(email)
+        index = bisect_right(self.email_keys, key)
+        self.email_keys.insert(index, key)
+        self.emails.insert(index, email)
+        self.header_table.insert(index, email)
+        for order_index in self.sort_indexes.values():
+            order_index.insert(email)
+        self.smart_folders.add(email)
+        if self.matches_filters(email):
+            self._show_row(email, SORT_ORDERS[self.sort_order].key(email))
+    
+    def _remove_email(self, email):
+        self.search_index.remove(row_key(email))
+        if self.search_hits is not None:
+            self.search_hits.pop(row_key(email), None)
+        key = sort_key(email)
+        index = bisect_left(self.email_keys, key)
+        if index < len(self.emails) and self.emails[index] is email:
+            del self.email_keys[index]
+            del self.emails[index]
+            self.header_table.delete(index)
+        key = self._row_key(email)
+        for order_index in self.sort_indexes.values():
+            order_index.remove(email)
+        self.smart_folders.remove(email)
+        self._hide_row(email, key)
+    
+    def _row_key(self, email):
+        """Key a message's row was placed under in the current order"""
+        order_index = self.sort_indexes.get(self.sort_order)
+        if order_index is not None:
+            # The row was placed under the key the index recorded
+            return order_index.key_of(email) or order_index.key(email)
+        return sort_key(email)
+    
+    def _find_row(self, email, key):
+        row = bisect_left(self.filtered_keys, key)
+        if row < len(self.filtered_emails) and self.filtered_emails[row] is email:
+            return row
+        return -1
+    
+    def _show_row(self, email, key):
+        row = bisect_right(self.filtered_keys, key)
+        self.filtered_keys.insert(row, key)
+        self.filtered_emails.insert(row, email)
+        self.email_list.insertItem(row, EmailListItem(email))
+    
+    def _hide_row(self, email, key):
+        row = self._find_row(email, key)
+        if row >= 0:
+            del self.filtered_keys[row]
+            del self.filtered_emails[row]
+            self.email_list.takeItem(row)
+    
+    def _set_flags(self, email, flags):
+        """Change a message's flags, moving its row only if the view needs to"""
+        old_key = self._row_key(email)
+        row = self._find_row(email, old_key)
+        for order_index in self.sort_indexes.values():
+            order_index.remove(email)
+        self.smart_folders.remove(email)
+        email['flags'] = flags
+        for order_index in self.sort_indexes.values():
+            order_index.insert(email)
+        self.smart_folders.add(email)
         
-        # If email list is ready, populate it
-        if hasattr(self, 'email_list') and self.email_list:
-            print(f"[EmailWindow.handle_emails_fetched] Email list ready, displaying emails, id: {id(self.email_list)}")
-            self.populate_email_list()
+        key = SORT_ORDERS[self.sort_order].key(email)
+        shown = self.matches_filters(email)
+        if row >= 0 and shown and key == old_key:
+            self.email_list.item(row).update_display()
+            return
+        if row >= 0:
+            self._hide_row(email, old_key)
+        if shown:
+            self._show_row(email, key)
+    
+    def _scroll_anchor(self):
+        """Remember the top visible row so a merge doesn't move the view"""
+        scrollbar = self.email_list.verticalScrollBar()
+        if scrollbar.value() == 0:
+            # At the top: stay there so new mail shows up
+            return None
+        item = self.email_list.itemAt(0, 0)
+        if item is None:
+            return None
+        return item, self.email_list.row(item), self.email_list.visualItemRect(item).top()
+    
+    def _restore_scroll(self, anchor):
+        if anchor is None:
+            return
+        item, old_row, old_top = anchor
+        row = self.email_list.row(item)
+        if row < 0:
+            return
+        scrollbar = self.email_list.verticalScrollBar()
+        if self.email_list.verticalScrollMode() == QListWidget.ScrollMode.ScrollPerItem:
+            scrollbar.setValue(scrollbar.value() + row - old_row)
         else:
-            print("[EmailWindow.handle_emails_fetched] Email list not ready, will display later")
-            # Try to find the email list
-            try:
-                for child in self.findChildren(QListWidget, "email_list"):
-                    self.email_list = child
-                    print(f"[EmailWindow.handle_emails_fetched] Found email list widget, id: {id(self.email_list)}")
-                    self.populate_email_list()
-                    break
-            except Exception as e:
-                print(f"[EmailWindow.handle_emails_fetched] Error finding email list: {str(e)}")
-        
-        current_time = QDateTime.currentDateTime()
-        refresh_time = current_time.toString('MM/dd/yyyy hh:mm:ss AP')
-        print(f"[EmailWindow.handle_emails_fetched] Processed {len(emails)} emails at {refresh_time}")
-        self.set_loading(False)
+            scrollbar.setValue(
+                scrollbar.value() + self.email_list.visualItemRect(item).top() - old_top
+            )
     
     def handle_error(self, error_msg):
         """Handle worker errors"""
         self.set_loading(False)
+        instrumentation.end_refresh()
         QMessageBox.warning(self, "Error", str(error_msg))
     
+    def handle_disconnected(self, error_msg):
+        """Keep working from the local copy while the server can't be reached"""
+        logger.warning("Server unreachable: %s", error_msg)
+        self.set_loading(False)
+        instrumentation.end_refresh()
+        self.statusBar().showMessage("Offline: changes are saved and sent once the server is back")
+        self.handle_sync_state(False, self.journal_sync.pending if self.journal_sync else 0)
+    
+    def handle_sync_state(self, online, pending):
+        """Show whether the server is reachable and how many changes wait for it"""
+        if online and not pending:
+            self.sync_label.hide()
+            return
+        text = "Syncing" if online else "Offline"
+        if pending:
+            text += f" \u00b7 {pending} change{'s' if pending != 1 else ''} waiting"
+        self.sync_label.setText(text)
+        self.sync_label.show()
+    
     def refresh_emails(self):
         """Refresh emails from server"""
-        print("[EmailWindow.refresh_emails] Starting refresh")
+        logger.debug("Starting refresh")
         if not self.email_handler:
-            print("[EmailWindow.refresh_emails] Email handler not initialized")
+            logger.debug("Email handler not initialized")
             return
             
         # Clean up any existing thread first
         self.cleanup_thread()
         
         self.set_loading(True)
+        instrumentation.begin_refresh()
         
         # Create new thread and worker
         self.thread = QThread()
@@ -325,71 +686,102 @@ class EmailWindow(QMainWindow):
         # Connect signals
         self.worker.emails_fetched.connect(self.handle_emails_fetched)
         self.worker.error.connect(self.handle_error)
+        self.worker.disconnected.connect(self.handle_disconnected)
         self.worker.finished.connect(self.cleanup_thread)
         
-        # Start thread and fetch emails
-        self.thread.started.connect(lambda: self.worker.fetch_emails(50))
+        # Start thread and fetch headers; bodies are prefetched separately
+        self.thread.started.connect(lambda: self.worker.fetch_emails(50, headers_only=True))
         self.thread.start()
         
-        print("[EmailWindow.refresh_emails] Thread started")
+        logger.debug("Thread started")
     
     def setup_ui(self):
         """Setup the UI components"""
-        print("[EmailWindow.setup_ui] Starting UI setup")
+        logger.debug("Starting UI setup")
         try:
             # Remove loading indicator
-            print("[EmailWindow.setup_ui] Removing loading indicator")
+            logger.debug("Removing loading indicator")
             if hasattr(self, 'loading_label'):
                 self.loading_label.setVisible(False)
                 self.loading_label.deleteLater()
             
-            # Split UI setup into smaller chunks using QTimer
-            print("[EmailWindow.setup_ui] Setting up UI in chunks")
-            self.setup_top_bar()
-            QTimer.singleShot(100, self.setup_content_area)
-            QTimer.singleShot(200, self.setup_email_list)
-            QTimer.singleShot(300, self.setup_email_content)
-            QTimer.singleShot(400, self.finalize_setup)
+            # Split UI setup into smaller chunks; each one starts as soon as
+            # the event loop has handled what the previous one queued
+            logger.debug("Setting up UI in chunks")
+            self.setup_stages = [
+                self.setup_top_bar,
+                self.setup_content_area,
+                self.setup_email_list,
+                self.setup_email_content,
+                self.finalize_setup,
+            ]
+            self.run_setup_stage()
             
         except Exception as e:
-            print(f"[EmailWindow.setup_ui] Error during UI setup: {str(e)}")
+            logger.error("Error during UI setup: %s", e)
             QMessageBox.critical(self, "Error", f"Failed to initialize email window: {str(e)}")
     
+    def run_setup_stage(self):
+        """Run the next UI setup chunk and queue the one after it"""
+        stage = self.setup_stages.pop(0)
+        try:
+            stage()
+        except Exception as e:
+            logger.error("Error during UI setup: %s", e)
+            QMessageBox.critical(self, "Error", f"Failed to initialize email window: {str(e)}")
+            return
+        if self.setup_stages:
+            QTimer.singleShot(0, self.run_setup_stage)
+        else:
+            instrumentation.milestone("inbox_ui_ready")
+    
     def setup_top_bar(self):
         """Setup the top bar with search widget"""
-        print("[EmailWindow.setup_ui] Creating top bar")
+        logger.debug("Creating top bar")
         try:
             top_bar = QWidget()
             top_bar.setFixedHeight(50)
-            top_bar.setStyleSheet("""
-                QWidget {
-                    background-color: white;
-                    border-bottom: 1px solid #ddd;
-                }
-            """)
+            top_bar.setObjectName("top_bar")
             top_layout = QHBoxLayout(top_bar)
             top_layout.setContentsMargins(10, 5, 10, 5)
             
             # Add search widget
-            print("[EmailWindow.setup_ui] Adding search widget")
+            logger.debug("Adding search widget")
             self.search_widget = CompactSearchWidget()
             self.search_widget.setMaximumWidth(400)
+            self.search_widget.set_search_index(self.search_index)
             
             # Connect refresh button signal
             self.search_widget.refresh_clicked.connect(self.refresh_emails)
             
             top_layout.addWidget(self.search_widget)
+            
+            # Smart folder picker, shown once a search has been saved
+            self.folder_combo = QComboBox()
+            self.folder_combo.setObjectName("folder_combo")
+            self.folder_combo.addItem("All mail", None)
+            self.folder_combo.currentIndexChanged.connect(self.handle_folder_changed)
+            top_layout.addWidget(self.folder_combo)
+            self.update_folder_labels()
+            
+            # Sort order picker
+            self.sort_combo = QComboBox()
+            self.sort_combo.setObjectName("sort_combo")
+            for name, order in SORT_ORDERS.items():
+                self.sort_combo.addItem(order.label, name)
+            self.sort_combo.currentIndexChanged.connect(self.handle_sort_changed)
+            top_layout.addWidget(self.sort_combo)
             top_layout.addStretch()
             
             self.main_layout.addWidget(top_bar)
-            print("[EmailWindow.setup_ui] Top bar setup complete")
+            logger.debug("Top bar setup complete")
         except Exception as e:
-            print(f"[EmailWindow.setup_ui] Error setting up top bar: {str(e)}")
+            logger.error("Error setting up top bar: %s", e)
             raise
     
     def setup_content_area(self):
         """Setup the main content area"""
-        print("[EmailWindow.setup_ui] Creating content area")
+        logger.debug("Creating content area")
         try:
             self.content_widget = QWidget()
             self.content_layout = QVBoxLayout(self.content_widget)
@@ -398,14 +790,14 @@ class EmailWindow(QMainWindow):
             
             # Create splitter for email list and content
             self.splitter = QSplitter(Qt.Orientation.Horizontal)
-            print("[EmailWindow.setup_ui] Content area base setup complete")
+            logger.debug("Content area base setup complete")
         except Exception as e:
-            print(f"[EmailWindow.setup_ui] Error setting up content area: {str(e)}")
+            logger.error("Error setting up content area: %s", e)
             raise
     
     def setup_email_list(self):
         """Setup the email list panel"""
-        print("[EmailWindow.setup_ui] Setting up email list")
+        logger.debug("Setting up email list")
         try:
             self.list_panel = QWidget()
             list_layout = QVBoxLayout(self.list_panel)
@@ -413,49 +805,14 @@ class EmailWindow(QMainWindow):
             
             # Compose button
             compose_button = QPushButton("✉ Compose")
-            compose_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #0078d4;
-                    color: white;
-                    border: none;
-                    padding: 8px;
-                    border-radius: 4px;
-                    font-weight: bold;
-                    margin-bottom: 10px;
-                }
-                QPushButton:hover {
-                    background-color: #106ebe;
-                }
-            """)
+            compose_button.setObjectName("compose_button")
             
             # Create email list widget
-            print("[EmailWindow.setup_email_list] Creating email list widget")
+            logger.debug("Creating email list widget")
             self.email_list = QListWidget()
             self.email_list.setObjectName("email_list")  # Set object name for easier finding
-            self.email_list.setStyleSheet("""
-                QListWidget {
-                    background-color: white;
-                    border: 1px solid #ddd;
-                    border-radius: 4px;
-                }
-                QListWidget::item {
-                    border-bottom: 1px solid #ccc;
-                    padding-top: 4px;
-                    padding-bottom: 4px;
-                    margin: 0px;
-                }
-                QListWidget::item:last-child {
-                    border-bottom: none;
-                }
-                QListWidget::item:selected {
-                    background-color: #e1f0ff;
-                    color: black;
-                    border-left: 3px solid #0078d4;
-                }
-                QListWidget::item:hover:!selected {
-                    background-color: #f5f5f5;
-                }
-            """)
+            # Shift/Ctrl-click select several messages for flag actions
+            self.email_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
             
             # Set custom delegate for rendering items
             self.email_list.setItemDelegate(EmailItemDelegate(self.email_list))
@@ -464,50 +821,67 @@ class EmailWindow(QMainWindow):
             list_layout.addWidget(self.email_list)
             
             self.splitter.addWidget(self.list_panel)
-            print(f"[EmailWindow.setup_email_list] Email list setup complete, id: {id(self.email_list)}")
+            logger.debug("Email list setup complete, id: %s", id(self.email_list))
             
             # Connect signals
             compose_button.clicked.connect(self.compose_email)
             self.email_list.itemClicked.connect(self.display_email)
             
+            # Re-target body prefetch once scrolling settles
+            self.prefetch_timer = QTimer(self)
+            self.prefetch_timer.setSingleShot(True)
+            self.prefetch_timer.setInterval(150)
+            self.prefetch_timer.timeout.connect(self.schedule_prefetch)
+            self.email_list.verticalScrollBar().valueChanged.connect(self.prefetch_timer.start)
+            self.email_list.verticalScrollBar().valueChanged.connect(self.load_more_history)
+            
+            # Watch for the first paint with rows, for startup timing
+            self.email_list.viewport().installEventFilter(self)
+            
             # If we have pending filtered emails, display them now
             if hasattr(self, 'filtered_emails') and self.filtered_emails:
-                print(f"[EmailWindow.setup_email_list] Displaying {len(self.filtered_emails)} pending filtered emails")
+                logger.debug("Displaying %s pending filtered emails", len(self.filtered_emails))
                 self.populate_email_list()
                 
         except Exception as e:
-            print(f"[EmailWindow.setup_ui] Error setting up email list: {str(e)}")
+            logger.error("Error setting up email list: %s", e)
             raise
             
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and self.email_list is not None \
+                and obj is self.email_list.viewport() and self.email_list.count():
+            obj.removeEventFilter(self)
+            instrumentation.milestone("inbox_rows_painted")
+        return super().eventFilter(obj, event)
+    
     def populate_email_list(self):
         """Populate the email list with filtered emails"""
         if not hasattr(self, 'email_list'):
-            print("[EmailWindow.populate_email_list] Email list attribute not found")
+            logger.debug("Email list attribute not found")
             return
             
         if self.email_list is None:
-            print("[EmailWindow.populate_email_list] Email list is None")
+            logger.debug("Email list is None")
             return
             
-        print(f"[EmailWindow.populate_email_list] Adding {len(self.filtered_emails)} emails to list, id: {id(self.email_list)}")
+        logger.debug("Adding %s emails to list, id: %s", len(self.filtered_emails), id(self.email_list))
         try:
-            self.email_list.clear()
-            
-            filtered_count = 0
-            for email_data in self.filtered_emails:
-                item = EmailListItem(email_data)
-                self.email_list.addItem(item)
-                filtered_count += 1
+            with instrumentation.span("populate"):
+                self.email_list.clear()
+                
+                filtered_count = 0
+                for email_data in self.filtered_emails:
+                    item = EmailListItem(email_data)
+                    self.email_list.addItem(item)
+                    filtered_count += 1
                 
-            print(f"[EmailWindow.populate_email_list] Added {filtered_count} emails to list")
+            logger.debug("Added %s emails to list", filtered_count)
         except Exception as e:
-            print(f"[EmailWindow.populate_email_list] Error populating list: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error populating list: %s", e)
             
     def setup_email_content(self):
         """Setup the email content panel"""
-        print("[EmailWindow.setup_ui] Setting up email content")
+        logger.debug("Setting up email content")
         try:
             self.content_panel = QWidget()
             content_layout = QVBoxLayout(self.content_panel)
@@ -515,30 +889,9 @@ class EmailWindow(QMainWindow):
             
             # Email header info
             header_widget = QWidget()
-            header_widget.setStyleSheet("""
-                QWidget {
-                    background-color: white;
-                    border: 1px solid #ddd;
-                    border-radius: 4px;
-                    margin-bottom: 10px;
-                }
-                QLabel {
-                    color: #444;
-                    font-size: 13px;
-                }
-                QLabel.header_label {
-                    font-weight: bold;
-                    color: #666;
-                    min-width: 60px;
-                    max-width: 60px;
-                }
-                QLabel.value_label {
-                    font-weight: normal;
-                }
-                QLabel#from_value {
-                    font-weight: bold;
-                }
-            """)
+            header_widget.setObjectName("email_header")
+            # Plain QWidgets only paint stylesheet borders with this set
+            header_widget.setAttribute(Qt.WidgetAttribute.WA_StyledBackground)
             header_layout = QVBoxLayout(header_widget)
             header_layout.setSpacing(5)
             header_layout.setContentsMargins(10, 10, 10, 10)
@@ -600,7 +953,6 @@ class EmailWindow(QMainWindow):
             date_value = QLabel("")
             date_value.setObjectName("date_value")
             date_value.setProperty("class", "value_label")
-            date_value.setStyleSheet("color: #666; font-weight: normal;")
             date_value.setWordWrap(True)
             date_row.addWidget(date_label)
             date_row.addWidget(date_value, 1)  # Give the value label stretch factor of 1
@@ -611,21 +963,13 @@ class EmailWindow(QMainWindow):
             separator = QFrame()
             separator.setFrameShape(QFrame.Shape.HLine)
             separator.setFrameShadow(QFrame.Shadow.Sunken)
-            separator.setStyleSheet("background-color: #ddd;")
+            separator.setObjectName("header_separator")
             header_layout.addWidget(separator)
             
             # Email content
             self.content_view = QTextEdit()
             self.content_view.setReadOnly(True)
-            self.content_view.setStyleSheet("""
-                QTextEdit {
-                    background-color: white;
-                    border: 1px solid #ddd;
-                    border-radius: 4px;
-                    padding: 10px;
-                    font-size: 13px;
-                }
-            """)
+            self.content_view.setObjectName("content_view")
             
             content_layout.addWidget(header_widget)
             content_layout.addWidget(self.content_view)
@@ -633,14 +977,14 @@ class EmailWindow(QMainWindow):
             self.splitter.addWidget(self.content_panel)
             self.splitter.setStretchFactor(0, 1)
             self.splitter.setStretchFactor(1, 2)
-            print("[EmailWindow.setup_ui] Email content setup complete")
+            logger.debug("Email content setup complete")
         except Exception as e:
-            print(f"[EmailWindow.setup_ui] Error setting up email content: {str(e)}")
+            logger.error("Error setting up email content: %s", e)
             raise
     
     def finalize_setup(self):
         """Finalize the UI setup"""
-        print("[EmailWindow.setup_ui] Finalizing setup")
+        logger.debug("Finalizing setup")
         try:
             # Add splitter to content layout
             self.content_layout.addWidget(self.splitter)
@@ -650,122 +994,366 @@ class EmailWindow(QMainWindow):
             
             # Setup status bar
             self.statusBar().showMessage("Loading emails...")
-            self.statusBar().setStyleSheet("""
-                QStatusBar {
-                    background-color: #f8f9fa;
-                    border-top: 1px solid #ddd;
-                    padding: 5px;
-                    color: #666;
-                }
-            """)
             
             # Connect search widget signals
-            self.search_widget.search_changed.connect(self.handle_search)
+            self.search_widget.search_ranked.connect(self.handle_search)
             self.search_widget.date_filter_changed.connect(self.handle_date_filter)
             
-            # Apply global styling
-            self.setStyleSheet("""
-                QMainWindow {
-                    background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
-                                             stop:0 #e6f2ff, stop:1 #ffffff);
-                }
-                QWidget#central_widget {
-                    background: transparent;
-                }
-                QSplitter::handle {
-                    background-color: #ddd;
-                    margin: 1px;
-                }
-                QSplitter::handle:hover {
-                    background-color: #ccc;
-                }
-                QListWidget, QTextEdit, QLineEdit {
-                    border-radius: 8px;
-                    border: 1px solid #ddd;
-                }
-                QPushButton {
-                    border-radius: 5px;
-                }
-            """)
-            
-            print("[EmailWindow.setup_ui] Setup complete")
+            logger.debug("Setup complete")
             
             # Mark UI as ready
             self.ui_ready = True
             
             # Check if we have an email list
-            if not hasattr(self, 'email_list') or not self.email_list:
-                print("[EmailWindow.finalize_setup] WARNING: Email list not initialized!")
+            if getattr(self, 'email_list', None) is None:
+                logger.warning("Email list not initialized!")
                 # Try to find the email list
                 try:
                     for child in self.findChildren(QListWidget, "email_list"):
                         self.email_list = child
-                        print(f"[EmailWindow.finalize_setup] Found email list widget, id: {id(self.email_list)}")
+                        logger.debug("Found email list widget, id: %s", id(self.email_list))
                         break
                 except Exception as e:
-                    print(f"[EmailWindow.finalize_setup] Error finding email list: {str(e)}")
+                    logger.error("Error finding email list: %s", e)
             
             # Process any pending emails
             if hasattr(self, 'pending_emails') and self.pending_emails:
-                print(f"[EmailWindow.finalize_setup] Processing {len(self.pending_emails)} pending emails")
+                logger.debug("Processing %s pending emails", len(self.pending_emails))
                 emails = self.pending_emails
                 self.pending_emails = None
-                QTimer.singleShot(200, lambda: self.handle_emails_fetched(emails))
+                QTimer.singleShot(0, lambda: self.handle_emails_fetched(emails))
                 
         except Exception as e:
-            print(f"[EmailWindow.setup_ui] Error during finalization: {str(e)}")
+            logger.error("Error during finalization: %s", e)
             raise
     
-    def handle_search(self, text):
-        """Filter emails based on search text"""
+    def handle_search(self, text, hits=None):
+        """Filter emails based on search text and its fuzzy index matches"""
         self.search_text = text.lower()
+        self.search_hits = hits
         self.apply_filters()
     
     def handle_date_filter(self, start_date, end_date):
         """Filter emails based on date range"""
         self.start_date = start_date
         self.end_date = end_date
+        if start_date and end_date:
+            # Whole days in local time; end is exclusive
+            self.date_bounds = (
+                QDateTime(start_date, QTime(0, 0)).toSecsSinceEpoch(),
+                QDateTime(end_date.addDays(1), QTime(0, 0)).toSecsSinceEpoch(),
+            )
+        else:
+            self.date_bounds = None
         self.apply_filters()
     
     def apply_filters(self):
         """Apply both search and date filters"""
-        if not hasattr(self, 'email_list') or not self.email_list:
-            print("[EmailWindow.apply_filters] Email list not ready")
+        if getattr(self, 'email_list', None) is None:
+            logger.debug("Email list not ready")
             return
             
         if not hasattr(self, 'emails') or not self.emails:
-            print("[EmailWindow.apply_filters] No emails to filter")
+            logger.debug("No emails to filter")
             return
             
-        print(f"[EmailWindow.apply_filters] Applying filters to {len(self.emails)} emails")
+        logger.debug("Applying filters to %s emails", len(self.emails))
         
         # Apply filters to create filtered_emails list
-        self.filtered_emails = []
-        for email_data in self.emails:
-            # Apply search filter
-            searchable_text = (
-                f"{email_data['subject']} {email_data['from']} "
-                f"{email_data['content']}"
-            ).lower()
-            
-            if self.search_text and self.search_text not in searchable_text:
-                continue
-            
-            # Apply date filter
-            if self.start_date and self.end_date:
-                date = QDateTime.fromString(
-                    email_data['date'],
-                    Qt.DateFormat.TextDate
-                )
-                if not (self.start_date <= date.date() <= self.end_date):
-                    continue
-            
-            # Add matching email to filtered list
-            self.filtered_emails.append(email_data)
+        with instrumentation.span("filter"):
+            self.filtered_emails, self.filtered_keys = self.filter_rows()
         
         # Populate the email list with filtered emails
         self.populate_email_list()
-        print(f"[EmailWindow.apply_filters] Displayed {len(self.filtered_emails)} emails after filtering")
+        logger.debug("Displayed %s emails after filtering", len(self.filtered_emails))
+        self.schedule_prefetch()
+    
+    def filter_rows(self):
+        """Messages passing the filters in display order, and their sort keys"""
+        order_index = self.sort_indexes.get(self.sort_order)
+        if self.smart_folder is not None:
+            # Members are already known and kept in order; only the view's
+            # own filters remain
+            members = self.smart_folders.ordered(self.smart_folder, self.sort_order)
+            emails, keys = members.emails, members.keys
+            if not self.search_text and not self.date_bounds:
+                return list(emails), list(keys)
+            matches = self.matches_view_filters
+        elif order_index is None:
+            # Date order: the date filter is one slice found in the header table
+            lo, hi = 0, len(self.emails)
+            if self.date_bounds:
+                lo, hi = self.header_table.date_range(*self.date_bounds)
+            emails, keys = self.emails[lo:hi], self.email_keys[lo:hi]
+            if not self.search_text:
+                return emails, keys
+            matches = self.matches_search
+        else:
+            emails, keys = order_index.emails, order_index.keys
+            matches = self.matches_view_filters
+        rows = [(email_data, key) for email_data, key in zip(emails, keys) if matches(email_data)]
+        return [email_data for email_data, _ in rows], [key for _, key in rows]
+    
+    def handle_folder_changed(self, index):
+        """Show the mailbox or one of the smart folders"""
+        self.smart_folder = self.folder_combo.itemData(index)
+        self.apply_filters()
+    
+    def update_folder_labels(self):
+        """Refresh the folder box: one entry per smart folder, with unread counts"""
+        combo = getattr(self, 'folder_combo', None)
+        if combo is None:
+            return
+        names = [search.name for search in self.smart_folders]
+        if [combo.itemData(i) for i in range(1, combo.count())] != names:
+            combo.blockSignals(True)
+            while combo.count() > 1:
+                combo.removeItem(1)
+            for name in names:
+                combo.addItem(name, name)
+            if self.smart_folder not in names:
+                self.smart_folder = None
+            combo.setCurrentIndex(names.index(self.smart_folder) + 1 if self.smart_folder else 0)
+            combo.blockSignals(False)
+        combo.setVisible(bool(names))
+        for i, name in enumerate(names, 1):
+            unread = self.smart_folders.unread[name]
+            combo.setItemText(i, f"{name} ({unread})" if unread else name)
+    
+    def save_smart_folder(self):
+        """Save the current search text and date range as a smart folder"""
+        name, ok = QInputDialog.getText(self, "Save Search", "Smart folder name:")
+        name = name.strip()
+        if not ok or not name:
+            return
+        search = SavedSearch(
+            name,
+            keyword=self.search_text,
+            since=self.start_date.toString(Qt.DateFormat.ISODate) if self.date_bounds else None,
+            until=self.end_date.toString(Qt.DateFormat.ISODate) if self.date_bounds else None,
+        )
+        self.smart_folders.add_search(search, self.emails)
+        self.update_folder_labels()
+        self.folder_combo.setCurrentIndex(self.folder_combo.findData(name))
+    
+    def delete_smart_folder(self):
+        """Delete the smart folder being shown"""
+        if self.smart_folder is None:
+            QMessageBox.information(self, "Smart Folders", "Open a smart folder to delete it.")
+            return
+        self.smart_folders.remove_search(self.smart_folder)
+        self.smart_folder = None
+        self.update_folder_labels()
+        self.apply_filters()
+    
+    def handle_sort_changed(self, index):
+        """Show the list in the order picked in the sort box"""
+        name = self.sort_combo.itemData(index)
+        if not name or name == self.sort_order:
+            return
+        self.sort_order = name
+        if name != "date" and name not in self.sort_indexes:
+            # Built once; kept up to date as mail comes and goes
+            with instrumentation.span("sort"):
+                self.sort_indexes[name] = SortIndex(SORT_ORDERS[name].key, self.emails)
+        self.apply_filters()
+    
+    def matches_filters(self, email_data):
+        """Whether a message belongs in the list being shown"""
+        if self.smart_folder is not None \
+                and not self.smart_folders.contains(self.smart_folder, email_data):
+            return False
+        return self.matches_view_filters(email_data)
+    
+    def matches_view_filters(self, email_data):
+        """Whether a message passes the current search and date filters"""
+        # Apply date filter on the date parsed at ingest
+        if self.date_bounds:
+            start, end = self.date_bounds
+            if not start <= email_data['parsed_date'].toSecsSinceEpoch() < end:
+                return False
+        return self.matches_search(email_data)
+    
+    def matches_search(self, email_data):
+        """Whether a message passes the current search text"""
+        # Fuzzy sender/subject matches from the index, else a substring of
+        # the text; lazily loaded bodies are searched while they are in
+        # the cache's memory tier
+        if not self.search_text or (self.search_hits is not None
+                                    and row_key(email_data) in self.search_hits):
+            return True
+        return self.contains_text(email_data, self.search_text)
+    
+    def matches_text(self, email_data, text):
+        """The search box's test for any text; smart folder keywords use it too"""
+        if self.search_index.score(row_key(email_data), text):
+            return True
+        return self.contains_text(email_data, text.lower())
+    
+    def contains_text(self, email_data, text):
+        """Whether lowercase text is in a message's subject, sender or body"""
+        content = email_data['content']
+        if not content and 'uid' in email_data:
+            content = self.body_cache.peek(body_key(email_data)) or ""
+        searchable_text = (
+            f"{email_data['subject']} {email_data['from']} "
+            f"{content}"
+        ).lower()
+        return text in searchable_text
+    
+    def retest_text(self, email_data):
+        """Re-test a message whose body became searchable; False if no search uses text"""
+        if not self.search_text and not any(search.keyword for search in self.smart_folders):
+            return False
+        self.smart_folders.retest(email_data)
+        if getattr(self, 'email_list', None) is None:
+            return True
+        key = self._row_key(email_data)
+        row = self._find_row(email_data, key)
+        shown = self.matches_filters(email_data)
+        if row < 0 and shown:
+            self._show_row(email_data, SORT_ORDERS[self.sort_order].key(email_data))
+        elif row >= 0 and not shown:
+            self._hide_row(email_data, key)
+        return True
+    
+    def schedule_prefetch(self):
+        """Point the prefetcher at visible rows, the selection's neighbours and unread mail"""
+        if not self.prefetcher or not hasattr(self, 'email_list') or self.email_list is None:
+            return
+        
+        count = self.email_list.count()
+        if not count:
+            return
+        
+        def uid_at(row):
+            item = self.email_list.item(row)
+            return item.email_data.get('uid') if item else None
+        
+        viewport = self.email_list.viewport().rect()
+        top = self.email_list.indexAt(viewport.topLeft()).row()
+        bottom = self.email_list.indexAt(viewport.bottomLeft()).row()
+        top = max(top, 0)
+        bottom = count - 1 if bottom < 0 else bottom
+        visible = [uid_at(row) for row in range(top, bottom + 1)]
+        
+        current = self.email_list.currentRow()
+        neighbours = []
+        if current >= 0:
+            for offset in (1, -1, 2, -2):
+                if 0 <= current + offset < count:
+                    neighbours.append(uid_at(current + offset))
+        
+        unread = [
+            email['uid'] for email in self.filtered_emails
+            if 'uid' in email and '\\Seen' not in email.get('flags', ())
+        ]
+        
+        self.prefetcher.update_targets(
+            [uid for uid in visible if uid is not None],
+            [uid for uid in neighbours if uid is not None],
+            unread,
+        )
+    
+    def load_more_history(self, *_):
+        """Fetch the next page of older headers when the list is scrolled near the bottom"""
+        self.history_auto_pages = 0
+        self._load_history_page()
+    
+    def load_older_messages(self):
+        """Fetch the next page of older headers wherever the list is scrolled"""
+        self.history_auto_pages = 0
+        self._load_history_page(force=True)
+    
+    def continue_history(self):
+        """Fetch another page if the last one didn't fill the list, a few pages at most"""
+        if self.history_auto_pages >= HISTORY_AUTO_PAGES:
+            loader = self.history_loader
+            if loader and not loader.exhausted and self._near_list_bottom():
+                self.statusBar().showMessage(
+                    "Use View > Load Older Messages or scroll down to look further back"
+                )
+            return
+        if self._load_history_page():
+            self.history_auto_pages += 1
+    
+    def _near_list_bottom(self):
+        scrollbar = self.email_list.verticalScrollBar()
+        return scrollbar.maximum() - scrollbar.value() <= scrollbar.pageStep()
+    
+    def _load_history_page(self, force=False):
+        loader = self.history_loader
+        if not loader or loader.busy or loader.exhausted:
+            return False
+        if getattr(self, 'email_list', None) is None or self.oldest_uid is None:
+            return False
+        if not force and not self._near_list_bottom():
+            return False
+        # Hidden messages count too, or a page of them would be fetched again
+        if not loader.load_before(self.oldest_uid):
+            return False
+        self.statusBar().showMessage("Loading older messages...")
+        return True
+    
+    def handle_history_page(self, emails):
+        """Append a page of older headers to the list"""
+        if not emails:
+            self.statusBar().showMessage("No older messages")
+            return
+        if getattr(self, 'email_list', None) is None:
+            # oldest_uid is unchanged, so the next scroll asks for it again
+            logger.warning("Dropped a history page of %s messages: the list isn't set up yet",
+                           len(emails))
+            return
+        if self.email_list.count() != len(self.filtered_emails):
+            # Rows are inserted by position in filtered_emails; redraw the
+            # list from it before merging so the page lands in the right place
+            logger.warning("Message list out of step (%s rows, %s shown); redrawing it",
+                           self.email_list.count(), len(self.filtered_emails))
+            self.populate_email_list()
+        
+        emails = self.visible_emails(emails)
+        self.prepare_emails(emails)
+        known = {row_key(email) for email in self.emails}
+        inserted = 0
+        # Restoring the scroll position is not the user scrolling
+        auto_pages = self.history_auto_pages
+        with instrumentation.span("populate"):
+            anchor = self._scroll_anchor()
+            for email in emails:
+                if row_key(email) not in known:
+                    self._insert_email(email)
+                    inserted += 1
+            self._restore_scroll(anchor)
+        self.history_auto_pages = auto_pages
+        instrumentation.count("rows_inserted", inserted)
+        self.statusBar().showMessage(f"Loaded {inserted} older messages")
+        
+        self.update_folder_labels()
+        self.schedule_prefetch()
+        # Keep going if the page didn't fill the view, e.g. under a filter
+        QTimer.singleShot(0, self.continue_history)
+    
+    def handle_history_failed(self, error):
+        self.statusBar().showMessage(f"Could not load older messages: {error}")
+    
+    def handle_bodies_ready(self, bodies):
+        """Cache prefetched bodies and show the one the user is waiting for"""
+        retested = False
+        for email_data in getattr(self, 'emails', []):
+            uid = email_data.get('uid')
+            if uid in bodies:
+                self.body_cache.put(body_key(email_data), bodies[uid]['content'])
+                retested |= self.retest_text(email_data)
+        if retested:
+            self.update_folder_labels()
+        
+        if self.displayed_uid in bodies:
+            self.content_view.setText(bodies[self.displayed_uid]['content'])
+    
+    def handle_prefetch_failed(self, uids, error):
+        if self.displayed_uid in uids:
+            self.content_view.setText(f"Could not load message: {error}")
     
     def display_email(self, item):
         """Display the selected email's content"""
@@ -786,9 +1374,9 @@ class EmailWindow(QMainWindow):
                     # Just use the raw date string as fallback
                     formatted_date = date_str
             else:
-                print("Date field missing in email data for preview")
+                logger.debug("Date field missing in email data for preview")
         except Exception as e:
-            print(f"Error formatting date for preview: {str(e)}")
+            logger.error("Error formatting date for preview: %s", e)
         
         # Set the email details
         self.email_values['from'].setText(email_data['from'])
@@ -799,8 +1387,24 @@ class EmailWindow(QMainWindow):
         to_field = email_data.get('to', self.email)
         self.email_values['to'].setText(to_field)
         
-        # Set the email content
-        self.content_view.setText(email_data['content'])
+        # Set the email content, fetching the body first if needed
+        uid = email_data.get('uid')
+        self.displayed_uid = uid
+        content = email_data['content']
+        if uid is not None:
+            searchable = self.body_cache.peek(body_key(email_data)) is not None
+            content = self.body_cache.get(body_key(email_data))
+            # Read back from disk, the body is searchable again
+            if content is not None and not searchable and self.retest_text(email_data):
+                self.update_folder_labels()
+        if content is None and self.prefetcher:
+            self.content_view.setText("Loading message...")
+            # It may have been evicted since it was prefetched
+            self.prefetcher.forget([uid])
+            self.prefetcher.request(uid)
+        else:
+            self.content_view.setText(content or "")
+        self.schedule_prefetch()
     
     def compose_email(self):
         """Open the compose email dialog"""
@@ -808,8 +1412,16 @@ class EmailWindow(QMainWindow):
             QMessageBox.warning(self, "Error", "Email handler not initialized")
             return
         
-        dialog = ComposeDialog(self.email_handler, self)
-        if dialog.exec():
+        from compose_dialog import ComposeDialog
+        # Messages go out through the journal, so sending never waits on the server
+        outbox = self.journal_sync.send if self.journal_sync else None
+        dialog = ComposeDialog(self.email_handler, self, outbox)
+        if dialog.exec() and outbox is not None:
+            if self.journal_sync.offline:
+                self.statusBar().showMessage("Offline: the message will be sent once the server is back")
+            else:
+                self.statusBar().showMessage("Sending...")
+        elif dialog.result():
             QMessageBox.information(
                 self,
                 "Success",
@@ -839,6 +1451,251 @@ class EmailWindow(QMainWindow):
         # Add Switch Accounts action
         switch_accounts_action = edit_menu.addAction("Switch Accounts")
         switch_accounts_action.triggered.connect(self.show_coming_soon)
+        
+        # Add flag actions for the selected messages
+        edit_menu.addSeparator()
+        mark_read_action = edit_menu.addAction("Mark as Read")
+        mark_read_action.setShortcut(QKeySequence("Ctrl+Shift+R"))
+        mark_read_action.triggered.connect(self.mark_read)
+        mark_unread_action = edit_menu.addAction("Mark as Unread")
+        mark_unread_action.setShortcut(QKeySequence("Ctrl+Shift+U"))
+        mark_unread_action.triggered.connect(self.mark_unread)
+        star_action = edit_menu.addAction("Star / Unstar")
+        star_action.setShortcut(QKeySequence("Ctrl+Shift+S"))
+        star_action.triggered.connect(self.toggle_star)
+        archive_action = edit_menu.addAction("Archive")
+        archive_action.setShortcut(QKeySequence("Ctrl+Shift+A"))
+        archive_action.triggered.connect(self.archive_selected)
+        delete_action = edit_menu.addAction("Delete")
+        delete_action.setShortcut(QKeySequence(QKeySequence.StandardKey.Delete))
+        delete_action.triggered.connect(self.delete_selected)
+        
+        # Add bulk cleanup actions
+        edit_menu.addSeparator()
+        archive_sender_action = edit_menu.addAction("Archive All from Sender")
+        archive_sender_action.triggered.connect(lambda: self.bulk_from_sender("archive"))
+        delete_sender_action = edit_menu.addAction("Delete All from Sender")
+        delete_sender_action.triggered.connect(lambda: self.bulk_from_sender("delete"))
+        delete_old_action = edit_menu.addAction("Delete Mail Older Than...")
+        delete_old_action.triggered.connect(self.delete_older_than)
+        
+        # Create View menu
+        view_menu = menu_bar.addMenu("View")
+        
+        # Add Diagnostics action
+        diagnostics_action = view_menu.addAction("Diagnostics")
+        diagnostics_action.triggered.connect(self.show_diagnostics)
+        
+        load_older_action = view_menu.addAction("Load Older Messages")
+        load_older_action.setShortcut(QKeySequence("Ctrl+Shift+L"))
+        load_older_action.triggered.connect(self.load_older_messages)
+        
+        # Add smart folder actions
+        view_menu.addSeparator()
+        save_search_action = view_menu.addAction("Save Search as Smart Folder...")
+        save_search_action.triggered.connect(self.save_smart_folder)
+        delete_folder_action = view_menu.addAction("Delete Smart Folder")
+        delete_folder_action.triggered.connect(self.delete_smart_folder)
+    
+    def selected_emails(self):
+        if getattr(self, 'email_list', None) is None:
+            return []
+        return [item.email_data for item in self.email_list.selectedItems()]
+    
+    def set_flag(self, flag, add, emails=None):
+        """Set (add) or clear a flag on messages, here at once and on the server once it answers"""
+        emails = self.selected_emails() if emails is None else emails
+        emails = [email for email in emails
+                  if 'uid' in email and (flag in email.get('flags', ())) != add]
+        if not emails:
+            return
+        with instrumentation.span("populate"):
+            anchor = self._scroll_anchor()
+            for email in emails:
+                flags = [f for f in email.get('flags', ()) if f != flag]
+                if add:
+                    flags.append(flag)
+                if flag == '\\Deleted':
+                    # Deleted messages leave the list, as they do on refresh
+                    self._remove_email(email)
+                    email['flags'] = flags
+                else:
+                    self._set_flags(email, flags)
+            self._restore_scroll(anchor)
+        if self.journal_sync:
+            self.journal_sync.change(emails, flag, add)
+        self.update_folder_labels()
+    
+    def mark_read(self):
+        self.set_flag('\\Seen', True)
+    
+    def mark_unread(self):
+        self.set_flag('\\Seen', False)
+    
+    def toggle_star(self):
+        """Star the selection, or unstar it if it is all starred already"""
+        emails = self.selected_emails()
+        starred = all('\\Flagged' in email.get('flags', ()) for email in emails)
+        self.set_flag('\\Flagged', not starred, emails)
+    
+    def archive_selected(self):
+        self.move_selected("archive")
+    
+    def delete_selected(self):
+        self.move_selected("delete")
+    
+    def move_selected(self, action):
+        """Confirm, then archive or delete the selection: here at once, on the server once it answers"""
+        emails = [email for email in self.selected_emails() if 'uid' in email]
+        if not self.journal_sync or not emails:
+            return
+        answer = QMessageBox.question(self, action.title(), f"{action.title()} {len(emails)} messages?")
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        self.drop_emails(emails)
+        self.journal_sync.move(emails, action)
+    
+    def drop_emails(self, emails):
+        """Remove messages that left the folder from the list and indexes"""
+        with instrumentation.span("populate"):
+            anchor = self._scroll_anchor()
+            for email in emails:
+                self._remove_email(email)
+            self._restore_scroll(anchor)
+        self.update_folder_labels()
+    
+    def bulk_from_sender(self, action):
+        """Archive or delete all mail from the selected message's sender"""
+        selected = self.selected_emails()
+        if not selected:
+            self.statusBar().showMessage("Select a message from the sender first")
+            return
+        address = selected[0].get('from_address') or selected[0]['from']
+        # The header table finds the loaded ones; the server SEARCH the rest
+        emails = [self.emails[row] for row in self.header_table.sender_rows(address)]
+        self.start_bulk(
+            action, emails, ("FROM", quote(address)),
+            f"{action.title()} all mail from {address}? "
+            f"{len(emails)} messages are loaded; older ones on the server are included."
+        )
+    
+    def delete_older_than(self):
+        days, ok = QInputDialog.getInt(
+            self, "Delete Old Mail", "Delete mail older than (days):", 365, 1, 36500
+        )
+        if not ok:
+            return
+        cutoff = QDate.currentDate().addDays(-days)
+        # Undated mail sits at the epoch; leave it alone
+        lo, hi = self.header_table.date_range(1, QDateTime(cutoff, QTime(0, 0)).toSecsSinceEpoch())
+        self.start_bulk(
+            "delete", self.emails[lo:hi], ("SENTBEFORE", search_date(cutoff.toPyDate())),
+            f"Delete all mail from before {cutoff.toString('MM/dd/yyyy')}? "
+            f"{hi - lo} messages are loaded; older ones on the server are included."
+        )
+    
+    def start_bulk(self, action, emails, criteria=(), description=""):
+        """Confirm, then archive or delete messages (and server matches) in chunks"""
+        uids = tuple(email['uid'] for email in emails if 'uid' in email)
+        if not self.bulk_ops or not (uids or criteria):
+            return
+        if self.bulk_ops.busy:
+            self.statusBar().showMessage("Another bulk action is still running")
+            return
+        answer = QMessageBox.question(self, action.title(), description)
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        self.bulk_ops.start(BulkJob(action, uids, tuple(criteria)))
+        self.bulk_progress = QProgressDialog(f"{action.title()} in progress...", "Cancel", 0, 0, self)
+        self.bulk_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.bulk_progress.setMinimumDuration(500)
+        self.bulk_progress.canceled.connect(self.bulk_ops.cancel)
+    
+    def handle_bulk_progress(self, uids, done, total):
+        """Drop the messages a chunk moved, as the server just did"""
+        moved = set(uids)
+        self.drop_emails([email for email in self.emails if email.get('uid') in moved])
+        if self.bulk_progress is not None:
+            self.bulk_progress.setMaximum(total)
+            self.bulk_progress.setValue(done)
+    
+    def close_bulk_progress(self):
+        if self.bulk_progress is not None:
+            self.bulk_progress.canceled.disconnect()
+            self.bulk_progress.close()
+            self.bulk_progress = None
+    
+    def handle_bulk_finished(self, job, done, error, offline):
+        self.close_bulk_progress()
+        verb = "Archived" if job.action == "archive" else "Deleted"
+        left = set(job.uids)
+        emails = [email for email in self.emails if email.get('uid') in left]
+        if offline and emails and self.journal_sync:
+            # The loaded messages go now and reach the server with the journal;
+            # the ones only a server search finds need running the action again
+            self.drop_emails(emails)
+            self.journal_sync.move(emails, job.action)
+            self.statusBar().showMessage(
+                f"{verb} {done} messages; {len(emails)} more will follow once the server is back"
+            )
+        elif error:
+            self.statusBar().showMessage(f"{verb} {done} messages, then stopped: {error}")
+        else:
+            self.statusBar().showMessage(f"{verb} {done} messages")
+    
+    def handle_flags_failed(self, changes, error):
+        """Roll back flag changes the server did not take"""
+        by_uid = {email['uid']: email for email in self.emails if 'uid' in email}
+        for uid, flag, add in changes:
+            email = by_uid.get(uid)
+            if email is None:
+                # Deleted here; the next refresh brings it back
+                continue
+            flags = [f for f in email.get('flags', ()) if f != flag]
+            if not add:
+                flags.append(flag)
+            self._set_flags(email, flags)
+        self.update_folder_labels()
+        self.statusBar().showMessage(f"Could not update {len(changes)} messages: {error}")
+    
+    def handle_moves_failed(self, uids, error):
+        """Messages that stayed put on the server come back with the next refresh"""
+        self.statusBar().showMessage(f"Could not move {len(uids)} messages: {error}")
+        self.refresh_emails()
+    
+    def handle_message_sent(self, subject):
+        self.statusBar().showMessage(f"Sent \"{subject}\"")
+        self.refresh_emails()
+    
+    def handle_message_unsent(self, subject, error):
+        QMessageBox.warning(self, "Error", f"Failed to send \"{subject}\": {error}")
+    
+    def show_diagnostics(self):
+        """Show the timing diagnostics panel"""
+        if not hasattr(self, 'diagnostics_panel'):
+            from diagnostics_panel import DiagnosticsPanel
+            self.diagnostics_panel = DiagnosticsPanel(self)
+        self.diagnostics_panel.show()
+        self.diagnostics_panel.raise_()
+    
+    def closeEvent(self, event):
+        if self.prefetcher:
+            self.prefetcher.stop()
+            self.prefetcher = None
+        if self.bridge:
+            self.bridge.stop()
+            self.bridge = None
+        if self.history_loader:
+            self.history_loader.stop()
+            self.history_loader = None
+        if self.journal_sync:
+            self.journal_sync.stop()
+            self.journal_sync = None
+        self.journal.close()
+        if self.bulk_ops:
+            self.bulk_ops.stop()
+            self.bulk_ops = None
+        super().closeEvent(event)
     
     def handle_logout(self):
         # Close this window and show login window
@@ -850,8 +1707,19 @@ class EmailWindow(QMainWindow):
     def show_coming_soon(self):
         QMessageBox.information(self, "Coming Soon", "This feature is coming soon!")
 
+def index_text(email_data):
+    """Text the fuzzy search index holds for a message"""
+    labels = " ".join(email_data.get('labels', ()))
+    return f"{email_data.get('from') or ''} {email_data.get('subject') or ''} {labels}"
+
+
 def parse_date(date_str):
     """Parse date string into QDateTime object using multiple formats"""
+    with instrumentation.span("date_parse"):
+        return _parse_date(date_str)
+
+
+def _parse_date(date_str):
     # Try parsing with Qt.DateFormat.TextDate first
     date = QDateTime.fromString(date_str, Qt.DateFormat.TextDate)
     
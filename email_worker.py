@@ -1,5 +1,8 @@
 from PyQt6.QtCore import QObject, pyqtSignal
-from email_handler import EmailHandler
+from email_handler import EmailHandler, is_connection_error
+from logging_config import get_logger
+
+logger = get_logger("email_worker")
 
 
 class EmailWorker(QObject):
@@ -7,6 +10,8 @@ class EmailWorker(QObject):
     
     finished = pyqtSignal()
     error = pyqtSignal(str)
+    # The server couldn't be reached; the app carries on offline
+    disconnected = pyqtSignal(str)
     emails_fetched = pyqtSignal(list)
     email_sent = pyqtSignal(bool)
     connected = pyqtSignal(bool, EmailHandler)
@@ -14,57 +19,63 @@ class EmailWorker(QObject):
     def __init__(self):
         super().__init__()
         self.handler = None
-        print("[EmailWorker.__init__] Worker created")
+        logger.debug("Worker created")
     
-    def connect_account(self, email, password):
-        """Connect to email account"""
-        print("[EmailWorker.connect_account] Attempting to connect")
+    def connect_account(self, email, password, profile=None, **options):
+        """Connect to email account; options are passed to EmailHandler"""
+        logger.debug("Attempting to connect")
         try:
-            print("[EmailWorker.connect_account] Creating handler")
-            self.handler = EmailHandler(email, password)
-            print("[EmailWorker.connect_account] Connecting to email server")
+            logger.debug("Creating handler")
+            self.handler = EmailHandler(email, password, profile, **options)
+            logger.debug("Connecting to email server")
             success = self.handler.connect()
-            print(f"[EmailWorker.connect_account] Connection result: {success}")
+            logger.debug("Connection result: %s", success)
             self.connected.emit(success, self.handler if success else None)
         except Exception as e:
-            print(f"[EmailWorker.connect_account] Error: {str(e)}")
+            logger.error("Error: %s", e)
             self.error.emit(str(e))
         finally:
-            print("[EmailWorker.connect_account] Emitting finished signal")
+            logger.debug("Emitting finished signal")
             self.finished.emit()
     
-    def fetch_emails(self, limit=50):
-        """Fetch emails in background"""
-        print(f"[EmailWorker.fetch_emails] Fetching {limit} emails")
+    def fetch_emails(self, limit=50, headers_only=False):
+        """Fetch emails in background; headers_only leaves bodies for later"""
+        logger.debug("Fetching %s emails", limit)
         try:
             if not self.handler:
                 raise Exception("Email handler not initialized")
             
-            print("[EmailWorker.fetch_emails] Getting emails from handler")
-            emails = self.handler.get_emails(limit=limit)
-            print(f"[EmailWorker.fetch_emails] Found {len(emails)} emails")
+            logger.debug("Getting emails from handler")
+            if headers_only:
+                emails = self.handler.get_headers(limit=limit)
+            else:
+                emails = self.handler.get_emails(limit=limit)
+            logger.debug("Found %s emails", len(emails))
             self.emails_fetched.emit(emails)
         except Exception as e:
-            print(f"[EmailWorker.fetch_emails] Error: {str(e)}")
-            self.error.emit(str(e))
+            logger.error("Error: %s", e)
+            if is_connection_error(e):
+                self.disconnected.emit(str(e))
+            else:
+                self.error.emit(str(e))
         finally:
-            print("[EmailWorker.fetch_emails] Emitting finished signal")
+            logger.debug("Emitting finished signal")
             self.finished.emit()
     
     def send_email(self, to_addr, subject, body):
         """Send email in background"""
-        print("[EmailWorker.send_email] Attempting to send email")
+        logger.debug("Attempting to send email")
         try:
             if not self.handler:
                 raise Exception("Email handler not initialized")
             
-            print("[EmailWorker.send_email] Sending email via handler")
+            logger.debug("Sending email via handler")
             success = self.handler.send_email(to_addr, subject, body)
-            print(f"[EmailWorker.send_email] Send result: {success}")
+            logger.debug("Send result: %s", success)
             self.email_sent.emit(success)
         except Exception as e:
-            print(f"[EmailWorker.send_email] Error: {str(e)}")
+            logger.error("Error: %s", e)
             self.error.emit(str(e))
         finally:
-            print("[EmailWorker.send_email] Emitting finished signal")
+            logger.debug("Emitting finished signal")
             self.finished.emit() 
\ No newline at end of file
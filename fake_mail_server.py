@@ -0,0 +1,1058 @@
+"""
+In-process IMAP4rev1 and SMTP stand-in servers for benchmarks.
+
+The servers speak enough of both protocols for EmailHandler to log in, sync,
+search and send. Each server counts bytes, commands and round trips, and can
+inject per-round-trip latency and a bandwidth cap to mimic remote links.
+set_offline() drops every session and refuses new ones until turned off
+again, to mimic a lost connection.
+"""
+
+import base64
+import email
+import re
+import select
+import socket
+import socketserver
+import sys
+import threading
+import time
+import zlib
+from email import policy
+from email.utils import parseaddr, parsedate_to_datetime
+from typing import Dict, List, Optional
+
+from provider_profiles import ProviderProfile, ServerSettings
+
+CAPABILITIES = ("IMAP4rev1 LITERAL+ UIDPLUS MOVE SPECIAL-USE CONDSTORE ENABLE AUTH=PLAIN "
+                "COMPRESS=DEFLATE")
+
+# RFC 6154 attributes of the default folders
+SPECIAL_USE = {"Sent": "\\Sent", "Archive": "\\Archive", "Trash": "\\Trash"}
+
+SYSTEM_FLAGS = ("\\Seen", "\\Answered", "\\Flagged", "\\Deleted", "\\Draft")
+
+
+def normalize_crlf(raw: bytes) -> bytes:
+    return raw.replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+
+
+class FakeMessage:
+    def __init__(self, uid: int, raw: bytes, flags=None):
+        self.uid = uid
+        self.raw = normalize_crlf(raw)
+        self.flags = set(flags or ())
+        # CONDSTORE mod-sequence, bumped whenever the flags change
+        self.modseq = 0
+        self._parsed = None
+        self._bodystructure = None
+        self._date = False
+
+    @property
+    def parsed(self):
+        if self._parsed is None:
+            self._parsed = email.message_from_bytes(self.raw, policy=policy.compat32)
+        return self._parsed
+
+    @property
+    def bodystructure(self) -> str:
+        if self._bodystructure is None:
+            self._bodystructure = _bodystructure(self.parsed)
+        return self._bodystructure
+
+    @property
+    def header_bytes(self) -> bytes:
+        end = self.raw.find(b"\r\n\r\n")
+        return self.raw if end < 0 else self.raw[:end + 4]
+
+    @property
+    def text_bytes(self) -> bytes:
+        end = self.raw.find(b"\r\n\r\n")
+        return b"" if end < 0 else self.raw[end + 4:]
+
+    def date(self):
+        if self._date is False:
+            try:
+                self._date = parsedate_to_datetime(self.parsed["date"]).date()
+            except (TypeError, ValueError):
+                self._date = None
+        return self._date
+
+
+class FakeFolder:
+    def __init__(self, name: str, uidvalidity: int = 1):
+        self.name = name
+        self.uidvalidity = uidvalidity
+        self.next_uid = 1
+        self.highest_modseq = 1
+        self.messages: List[FakeMessage] = []
+
+    def append(self, raw: bytes, flags=None) -> FakeMessage:
+        message = FakeMessage(self.next_uid, raw, flags)
+        self.next_uid += 1
+        self.messages.append(message)
+        self.touch(message)
+        return message
+
+    def touch(self, message: FakeMessage):
+        """Give a changed message the folder's next mod-sequence."""
+        self.highest_modseq += 1
+        message.modseq = self.highest_modseq
+
+
+class FakeMailStore:
+    """Folders shared by every IMAP and SMTP connection"""
+
+    def __init__(self, username: str = "me@local.test", password: str = "secret"):
+        self.username = username
+        self.password = password
+        self.lock = threading.RLock()
+        self.folders: Dict[str, FakeFolder] = {}
+        for name in ("INBOX", "Sent", "Archive", "Trash"):
+            self.create_folder(name)
+
+    def create_folder(self, name: str) -> FakeFolder:
+        with self.lock:
+            if name not in self.folders:
+                self.folders[name] = FakeFolder(name, uidvalidity=len(self.folders) + 1)
+            return self.folders[name]
+
+    def folder(self, name: str) -> Optional[FakeFolder]:
+        if name.upper() == "INBOX":
+            name = "INBOX"
+        return self.folders.get(name)
+
+    def seed(self, messages: List[bytes], folder: str = "INBOX"):
+        with self.lock:
+            target = self.create_folder(folder)
+            for raw in messages:
+                target.append(raw)
+
+
+class ServerStats:
+    """Thread-safe traffic counters for one server"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.bytes_in = 0
+            self.bytes_out = 0
+            # Protocol bytes before compression; equal to the wire bytes
+            # unless a session negotiated COMPRESS
+            self.payload_in = 0
+            self.payload_out = 0
+            self.commands = 0
+            self.round_trips = 0
+
+    def add(self, bytes_in: int = 0, bytes_out: int = 0, commands: int = 0,
+            round_trips: int = 0, payload_in: int = 0, payload_out: int = 0):
+        with self.lock:
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.payload_in += payload_in
+            self.payload_out += payload_out
+            self.commands += commands
+            self.round_trips += round_trips
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "payload_in": self.payload_in,
+                "payload_out": self.payload_out,
+                "commands": self.commands,
+                "round_trips": self.round_trips,
+            }
+
+
+class _ServerBase(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, handler, store, latency, bandwidth):
+        self.store = store
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.stats = ServerStats()
+        self.offline = False
+        self.sessions = set()
+        self.sessions_lock = threading.Lock()
+        super().__init__(address, handler)
+
+    def verify_request(self, request, client_address) -> bool:
+        return not self.offline
+
+    def handle_error(self, request, client_address):
+        # A client hanging up, or set_offline() cutting it off, is not a bug
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def set_offline(self, offline: bool):
+        """Refuse connections, and cut the open ones, while offline."""
+        self.offline = offline
+        if offline:
+            with self.sessions_lock:
+                sessions = list(self.sessions)
+            for request in sessions:
+                try:
+                    request.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class _LinkHandler(socketserver.BaseRequestHandler):
+    """Common plumbing for latency injection and traffic accounting
+
+    Responses are buffered and flushed only when the handler needs more input
+    from the client, so a whole response, or the responses to a whole batch
+    of pipelined commands, goes out in one write. Nagle is off, so that
+    write isn't held back waiting for an ACK. After
+    start_compression() both directions are raw DEFLATE streams (RFC 4978).
+    """
+
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.sessions_lock:
+            self.server.sessions.add(self.request)
+        self._inbox = bytearray()
+        self._outbox = bytearray()
+        self._awaiting_client = False
+        self._deflater = None
+        self._inflater = None
+
+    def start_compression(self):
+        self.flush()
+        self._deflater = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self._inflater = zlib.decompressobj(-15)
+
+    def _fill(self) -> bool:
+        self.flush()
+        data = self.request.recv(65536)
+        if not data:
+            return False
+        if self._awaiting_client:
+            # The client waited for our last response before sending this:
+            # one network round trip. Data that was already queued arrived
+            # pipelined with it.
+            self._awaiting_client = False
+            self.server.stats.add(round_trips=1)
+            if self.server.latency:
+                time.sleep(self.server.latency)
+        wire = len(data)
+        if self._inflater is not None:
+            data = self._inflater.decompress(data)
+        self.server.stats.add(bytes_in=wire, payload_in=len(data))
+        self._inbox += data
+        return True
+
+    def read_line(self) -> bytes:
+        while b"\n" not in self._inbox:
+            if not self._fill():
+                line = bytes(self._inbox)
+                self._inbox.clear()
+                return line
+        end = self._inbox.index(b"\n") + 1
+        line = bytes(self._inbox[:end])
+        del self._inbox[:end]
+        return line
+
+    def read_exact(self, size: int) -> bytes:
+        while len(self._inbox) < size:
+            if not self._fill():
+                break
+        data = bytes(self._inbox[:size])
+        del self._inbox[:size]
+        return data
+
+    def send(self, data: bytes):
+        self._outbox += data
+
+    def flush(self):
+        if not self._outbox:
+            return
+        data = bytes(self._outbox)
+        self._outbox.clear()
+        # Check before sending: once the response is out, a fast local
+        # client can answer before we look and seem pipelined
+        ready, _, _ = select.select([self.request], [], [], 0)
+        self._awaiting_client = not ready
+        payload = len(data)
+        if self._deflater is not None:
+            data = self._deflater.compress(data) + self._deflater.flush(zlib.Z_SYNC_FLUSH)
+        if self.server.bandwidth:
+            time.sleep(len(data) / self.server.bandwidth)
+        self.request.sendall(data)
+        self.server.stats.add(bytes_out=len(data), payload_out=payload)
+
+    def finish(self):
+        with self.server.sessions_lock:
+            self.server.sessions.discard(self.request)
+        try:
+            self.flush()
+        except OSError:
+            pass
+
+
+# --- IMAP --------------------------------------------------------------------
+
+def _tokenize(data: bytes, literals: List[bytes]):
+    """Parse IMAP command arguments into nested lists.
+
+    Literals have already been read off the wire and replaced by the
+    placeholder ``\\x00<index>``.
+    """
+    stack = [[]]
+    i = 0
+    while i < len(data):
+        ch = data[i]
+        if ch == 0x20:
+            i += 1
+        elif ch == 0x28:  # (
+            stack.append([])
+            i += 1
+        elif ch == 0x29:  # )
+            group = stack.pop()
+            stack[-1].append(group)
+            i += 1
+        elif ch == 0x22:  # "
+            i += 1
+            value = bytearray()
+            while data[i] != 0x22:
+                if data[i] == 0x5C:
+                    i += 1
+                value.append(data[i])
+                i += 1
+            stack[-1].append(bytes(value).decode("utf-8", "replace"))
+            i += 1
+        elif ch == 0x00:
+            end = data.index(b"\x00", i + 1)
+            stack[-1].append(literals[int(data[i + 1:end])])
+            i = end + 1
+        else:
+            start = i
+            depth = 0
+            while i < len(data):
+                c = data[i]
+                if c == 0x5B:
+                    depth += 1
+                elif c == 0x5D:
+                    depth -= 1
+                elif depth == 0 and (c in (0x20, 0x28, 0x29)):
+                    break
+                i += 1
+            stack[-1].append(data[start:i].decode("utf-8", "replace"))
+    return stack[0]
+
+
+def _parse_sequence_set(text: str, maximum: int) -> set:
+    """Expand an IMAP sequence set such as '1:4,7,9:*'."""
+    result = set()
+    if maximum == 0:
+        return result
+    for part in text.split(","):
+        if ":" in part:
+            low, high = part.split(":")
+            low = maximum if low == "*" else int(low)
+            high = maximum if high == "*" else int(high)
+            if low > high:
+                low, high = high, low
+            result.update(range(low, min(high, maximum) + 1))
+        else:
+            result.add(maximum if part == "*" else int(part))
+    return result
+
+
+def _quote(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _format_flags(flags) -> str:
+    return "(" + " ".join(sorted(flags)) + ")"
+
+
+def _nstring(value) -> str:
+    return "NIL" if value is None else _quote(str(value))
+
+
+def _bodystructure(part) -> str:
+    """Format a parsed message part as a BODYSTRUCTURE (RFC 3501 7.4.2)."""
+    maintype, subtype = part.get_content_maintype(), part.get_content_subtype()
+    if part.is_multipart():
+        children = "".join(_bodystructure(child) for child in part.get_payload())
+        return f"({children} {_quote(subtype.upper())})"
+    params = part.get_params()[1:] if part.get_params() else []
+    params = " ".join(f"{_quote(k.upper())} {_quote(v)}" for k, v in params)
+    body = normalize_crlf(part.get_payload(decode=False).encode("utf-8", "replace")
+                          if isinstance(part.get_payload(), str) else b"")
+    fields = [
+        _quote(maintype.upper()), _quote(subtype.upper()),
+        f"({params})" if params else "NIL",
+        _nstring(part["content-id"]), _nstring(part["content-description"]),
+        _quote((part["content-transfer-encoding"] or "7BIT").upper()),
+        str(len(body)),
+    ]
+    if maintype == "text":
+        fields.append(str(body.count(b"\r\n")))
+    fields.append("NIL")  # MD5
+    disposition = part.get_content_disposition()
+    fields.append(f"({_quote(disposition.upper())} NIL)" if disposition else "NIL")
+    return "(" + " ".join(fields) + ")"
+
+
+class IMAPHandler(_LinkHandler):
+    # Commands that wait on the client must not hold the store lock
+    UNLOCKED_COMMANDS = ("AUTHENTICATE", "LOGOUT")
+
+    def setup(self):
+        super().setup()
+        self.authenticated = False
+        self.selected: Optional[FakeFolder] = None
+        self.readonly = False
+
+    @property
+    def store(self) -> FakeMailStore:
+        return self.server.store
+
+    def handle(self):
+        self.send(f"* OK [CAPABILITY {CAPABILITIES}] Mail Buddy fake IMAP ready\r\n".encode())
+        while True:
+            command = self.read_command()
+            if command is None:
+                return
+            tag, name, args = command
+            self.server.stats.add(commands=1)
+            if not self.dispatch(tag, name, args):
+                return
+
+    def read_command(self):
+        line = self.read_line()
+        if not line:
+            return None
+        literals = []
+        data = bytearray()
+        while True:
+            line = line.rstrip(b"\r\n")
+            match = re.search(rb"\{(\d+)(\+?)\}$", line)
+            if not match:
+                data += line
+                break
+            data += line[:match.start()]
+            if not match.group(2):
+                self.send(b"+ Ready for literal\r\n")
+            literals.append(self.read_exact(int(match.group(1))))
+            data += b"\x00%d\x00" % (len(literals) - 1)
+            line = self.read_line()
+        parts = bytes(data).split(b" ", 2)
+        tag = parts[0].decode()
+        name = parts[1].decode().upper() if len(parts) > 1 else ""
+        rest = parts[2] if len(parts) > 2 else b""
+        if name == "UID":
+            sub, _, rest = rest.partition(b" ")
+            name = "UID " + sub.decode().upper()
+        return tag, name, _tokenize(rest, literals)
+
+    def dispatch(self, tag, name, args) -> bool:
+        handler = getattr(self, "cmd_" + name.replace(" ", "_"), None)
+        if handler is None:
+            self.send(f"{tag} BAD Unknown command {name}\r\n".encode())
+            return True
+        if name not in ("CAPABILITY", "NOOP", "LOGOUT", "LOGIN", "AUTHENTICATE") \
+                and not self.authenticated:
+            self.send(f"{tag} NO Not authenticated\r\n".encode())
+            return True
+        try:
+            if name in self.UNLOCKED_COMMANDS:
+                return handler(tag, args) is not False
+            with self.store.lock:
+                return handler(tag, args) is not False
+        except Exception as e:
+            self.send(f"{tag} BAD {type(e).__name__}: {e}\r\n".encode())
+            return True
+
+    def ok(self, tag, text="completed"):
+        self.send(f"{tag} OK {text}\r\n".encode())
+
+    def require_selected(self, tag) -> bool:
+        if self.selected is None:
+            self.send(f"{tag} BAD No mailbox selected\r\n".encode())
+            return False
+        return True
+
+    # Session commands
+
+    def cmd_CAPABILITY(self, tag, args):
+        self.send(f"* CAPABILITY {CAPABILITIES}\r\n".encode())
+        self.ok(tag)
+
+    def cmd_NOOP(self, tag, args):
+        self.ok(tag)
+
+    def cmd_COMPRESS(self, tag, args):
+        if self._deflater is not None:
+            self.send(f"{tag} NO [COMPRESSIONACTIVE] Already compressing\r\n".encode())
+        elif not args or str(args[0]).upper() != "DEFLATE":
+            self.send(f"{tag} BAD Unsupported compression\r\n".encode())
+        else:
+            self.ok(tag, "DEFLATE active")
+            self.start_compression()
+
+    def cmd_LOGOUT(self, tag, args):
+        self.send(b"* BYE Logging out\r\n")
+        self.ok(tag)
+        return False
+
+    def cmd_LOGIN(self, tag, args):
+        user, password = (a.decode() if isinstance(a, bytes) else a for a in args[:2])
+        if user == self.store.username and password == self.store.password:
+            self.authenticated = True
+            self.ok(tag, "LOGIN completed")
+        else:
+            self.send(f"{tag} NO [AUTHENTICATIONFAILED] Invalid credentials\r\n".encode())
+
+    def cmd_AUTHENTICATE(self, tag, args):
+        if args[0].upper() != "PLAIN":
+            self.send(f"{tag} NO Unsupported mechanism\r\n".encode())
+            return
+        self.send(b"+ \r\n")
+        response = base64.b64decode(self.read_line().strip())
+        _, user, password = response.decode().split("\x00")
+        self.cmd_LOGIN(tag, [user, password])
+
+    def cmd_ENABLE(self, tag, args):
+        self.send(b"* ENABLED\r\n")
+        self.ok(tag)
+
+    # Mailbox commands
+
+    def cmd_LIST(self, tag, args):
+        for name in self.store.folders:
+            attributes = SPECIAL_USE.get(name, "")
+            self.send(f'* LIST ({attributes}) "/" {_quote(name)}\r\n'.encode())
+        self.ok(tag)
+
+    def cmd_SELECT(self, tag, args, readonly=False):
+        folder = self.store.folder(args[0])
+        if folder is None:
+            self.selected = None
+            self.send(f"{tag} NO Mailbox does not exist\r\n".encode())
+            return
+        self.selected = folder
+        self.readonly = readonly
+        unseen = sum(1 for m in folder.messages if "\\Seen" not in m.flags)
+        self.send(
+            f"* {len(folder.messages)} EXISTS\r\n"
+            f"* 0 RECENT\r\n"
+            f"* FLAGS ({' '.join(SYSTEM_FLAGS)})\r\n"
+            f"* OK [UNSEEN {unseen}] Unseen messages\r\n"
+            f"* OK [UIDVALIDITY {folder.uidvalidity}] UIDs valid\r\n"
+            f"* OK [UIDNEXT {folder.next_uid}] Predicted next UID\r\n"
+            f"* OK [HIGHESTMODSEQ {folder.highest_modseq}] Highest\r\n".encode()
+        )
+        mode = "READ-ONLY" if readonly else "READ-WRITE"
+        self.ok(tag, f"[{mode}] SELECT completed")
+
+    def cmd_EXAMINE(self, tag, args):
+        self.cmd_SELECT(tag, args, readonly=True)
+
+    def cmd_STATUS(self, tag, args):
+        folder = self.store.folder(args[0])
+        if folder is None:
+            self.send(f"{tag} NO Mailbox does not exist\r\n".encode())
+            return
+        values = {
+            "MESSAGES": len(folder.messages),
+            "RECENT": 0,
+            "UIDNEXT": folder.next_uid,
+            "UIDVALIDITY": folder.uidvalidity,
+            "UNSEEN": sum(1 for m in folder.messages if "\\Seen" not in m.flags),
+        }
+        items = " ".join(f"{item.upper()} {values[item.upper()]}" for item in args[1])
+        self.send(f"* STATUS {_quote(folder.name)} ({items})\r\n".encode())
+        self.ok(tag)
+
+    def cmd_CLOSE(self, tag, args):
+        if self.require_selected(tag):
+            if not self.readonly:
+                self.expunge(lambda m: True, announce=False)
+            self.selected = None
+            self.ok(tag)
+
+    # Message commands
+
+    def resolve(self, sequence_set: str, uid: bool):
+        """Return (sequence number, message) pairs addressed by a set."""
+        messages = self.selected.messages
+        if uid:
+            maximum = messages[-1].uid if messages else 0
+            wanted = _parse_sequence_set(sequence_set, maximum)
+            return [(i + 1, m) for i, m in enumerate(messages) if m.uid in wanted]
+        wanted = _parse_sequence_set(sequence_set, len(messages))
+        return [(i, messages[i - 1]) for i in sorted(wanted) if 0 < i <= len(messages)]
+
+    def cmd_SEARCH(self, tag, args, uid=False):
+        if not self.require_selected(tag):
+            return
+        if args and isinstance(args[0], str) and args[0].upper() == "CHARSET":
+            args = args[2:]
+        messages = self.selected.messages
+        hits = []
+        for seq, message in enumerate(messages, 1):
+            if self.matches(list(args), seq, message, len(messages)):
+                hits.append(message.uid if uid else seq)
+        self.send(("* SEARCH" + "".join(f" {n}" for n in hits) + "\r\n").encode())
+        self.ok(tag)
+
+    def cmd_UID_SEARCH(self, tag, args):
+        self.cmd_SEARCH(tag, args, uid=True)
+
+    def matches(self, criteria, seq, message, count) -> bool:
+        while criteria:
+            if not self._match_one(criteria, seq, message, count):
+                return False
+        return True
+
+    def _match_one(self, criteria, seq, message, count) -> bool:
+        key = criteria.pop(0)
+        if isinstance(key, list):
+            return self.matches(list(key), seq, message, count)
+        key_upper = key.upper()
+        if key_upper == "ALL":
+            return True
+        if key_upper == "NOT":
+            return not self._match_one(criteria, seq, message, count)
+        if key_upper == "OR":
+            left = self._match_one(criteria, seq, message, count)
+            right = self._match_one(criteria, seq, message, count)
+            return left or right
+        flag_keys = {
+            "SEEN": "\\Seen", "ANSWERED": "\\Answered", "FLAGGED": "\\Flagged",
+            "DELETED": "\\Deleted", "DRAFT": "\\Draft",
+        }
+        if key_upper in flag_keys:
+            return flag_keys[key_upper] in message.flags
+        if key_upper.startswith("UN") and key_upper[2:] in flag_keys:
+            return flag_keys[key_upper[2:]] not in message.flags
+        if key_upper == "UID":
+            maximum = self.selected.messages[-1].uid if self.selected.messages else 0
+            return message.uid in _parse_sequence_set(criteria.pop(0), maximum)
+        if key_upper in ("FROM", "TO", "SUBJECT", "CC"):
+            value = criteria.pop(0)
+            value = value.decode() if isinstance(value, bytes) else value
+            header = str(message.parsed.get(key_upper.title(), ""))
+            return value.lower() in header.lower()
+        if key_upper in ("TEXT", "BODY"):
+            value = criteria.pop(0)
+            value = value.encode() if isinstance(value, str) else value
+            haystack = message.raw if key_upper == "TEXT" else message.text_bytes
+            return value.lower() in haystack.lower()
+        if key_upper in ("SINCE", "BEFORE", "ON", "SENTSINCE", "SENTBEFORE", "SENTON"):
+            day = criteria.pop(0).replace("-", " ")
+            limit = parsedate_to_datetime(f"{day} 00:00:00 +0000").date()
+            date = message.date()
+            if date is None:
+                return False
+            if key_upper.endswith("SINCE"):
+                return date >= limit
+            if key_upper.endswith("BEFORE"):
+                return date < limit
+            return date == limit
+        if key_upper == "LARGER":
+            return len(message.raw) > int(criteria.pop(0))
+        if key_upper == "SMALLER":
+            return len(message.raw) < int(criteria.pop(0))
+        if key_upper == "HEADER":
+            name, value = criteria.pop(0), criteria.pop(0)
+            return value.lower() in str(message.parsed.get(name, "")).lower()
+        if re.match(r"^[\d:*,]+$", key):
+            return seq in _parse_sequence_set(key, count)
+        raise ValueError(f"Unsupported search key {key}")
+
+    def cmd_FETCH(self, tag, args, uid=False):
+        if not self.require_selected(tag):
+            return
+        items = args[1] if isinstance(args[1], list) else [args[1]]
+        items = [i.upper() if isinstance(i, str) else i for i in items]
+        if items == ["ALL"]:
+            items = ["FLAGS", "INTERNALDATE", "RFC822.SIZE"]
+        elif items == ["FAST"]:
+            items = ["FLAGS", "INTERNALDATE", "RFC822.SIZE"]
+        elif items == ["FULL"]:
+            items = ["FLAGS", "INTERNALDATE", "RFC822.SIZE", "BODY"]
+        if uid and "UID" not in items:
+            items.insert(0, "UID")
+        for seq, message in self.resolve(args[0], uid):
+            self.send_fetch(seq, message, items)
+        self.ok(tag)
+
+    def cmd_UID_FETCH(self, tag, args):
+        self.cmd_FETCH(tag, args, uid=True)
+
+    def send_fetch(self, seq, message, items):
+        out = bytearray(b"* %d FETCH (" % seq)
+        parts = []
+        mark_seen = False
+        for item in items:
+            if item == "UID":
+                parts.append(b"UID %d" % message.uid)
+            elif item == "FLAGS":
+                parts.append(f"FLAGS {_format_flags(message.flags)}".encode())
+            elif item == "MODSEQ":
+                parts.append(b"MODSEQ (%d)" % message.modseq)
+            elif item == "RFC822.SIZE":
+                parts.append(b"RFC822.SIZE %d" % len(message.raw))
+            elif item == "BODYSTRUCTURE":
+                parts.append(f"BODYSTRUCTURE {message.bodystructure}".encode())
+            elif item == "INTERNALDATE":
+                parts.append(b'INTERNALDATE "01-Mar-2025 00:00:00 +0000"')
+            elif item == "RFC822":
+                parts.append(self._literal(b"RFC822", message.raw))
+                mark_seen = True
+            elif item == "RFC822.HEADER":
+                parts.append(self._literal(b"RFC822.HEADER", message.header_bytes))
+            elif item == "RFC822.TEXT":
+                parts.append(self._literal(b"RFC822.TEXT", message.text_bytes))
+                mark_seen = True
+            elif item.startswith("BODY[") or item.startswith("BODY.PEEK["):
+                peek = item.startswith("BODY.PEEK")
+                section, partial = self._split_body_item(item)
+                data = self._section(message, section)
+                name = f"BODY[{section}]"
+                if partial is not None:
+                    start, length = partial
+                    data = data[start:start + length]
+                    name += f"<{start}>"
+                parts.append(self._literal(name.encode(), data))
+                mark_seen = mark_seen or not peek
+            else:
+                raise ValueError(f"Unsupported fetch item {item}")
+        if mark_seen and not self.readonly and "\\Seen" not in message.flags:
+            message.flags.add("\\Seen")
+            self.selected.touch(message)
+            if "FLAGS" not in items:
+                parts.append(f"FLAGS {_format_flags(message.flags)}".encode())
+        out += b" ".join(parts) + b")\r\n"
+        self.send(bytes(out))
+
+    @staticmethod
+    def _literal(name: bytes, data: bytes) -> bytes:
+        return name + b" {%d}\r\n" % len(data) + data
+
+    @staticmethod
+    def _split_body_item(item: str):
+        section = item[item.index("[") + 1:item.rindex("]")]
+        partial = None
+        tail = item[item.rindex("]") + 1:]
+        if tail.startswith("<"):
+            start, length = tail[1:-1].split(".")
+            partial = (int(start), int(length))
+        return section, partial
+
+    def _section(self, message: FakeMessage, section: str) -> bytes:
+        section_upper = section.upper()
+        if section == "":
+            return message.raw
+        if section_upper == "HEADER":
+            return message.header_bytes
+        if section_upper == "TEXT":
+            return message.text_bytes
+        if section_upper.startswith("HEADER.FIELDS"):
+            negate = section_upper.startswith("HEADER.FIELDS.NOT")
+            names = {
+                n.lower() for n in
+                section[section.index("(") + 1:section.rindex(")")].split()
+            }
+            lines = []
+            for name, value in message.parsed.items():
+                if (name.lower() in names) != negate:
+                    lines.append(f"{name}: {value}")
+            text = "\r\n".join(lines) + "\r\n\r\n"
+            return normalize_crlf(text.encode("utf-8", "replace"))
+        # Numeric part specifiers, optionally followed by MIME/HEADER/TEXT
+        path = section_upper.split(".")
+        suffix = None
+        if not path[-1].isdigit():
+            suffix = path.pop()
+        part = message.parsed
+        for index in path:
+            index = int(index)
+            if part.is_multipart():
+                part = part.get_payload()[index - 1]
+            elif index != 1:
+                return b""
+        raw = normalize_crlf(part.as_bytes())
+        end = raw.find(b"\r\n\r\n")
+        header, body = (raw[:end + 4], raw[end + 4:]) if end >= 0 else (b"", raw)
+        if part is message.parsed:
+            header, body = message.header_bytes, message.text_bytes
+        if suffix in ("MIME", "HEADER"):
+            return header
+        return body
+
+    def cmd_STORE(self, tag, args, uid=False):
+        if not self.require_selected(tag):
+            return
+        action = args[1].upper()
+        flags = args[2] if isinstance(args[2], list) else [args[2]]
+        silent = action.endswith(".SILENT")
+        for seq, message in self.resolve(args[0], uid):
+            before = set(message.flags)
+            if action.startswith("+"):
+                message.flags.update(flags)
+            elif action.startswith("-"):
+                message.flags.difference_update(flags)
+            else:
+                message.flags = set(flags)
+            if message.flags != before:
+                self.selected.touch(message)
+            if not silent:
+                uid_part = f" UID {message.uid}" if uid else ""
+                self.send(
+                    f"* {seq} FETCH (FLAGS {_format_flags(message.flags)}{uid_part})\r\n".encode()
+                )
+        self.ok(tag)
+
+    def cmd_UID_STORE(self, tag, args):
+        self.cmd_STORE(tag, args, uid=True)
+
+    def cmd_COPY(self, tag, args, uid=False, move=False):
+        if not self.require_selected(tag):
+            return
+        target = self.store.folder(args[1])
+        if target is None:
+            self.send(f"{tag} NO [TRYCREATE] Mailbox does not exist\r\n".encode())
+            return
+        selected = self.resolve(args[0], uid)
+        source_uids, target_uids = [], []
+        for _, message in selected:
+            copy = target.append(message.raw, message.flags)
+            source_uids.append(str(message.uid))
+            target_uids.append(str(copy.uid))
+        code = ""
+        if selected:
+            code = (f"[COPYUID {target.uidvalidity} {','.join(source_uids)} "
+                    f"{','.join(target_uids)}] ")
+        if move:
+            if code:
+                self.send(f"* OK {code}Moved\r\n".encode())
+            moved = {id(m) for _, m in selected}
+            self.expunge(lambda m: id(m) in moved)
+            self.ok(tag, "MOVE completed")
+        else:
+            self.ok(tag, f"{code}COPY completed")
+
+    def cmd_UID_COPY(self, tag, args):
+        self.cmd_COPY(tag, args, uid=True)
+
+    def cmd_MOVE(self, tag, args):
+        self.cmd_COPY(tag, args, move=True)
+
+    def cmd_UID_MOVE(self, tag, args):
+        self.cmd_COPY(tag, args, uid=True, move=True)
+
+    def expunge(self, predicate, announce=True):
+        messages = self.selected.messages
+        for seq in range(len(messages), 0, -1):
+            message = messages[seq - 1]
+            if predicate(message):
+                del messages[seq - 1]
+                if announce:
+                    self.send(b"* %d EXPUNGE\r\n" % seq)
+
+    def cmd_EXPUNGE(self, tag, args):
+        if self.require_selected(tag):
+            self.expunge(lambda m: "\\Deleted" in m.flags)
+            self.ok(tag)
+
+    def cmd_UID_EXPUNGE(self, tag, args):
+        if self.require_selected(tag):
+            maximum = self.selected.messages[-1].uid if self.selected.messages else 0
+            wanted = _parse_sequence_set(args[0], maximum)
+            self.expunge(lambda m: "\\Deleted" in m.flags and m.uid in wanted)
+            self.ok(tag)
+
+    def cmd_APPEND(self, tag, args):
+        target = self.store.folder(args[0])
+        if target is None:
+            self.send(f"{tag} NO [TRYCREATE] Mailbox does not exist\r\n".encode())
+            return
+        flags = args[1] if len(args) > 2 and isinstance(args[1], list) else []
+        message = target.append(args[-1], flags)
+        self.ok(tag, f"[APPENDUID {target.uidvalidity} {message.uid}] APPEND completed")
+
+
+class FakeIMAPServer(_ServerBase):
+    def __init__(self, address, store, latency=0.0, bandwidth=None):
+        super().__init__(address, IMAPHandler, store, latency, bandwidth)
+
+
+# --- SMTP --------------------------------------------------------------------
+
+class SMTPHandler(_LinkHandler):
+    def handle(self):
+        store = self.server.store
+        self.reply("220 localhost Mail Buddy fake SMTP ready")
+        sender, recipients = None, []
+        while True:
+            line = self.read_line()
+            if not line:
+                return
+            self.server.stats.add(commands=1)
+            verb, _, arg = line.decode("utf-8", "replace").strip().partition(" ")
+            verb = verb.upper()
+            if verb == "EHLO":
+                self.reply("250-localhost", "250-AUTH PLAIN LOGIN", "250-8BITMIME",
+                           "250-PIPELINING", "250 SIZE 35882577")
+            elif verb == "HELO":
+                self.reply("250 localhost")
+            elif verb == "AUTH":
+                self.authenticate(arg, store)
+            elif verb == "MAIL":
+                sender, recipients = parseaddr(arg.partition(":")[2])[1], []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(parseaddr(arg.partition(":")[2])[1])
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = self.read_data()
+                self.deliver(store, sender, recipients, data)
+                self.reply("250 OK queued")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+    def reply(self, *lines):
+        # Flushed when the next command is read, so pipelined ones share a write
+        self.send("".join(line + "\r\n" for line in lines).encode())
+
+    def authenticate(self, arg, store):
+        mechanism, _, initial = arg.partition(" ")
+        if mechanism.upper() == "PLAIN":
+            if not initial:
+                self.reply("334 ")
+                initial = self.read_line().strip().decode()
+            _, user, password = base64.b64decode(initial).decode().split("\x00")
+        elif mechanism.upper() == "LOGIN":
+            if initial:
+                user = base64.b64decode(initial).decode()
+            else:
+                self.reply("334 VXNlcm5hbWU6")
+                user = base64.b64decode(self.read_line().strip()).decode()
+            self.reply("334 UGFzc3dvcmQ6")
+            password = base64.b64decode(self.read_line().strip()).decode()
+        else:
+            self.reply("504 Unrecognized authentication type")
+            return
+        if user == store.username and password == store.password:
+            self.reply("235 Authentication successful")
+        else:
+            self.reply("535 Authentication failed")
+
+    def read_data(self) -> bytes:
+        lines = []
+        while True:
+            line = self.read_line()
+            if line in (b".\r\n", b".\n", b""):
+                break
+            if line.startswith(b".."):
+                line = line[1:]
+            lines.append(line)
+        return b"".join(lines)
+
+    @staticmethod
+    def deliver(store, sender, recipients, data):
+        with store.lock:
+            if sender == store.username:
+                store.folder("Sent").append(data, ["\\Seen"])
+            if store.username in recipients:
+                store.folder("INBOX").append(data)
+
+
+class FakeSMTPServer(_ServerBase):
+    def __init__(self, address, store, latency=0.0, bandwidth=None):
+        super().__init__(address, SMTPHandler, store, latency, bandwidth)
+
+
+# --- Both servers together ---------------------------------------------------
+
+class FakeMailServer:
+    """Runs an IMAP and an SMTP stand-in on localhost in background threads
+
+    latency is the delay in seconds injected once per round trip and
+    bandwidth an optional cap in bytes per second for server responses.
+    """
+
+    def __init__(self, store: Optional[FakeMailStore] = None, latency: float = 0.0,
+                 bandwidth: Optional[int] = None, host: str = "127.0.0.1"):
+        self.store = store or FakeMailStore()
+        self.imap_server = FakeIMAPServer((host, 0), self.store, latency, bandwidth)
+        self.smtp_server = FakeSMTPServer((host, 0), self.store, latency, bandwidth)
+        self.host = host
+        self._threads = []
+
+    @property
+    def imap_port(self) -> int:
+        return self.imap_server.server_address[1]
+
+    @property
+    def smtp_port(self) -> int:
+        return self.smtp_server.server_address[1]
+
+    def start(self):
+        for server in (self.imap_server, self.smtp_server):
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in (self.imap_server, self.smtp_server):
+            server.shutdown()
+            server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def set_latency(self, latency: float):
+        self.imap_server.latency = latency
+        self.smtp_server.latency = latency
+
+    def set_offline(self, offline: bool):
+        """Mimic losing (True) and regaining (False) the connection."""
+        self.imap_server.set_offline(offline)
+        self.smtp_server.set_offline(offline)
+
+    def stats(self) -> Dict:
+        imap = self.imap_server.stats.snapshot()
+        smtp = self.smtp_server.stats.snapshot()
+        return {key: imap[key] + smtp[key] for key in imap}
+
+    def reset_stats(self):
+        self.imap_server.stats.reset()
+        self.smtp_server.stats.reset()
+
+    def profile(self, **tuning) -> ProviderProfile:
+        """Provider profile that points EmailHandler at this server"""
+        return ProviderProfile(
+            "fake",
+            ServerSettings(self.host, self.imap_port, "none"),
+            ServerSettings(self.host, self.smtp_port, "none"),
+            domains=[self.store.username.rpartition("@")[2]],
+            kind="dovecot",
+            capabilities=CAPABILITIES.split(),
+            **tuning
+        )
@@ -0,0 +1,81 @@
+"""
+Decoding of message header values for display, done once at ingest.
+
+Subject and From headers may carry RFC 2047 encoded words
+(``=?UTF-8?B?...?=``). They are decoded when a record is built, never
+while painting, and the From header is split into display name and
+address with email.utils.parseaddr.
+
+Mailboxes repeat the same senders and subjects many times (newsletters,
+notifications, long threads), so decoded values are cached and interned:
+each distinct string is decoded once and kept in memory once, however many
+records refer to it.
+"""
+
+import sys
+from email.header import decode_header, make_header
+from email.utils import parseaddr
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+# Distinct raw header values to remember decodings for
+CACHE_SIZE = 8192
+
+# Record fields holding header text shared between records
+INTERNED_FIELDS = ("subject", "from", "from_name", "from_address", "to")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _decode(value: str) -> str:
+    if "=?" not in value:
+        # No encoded words; only unfold continuation lines
+        text = value
+    else:
+        try:
+            text = str(make_header(decode_header(value)))
+        except (LookupError, UnicodeError, ValueError):
+            # Unknown charset or malformed encoded word; show it as sent
+            text = value
+    return sys.intern(" ".join(text.split()))
+
+
+def decode_value(value) -> str:
+    """Decode a header value (str, Header or None) to display text."""
+    if value is None:
+        return ""
+    return _decode(str(value))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _decode_address(value: str) -> Tuple[str, str, str]:
+    text = _decode(value)
+    name, address = parseaddr(text)
+    name = sys.intern(name)
+    address = sys.intern(address)
+    return text, name or address or text, address
+
+
+def decode_address(value) -> Tuple[str, str, str]:
+    """Decode an address header into (full text, display name, address).
+
+    The display name falls back to the address when the header has no
+    name, and to the full text when it cannot be parsed at all.
+    """
+    if value is None:
+        return "", "", ""
+    return _decode_address(str(value))
+
+
+def sender_fields(value) -> Dict[str, str]:
+    """Record fields for a From header: from, from_name and from_address."""
+    text, name, address = decode_address(value)
+    return {"from": text, "from_name": name, "from_address": address}
+
+
+def intern_record(record: Dict) -> Dict:
+    """Re-intern header fields of a record built in another process."""
+    for field in INTERNED_FIELDS:
+        value: Optional[str] = record.get(field)
+        if value:
+            record[field] = sys.intern(value)
+    return record
@@ -0,0 +1,110 @@
+"""
+Columnar table of message list metadata, parallel to EmailWindow.emails.
+
+Row i of the table describes emails[i]: the list is kept newest first, so
+the date_keys column (negated timestamps, the first element of sort_key)
+is ascending and a date range is one contiguous slice found with
+searchsorted. The sender_ids column holds each sender as a plain integer,
+so all rows from one sender are found without touching the record dicts.
+
+The table does not sort. The sort box's orders (sender, subject, size,
+unread first) are kept by sort_index.SortIndex, which new mail updates by
+bisect instead of a lexsort over columns per change; so there are no
+flags or sizes columns here.
+
+Columns live in preallocated NumPy arrays that grow by doubling. Inserting
+a row shifts the rows after it in place, which is a memmove: cheap at the
+end of the list, where paged-in history lands, and well under a millisecond
+at the top for 100k rows.
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+COLUMNS = {
+    "date_keys": np.int64,
+    "sender_ids": np.int32,
+}
+
+_INITIAL_CAPACITY = 1024
+
+
+class HeaderTable:
+    """NumPy columns describing the rows of the message list, in list order"""
+
+    def __init__(self):
+        self.size = 0
+        # Sender address -> id; ids are assigned in order of first sight
+        self.sender_index: Dict[str, int] = {}
+        self.senders: List[str] = []
+        self._columns = {name: np.zeros(_INITIAL_CAPACITY, dtype)
+                         for name, dtype in COLUMNS.items()}
+
+    def __len__(self):
+        return self.size
+
+    def column(self, name: str) -> np.ndarray:
+        """View of one column over the live rows (not a copy)."""
+        return self._columns[name][:self.size]
+
+    def sender_id(self, address: str) -> int:
+        address = address.lower()
+        sender_id = self.sender_index.get(address)
+        if sender_id is None:
+            sender_id = self.sender_index[address] = len(self.senders)
+            self.senders.append(address)
+        return sender_id
+
+    def sender_rows(self, address: str) -> np.ndarray:
+        """Rows of messages from address, in list order."""
+        sender_id = self.sender_index.get(address.lower())
+        if sender_id is None:
+            return np.empty(0, np.intp)
+        return np.flatnonzero(self.column("sender_ids") == sender_id)
+
+    def _row(self, email: Dict) -> Tuple:
+        return (
+            -email['parsed_date'].toSecsSinceEpoch(),
+            self.sender_id(email.get('from_address') or email.get('from') or ""),
+        )
+
+    def _reserve(self, size: int):
+        capacity = len(self._columns["date_keys"])
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name, array in self._columns.items():
+            grown = np.zeros(capacity, array.dtype)
+            grown[:self.size] = array[:self.size]
+            self._columns[name] = grown
+
+    def build(self, emails: Sequence[Dict]):
+        """Replace the contents with rows for emails (already in list order)."""
+        self.size = 0
+        self._reserve(len(emails))
+        rows = [self._row(email) for email in emails]
+        for name, values in zip(COLUMNS, zip(*rows)):
+            self._columns[name][:len(rows)] = values
+        self.size = len(rows)
+
+    def insert(self, index: int, email: Dict):
+        self._reserve(self.size + 1)
+        for array, value in zip(self._columns.values(), self._row(email)):
+            array[index + 1:self.size + 1] = array[index:self.size]
+            array[index] = value
+        self.size += 1
+
+    def delete(self, index: int):
+        for array in self._columns.values():
+            array[index:self.size - 1] = array[index + 1:self.size]
+        self.size -= 1
+
+    def date_range(self, start: int, end: int) -> Tuple[int, int]:
+        """Rows [lo, hi) dated start <= t < end (seconds since the epoch)."""
+        date_keys = self.column("date_keys")
+        # date_keys ascend as dates descend: -end < key <= -start
+        lo = int(np.searchsorted(date_keys, -end, side="right"))
+        hi = int(np.searchsorted(date_keys, -start, side="right"))
+        return lo, hi
@@ -0,0 +1,177 @@
+"""
+Paged loading of older message headers for the inbox list.
+
+The window shows the newest messages after a sync. When the user scrolls
+near the bottom, HistoryLoader fetches the next page of headers (the
+newest messages older than the oldest one loaded) on its own IMAP
+connection in a background thread, so paging never waits on a refresh.
+
+Page size adapts to measured latency: each full page is timed and the next
+page is sized to take about ``target_seconds``, so fast links load long
+pages and slow links keep the list responsive.
+"""
+
+import socket
+import time
+
+from PyQt6.QtCore import Qt, QObject, QThread, pyqtSignal, pyqtSlot
+
+import instrumentation
+from email_handler import EmailHandler
+from logging_config import get_logger
+
+logger = get_logger("history_loader")
+
+# Stopped threads that were still busy, with their workers, kept until they
+# finish: a QThread destroyed while running aborts the process
+_stopping = set()
+
+
+def _release(thread: QThread, worker: "PageFetchWorker"):
+    thread.wait()
+    _stopping.discard((thread, worker))
+
+
+class PageFetchWorker(QObject):
+    """Fetches header pages on its own IMAP connection in a background thread"""
+
+    requested = pyqtSignal(int, int)
+    page_fetched = pyqtSignal(list, int, float)
+    failed = pyqtSignal(str)
+
+    def __init__(self, base_handler: EmailHandler, folder: str):
+        super().__init__()
+        self.base_handler = base_handler
+        self.folder = folder
+        self.handler = None
+        # Set from the GUI thread by stop(); pages still queued are skipped
+        self.cancelled = False
+        self.requested.connect(self.fetch)
+
+    @pyqtSlot(int, int)
+    def fetch(self, before_uid, limit):
+        if self.cancelled:
+            return
+        try:
+            if self.handler is None:
+                # Connect lazily, inside the worker thread
+                self.handler = self.base_handler.clone_imap()
+                if self.cancelled:
+                    return
+            start = time.perf_counter()
+            emails = self.handler.get_headers(self.folder, limit, before_uid=before_uid)
+            index = self.handler.uid_index.get(self.folder)
+            if not emails and index is not None and index[1] and index[1][0] < before_uid:
+                # The UIDs searched earlier may have been expunged since
+                # (e.g. by a bulk delete); search again
+                del self.handler.uid_index[self.folder]
+                emails = self.handler.get_headers(self.folder, limit, before_uid=before_uid)
+            if not emails:
+                # get_headers logs and returns nothing on errors; only an
+                # empty range below before_uid means history is exhausted
+                index = self.handler.uid_index.get(self.folder)
+                if index is None or (index[1] and index[1][0] < before_uid):
+                    raise RuntimeError("no headers returned")
+            self.page_fetched.emit(emails, limit, time.perf_counter() - start)
+        except Exception as e:
+            logger.warning("Loading history before UID %s failed: %s", before_uid, e)
+            # Reconnect on the next request
+            self.close()
+            self.failed.emit(str(e))
+
+    def close(self):
+        if self.handler:
+            self.handler.disconnect()
+            self.handler = None
+
+    def interrupt(self):
+        """Unblock a fetch waiting on the server; called from another thread."""
+        handler = self.handler
+        try:
+            handler.imap.sock.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):
+            pass
+
+
+class HistoryLoader(QObject):
+    """Loads one page of older headers at a time and sizes pages by latency"""
+
+    page_loaded = pyqtSignal(list)
+    load_failed = pyqtSignal(str)
+
+    def __init__(self, handler: EmailHandler, folder: str = "INBOX",
+                 page_size: int = 50, min_page_size: int = 20,
+                 max_page_size: int = 500, target_seconds: float = 0.5,
+                 parent=None):
+        super().__init__(parent)
+        self.page_size = page_size
+        self.min_page_size = min_page_size
+        self.max_page_size = max_page_size
+        self.target_seconds = target_seconds
+        self.busy = False
+        # Set once a page comes back empty: nothing older is left
+        self.exhausted = False
+
+        self.thread = QThread()
+        self.worker = PageFetchWorker(handler, folder)
+        self.worker.moveToThread(self.thread)
+        self.worker.page_fetched.connect(self.handle_page_fetched)
+        self.worker.failed.connect(self.handle_failed)
+        self.thread.start()
+
+    def load_before(self, uid: int) -> bool:
+        """Request the page of messages older than uid; False if not started."""
+        if uid <= 1:
+            # UIDs start at 1, so nothing can be older
+            self.exhausted = True
+        if self.busy or self.exhausted or self.worker is None:
+            return False
+        self.busy = True
+        self.worker.requested.emit(uid, self.page_size)
+        return True
+
+    def _adapt(self, received: int, requested: int, elapsed: float):
+        # A short page is the end of history and says little about the link
+        if received < requested or elapsed <= 0:
+            return
+        ideal = received * self.target_seconds / elapsed
+        # Move halfway towards the ideal size to damp noisy measurements
+        size = int((self.page_size + ideal) / 2)
+        self.page_size = max(self.min_page_size, min(self.max_page_size, size))
+
+    def handle_page_fetched(self, emails: list, requested: int, elapsed: float):
+        self.busy = False
+        instrumentation.count("history_pages")
+        instrumentation.count("history_messages", len(emails))
+        if not emails:
+            self.exhausted = True
+        self._adapt(len(emails), requested, elapsed)
+        logger.debug("History page of %s in %.0f ms, next page %s",
+                     len(emails), elapsed * 1000, self.page_size)
+        self.page_loaded.emit(emails)
+
+    def handle_failed(self, error: str):
+        self.busy = False
+        self.load_failed.emit(error)
+
+    def stop(self):
+        """Close the paging connection without waiting on the server.
+
+        A page still loading is interrupted; the thread is kept until it
+        finishes and logs out.
+        """
+        if self.worker is None:
+            return
+        thread, worker = self.thread, self.worker
+        worker.page_fetched.disconnect(self.handle_page_fetched)
+        worker.failed.disconnect(self.handle_failed)
+        worker.cancelled = True
+        # Log out in the worker's thread once it is done
+        thread.finished.connect(worker.close, Qt.ConnectionType.DirectConnection)
+        _stopping.add((thread, worker))
+        thread.finished.connect(lambda: _release(thread, worker))
+        thread.quit()
+        if self.busy:
+            worker.interrupt()
+            self.busy = False
+        self.worker = None
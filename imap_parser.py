@@ -0,0 +1,149 @@
+"""
+Parser for IMAP response data (RFC 3501 section 9).
+
+Responses are handled as ``(data, literals)`` pairs: the response line with
+each literal's ``{n}`` marker left in place, plus the literal payloads in
+order. Both the asyncio client and imaplib results (via
+``iter_imaplib_responses``) use this form.
+
+``quote``, ``sequence_set`` and ``search_date`` go the other way,
+formatting arguments for commands.
+"""
+
+import re
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+           "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+_LITERAL = re.compile(rb"\{(\d+)\+?\}")
+
+
+def quote(text: str) -> str:
+    """Quote a string argument for an IMAP command."""
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def sequence_set(uids: Iterable[int]) -> str:
+    """Compress numbers into a sequence set: 100..180 and 200 -> "100:180,200"."""
+    ranges: List[List[int]] = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(lo) if lo == hi else f"{lo}:{hi}" for lo, hi in ranges)
+
+
+def search_date(day: date) -> str:
+    """A date for SEARCH criteria such as BEFORE: 19-Oct-2025 (English months)."""
+    return f"{day.day}-{_MONTHS[day.month - 1]}-{day.year}"
+
+
+def parse_data(data: bytes, literals: List[bytes] = ()) -> list:
+    """Tokenize response data into nested lists.
+
+    Atoms become str, numbers int, NIL None, quoted strings str and
+    literals bytes. Atoms keep bracketed sections such as
+    ``BODY[HEADER.FIELDS (FROM)]<0>`` intact.
+    """
+    literal_iter = iter(literals)
+    stack = [[]]
+    i = 0
+    length = len(data)
+    while i < length:
+        ch = data[i]
+        if ch in (0x20, 0x0D, 0x0A):
+            i += 1
+        elif ch == 0x28:  # (
+            stack.append([])
+            i += 1
+        elif ch == 0x29:  # )
+            group = stack.pop()
+            stack[-1].append(group)
+            i += 1
+        elif ch == 0x22:  # "
+            i += 1
+            value = bytearray()
+            while i < length and data[i] != 0x22:
+                if data[i] == 0x5C:
+                    i += 1
+                value.append(data[i])
+                i += 1
+            stack[-1].append(bytes(value).decode("utf-8", "replace"))
+            i += 1
+        elif ch == 0x7B:  # {
+            match = _LITERAL.match(data, i)
+            stack[-1].append(next(literal_iter))
+            i = match.end()
+        else:
+            start = i
+            depth = 0
+            while i < length:
+                c = data[i]
+                if c == 0x5B:
+                    depth += 1
+                elif c == 0x5D:
+                    depth -= 1
+                elif depth == 0 and c in (0x20, 0x28, 0x29, 0x0D, 0x0A):
+                    break
+                i += 1
+            atom = data[start:i].decode("utf-8", "replace")
+            if atom.isdigit():
+                stack[-1].append(int(atom))
+            elif atom.upper() == "NIL":
+                stack[-1].append(None)
+            else:
+                stack[-1].append(atom)
+    while len(stack) > 1:
+        # Tolerate truncated data by closing any open lists
+        group = stack.pop()
+        stack[-1].append(group)
+    return stack[0]
+
+
+def iter_imaplib_responses(parts) -> Iterator[Tuple[bytes, List[bytes]]]:
+    """Regroup imaplib's response list into (data, literals) pairs.
+
+    imaplib splits a response around each literal into (prefix, literal)
+    tuples and ends it with a plain bytes element.
+    """
+    data = b""
+    literals = []
+    for part in parts:
+        if isinstance(part, tuple):
+            data += part[0]
+            literals.append(part[1])
+        elif part is not None:
+            yield data + part, literals
+            data = b""
+            literals = []
+    if data:
+        yield data, literals
+
+
+def fetch_items(tokens: list) -> Dict:
+    """Turn the attribute list of a FETCH response into a dict.
+
+    Keys are upper-cased; partial bodies keep their ``<origin>`` suffix.
+    """
+    items = {}
+    for i in range(0, len(tokens) - 1, 2):
+        key = tokens[i]
+        items[key.upper() if isinstance(key, str) else key] = tokens[i + 1]
+    return items
+
+
+def parse_fetch(data: bytes, literals: List[bytes] = ()) -> Tuple[int, Dict]:
+    """Parse one FETCH response into (sequence number, items).
+
+    Accepts both the raw form ``* 12 FETCH (...)`` and imaplib's form
+    ``12 (...)``.
+    """
+    tokens = parse_data(data, literals)
+    if tokens and tokens[0] == "*":
+        tokens = tokens[1:]
+    seq = tokens[0]
+    attributes = tokens[-1] if isinstance(tokens[-1], list) else []
+    return seq, fetch_items(attributes)
@@ -0,0 +1,258 @@
+"""
+Lightweight timing instrumentation for sync, fetch and render phases.
+
+Code wraps interesting work in ``span("fetch")`` blocks and bumps counters
+with ``count("bytes_received", n)``. Everything recorded between
+``begin_refresh()`` and ``end_refresh()`` is rolled up into one refresh
+record that is appended to a rotating JSONL file and kept in memory for the
+diagnostics panel.
+
+Instrumentation is off unless MAIL_BUDDY_INSTRUMENTATION=1 is set or
+``set_enabled(True)`` is called; when off, ``span()`` returns a shared no-op
+context manager and ``count()`` returns immediately.
+
+Startup milestones (``milestone("login_painted")``) are the exception: they
+happen before anyone can open the diagnostics panel, so the few of them are
+always kept in memory, measured from when this module was first imported.
+main.py imports it first so that is as close to process start as Python gets.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from typing import Callable, Dict, List, Optional
+
+PHASES = (
+    "connect", "select", "status", "search", "fetch", "store", "mime_parse", "rules",
+    "date_parse", "index", "sort", "filter", "populate", "paint",
+)
+
+METRICS_FILE = os.environ.get(
+    "MAIL_BUDDY_METRICS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics.jsonl")
+)
+
+_enabled = os.environ.get("MAIL_BUDDY_INSTRUMENTATION") == "1"
+
+_process_start = time.perf_counter()
+
+# Named callables returning live statistics, e.g. cache hit counts
+_sources: Dict[str, Callable[[], Dict]] = {}
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        recorder.record_span(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Recorder:
+    """Thread-safe store for span timings, counters and refresh records"""
+
+    def __init__(self, samples_per_phase: int = 500, refresh_history: int = 100):
+        self.lock = threading.Lock()
+        self.samples_per_phase = samples_per_phase
+        self.phase_samples: Dict[str, deque] = {}
+        self.phase_totals: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.refreshes = deque(maxlen=refresh_history)
+        # Milestone name -> milliseconds since startup, first occurrence only
+        self.milestones: Dict[str, float] = {}
+        self._refresh = None
+        self._logger = None
+
+    def record_span(self, name: str, seconds: float):
+        with self.lock:
+            samples = self.phase_samples.get(name)
+            if samples is None:
+                samples = self.phase_samples[name] = deque(maxlen=self.samples_per_phase)
+                self.phase_totals[name] = [0, 0.0]
+            samples.append(seconds)
+            totals = self.phase_totals[name]
+            totals[0] += 1
+            totals[1] += seconds
+            if self._refresh is not None:
+                phase = self._refresh["phases"].setdefault(name, [0, 0.0])
+                phase[0] += 1
+                phase[1] += seconds
+
+    def add(self, name: str, value: int):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            if self._refresh is not None:
+                counters = self._refresh["counters"]
+                counters[name] = counters.get(name, 0) + value
+
+    def milestone(self, name: str, seconds: float) -> Optional[float]:
+        with self.lock:
+            if name in self.milestones:
+                return None
+            ms = self.milestones[name] = round(seconds * 1000, 3)
+        if _enabled:
+            self.export({"type": "startup", "milestone": name, "ms": ms})
+        return ms
+
+    def begin_refresh(self, label: str = "refresh"):
+        with self.lock:
+            self._refresh = {
+                "label": label,
+                "started": time.time(),
+                "start": time.perf_counter(),
+                "phases": {},
+                "counters": {},
+            }
+
+    def end_refresh(self) -> Optional[Dict]:
+        with self.lock:
+            refresh, self._refresh = self._refresh, None
+        if refresh is None:
+            return None
+        record = {
+            "type": "refresh",
+            "label": refresh["label"],
+            "timestamp": round(refresh["started"], 3),
+            "duration_ms": round((time.perf_counter() - refresh["start"]) * 1000, 3),
+            "phases": {
+                name: {"count": count, "total_ms": round(seconds * 1000, 3)}
+                for name, (count, seconds) in refresh["phases"].items()
+            },
+            "counters": refresh["counters"],
+        }
+        ratio = compression_ratio(refresh["counters"])
+        if ratio is not None:
+            record["compression_ratio"] = ratio
+        with self.lock:
+            self.refreshes.append(record)
+        self.export(record)
+        return record
+
+    def export(self, record: Dict):
+        """Append a record to the rotating JSONL metrics file"""
+        if self._logger is None:
+            logger = logging.getLogger("mail_buddy.metrics")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(
+                METRICS_FILE, maxBytes=1_000_000, backupCount=3, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            self._logger = logger
+        self._logger.info(json.dumps(record, separators=(",", ":")))
+
+    def phase_stats(self) -> Dict[str, Dict]:
+        """Per-phase count, last, p50, p99 and total in milliseconds"""
+        with self.lock:
+            snapshot = {
+                name: (list(samples), self.phase_totals[name])
+                for name, samples in self.phase_samples.items()
+            }
+        stats = {}
+        for name, (samples, (count, total)) in snapshot.items():
+            ordered = sorted(samples)
+            stats[name] = {
+                "count": count,
+                "last_ms": samples[-1] * 1000 if samples else 0.0,
+                "p50_ms": ordered[len(ordered) // 2] * 1000 if ordered else 0.0,
+                "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+                if ordered else 0.0,
+                "total_ms": total * 1000,
+            }
+        return stats
+
+    def last_refresh(self) -> Optional[Dict]:
+        with self.lock:
+            return self.refreshes[-1] if self.refreshes else None
+
+    def reset(self):
+        with self.lock:
+            self.phase_samples.clear()
+            self.phase_totals.clear()
+            self.counters.clear()
+            self.refreshes.clear()
+            self._refresh = None
+
+
+recorder = Recorder()
+
+
+def compression_ratio(counters: Dict[str, int]) -> Optional[float]:
+    """Received payload bytes per wire byte, e.g. 4.0 for 4:1 compression."""
+    wire = counters.get("bytes_received", 0)
+    payload = counters.get("payload_bytes_received", 0)
+    if not wire or not payload:
+        return None
+    return round(payload / wire, 2)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(enabled: bool):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def register_source(name: str, stats: Callable[[], Dict]):
+    """Expose a component's statistics in the Diagnostics panel."""
+    _sources[name] = stats
+
+
+def source_stats() -> Dict[str, Dict]:
+    return {name: stats() for name, stats in list(_sources.items())}
+
+
+def span(name: str):
+    """Time a block of work under the given phase name."""
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name)
+
+
+def count(name: str, value: int = 1):
+    """Add to a counter such as bytes_received or round_trips."""
+    if _enabled:
+        recorder.add(name, value)
+
+
+def milestone(name: str) -> Optional[float]:
+    """Record the first time startup reaches a point, in ms since launch."""
+    return recorder.milestone(name, time.perf_counter() - _process_start)
+
+
+def begin_refresh(label: str = "refresh"):
+    if _enabled:
+        recorder.begin_refresh(label)
+
+
+def end_refresh() -> Optional[Dict]:
+    if _enabled:
+        return recorder.end_refresh()
+    return None
@@ -0,0 +1,375 @@
+"""
+Changes made in the window, replayed against the server from the offline
+journal.
+
+The window applies a change (flags, a move or delete, a message to send) to
+its own records at once and hands it to JournalSync, which writes it to the
+OfflineJournal first. Shortly after, a worker on its own connection replays
+the pending entries, oldest first and up to REPLAY_BATCH at a time. Within a
+batch the last change to a message's flag wins, and the rest is grouped
+into range-compressed, pipelined UID STOREs (``UID STORE 100:180,200
++FLAGS``) and chunked UID MOVEs, so changes made in bulk or while offline
+cost a few round trips.
+
+Before storing, the worker fetches the messages' current flags and MODSEQ.
+A change is dropped when the folder's UIDVALIDITY changed (its UIDs name
+other messages now), when the message is gone from the server, or when the
+server already has it. When the server modified a message after the change
+was made, its MODSEQ is newer than the one recorded with the change; the
+server wins and the change comes back through ``failed`` so the window can
+roll it back. Messages are sent one at a time and each is marked done as
+soon as it is out, so a retry never sends one twice.
+
+A lost connection leaves the entries pending. The replay is retried from a
+timer with exponential backoff, or at once when a refresh gets through, and
+the GUI thread never waits on the server. On stop, one last batch gets a
+couple of seconds on the worker thread; whatever is left stays journaled
+for the next session.
+"""
+
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from PyQt6.QtCore import (Qt, QCoreApplication, QEvent, QObject, QThread, QTimer,
+                          pyqtSignal, pyqtSlot)
+
+from bulk_ops import DEFAULT_CHUNK_SIZE, resolve_target
+from email_handler import EmailHandler, is_connection_error
+from logging_config import get_logger
+from offline_journal import FolderChanges, OfflineJournal, coalesce
+
+logger = get_logger("journal_sync")
+
+# Journal entries per replay
+REPLAY_BATCH = 500
+
+# Backoff between replays while the server can't be reached
+RETRY_MIN_MS = 2000
+RETRY_MAX_MS = 60000
+
+# How long stop() lets the worker replay before it leaves the rest journaled
+STOP_REPLAY_MS = 2000
+
+# Stopped threads still finishing a step, with their workers, kept until
+# they finish: a QThread destroyed while running aborts the process
+_stopping = set()
+
+
+def _release(thread: QThread, worker: "ReplayWorker"):
+    thread.wait()
+    _stopping.discard((thread, worker))
+
+
+class ReplayReport(NamedTuple):
+    """Outcome of replaying one folder's changes or one message"""
+    # Journal entries finished with, whether they took effect or not
+    done: Tuple[int, ...] = ()
+    # (uid, flag, add) changes the server refused
+    failed: Tuple[Tuple[int, str, bool], ...] = ()
+    # (uid, flag, add) changes the server modified the message since
+    conflicts: Tuple[Tuple[int, str, bool], ...] = ()
+    # UIDs that could not be moved
+    unmoved: Tuple[int, ...] = ()
+    # Subjects of messages sent, and (subject, error) of ones refused
+    sent: Tuple[str, ...] = ()
+    unsent: Tuple[Tuple[str, str], ...] = ()
+    error: str = ""
+    # (folder, UIDVALIDITY, UID, MODSEQ) left by the worker's own stores
+    modseqs: Tuple[Tuple[str, int, int, int], ...] = ()
+
+
+class ReplayWorker(QObject):
+    """Replays journal entries on its own connection in a background thread"""
+
+    requested = pyqtSignal(list)
+    replayed = pyqtSignal(object)
+    # Error that stopped the batch, empty when it completed, and whether
+    # the server couldn't be reached
+    finished = pyqtSignal(str, bool)
+
+    def __init__(self, base_handler: EmailHandler, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 own_modseqs: Optional[Dict[Tuple[str, int, int], int]] = None):
+        super().__init__()
+        self.base_handler = base_handler
+        self.chunk_size = chunk_size
+        self.handler = None
+        # (folder, UIDVALIDITY, UID) -> MODSEQ after the app's own stores,
+        # which are not conflicts with later changes; seeded from the
+        # journal, which keeps them across sessions
+        self.own_modseqs: Dict[Tuple[str, int, int], int] = dict(own_modseqs or {})
+        # time.monotonic() after which no new folder or message is started;
+        # set from the GUI thread by JournalSync.stop()
+        self.deadline: Optional[float] = None
+        self.requested.connect(self.replay)
+
+    def _expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    @pyqtSlot(list)
+    def replay(self, entries):
+        try:
+            if self._expired():
+                self.finished.emit("", False)
+                return
+            if self.handler is None:
+                # Connect lazily, inside the worker thread
+                self.handler = self.base_handler.clone_imap()
+            groups, sends = coalesce(entries)
+            for (folder, uidvalidity), changes in groups.items():
+                if self._expired():
+                    break
+                self.replayed.emit(self._replay_folder(folder, uidvalidity, changes))
+            for entry in sends:
+                if self._expired():
+                    break
+                self.replayed.emit(self._send(entry))
+            self.finished.emit("", False)
+        except Exception as e:
+            logger.warning("Replaying %s journal entries stopped: %s", len(entries), e)
+            # Reconnect on the next request
+            self.close()
+            self.finished.emit(str(e), is_connection_error(e))
+
+    def _replay_folder(self, folder: str, uidvalidity: int,
+                       changes: FolderChanges) -> ReplayReport:
+        flag_changes = [(uid, flag, add) for (uid, flag), (add, _) in changes.flags.items()]
+        moves = [uid for uids in changes.moves.values() for uid in uids]
+        try:
+            self.handler.select_folder(folder)
+            if uidvalidity and self.handler.uidvalidity != uidvalidity:
+                return ReplayReport(tuple(changes.ids), conflicts=tuple(flag_changes),
+                                    unmoved=tuple(moves), error="the folder was rebuilt")
+            state = self.handler.message_state(changes.uids(), folder)
+
+            stores, conflicts = [], []
+            for (uid, flag), (add, modseq) in changes.flags.items():
+                current = state.get(uid)
+                if current is None or (flag in current[0]) == add:
+                    # Gone from the server, or already as wanted
+                    continue
+                baseline = max(modseq, self.own_modseqs.get((folder, uidvalidity, uid), 0))
+                if modseq and current[1] > baseline:
+                    conflicts.append((uid, flag, add))
+                else:
+                    stores.append((uid, flag, add))
+            failed = self.handler.store_flags(stores, folder)
+            modseqs = []
+            if stores and self.handler.has_capability("CONDSTORE"):
+                stored = sorted({uid for uid, _, _ in stores})
+                for uid, (_, modseq) in self.handler.message_state(stored, folder).items():
+                    self.own_modseqs[(folder, uidvalidity, uid)] = modseq
+                    modseqs.append((folder, uidvalidity, uid, modseq))
+
+            unmoved, error = [], ""
+            for (action, target), uids in changes.moves.items():
+                present = [uid for uid in sorted(set(uids)) if uid in state]
+                if not present:
+                    continue
+                try:
+                    destination = resolve_target(self.handler, action, folder, target)
+                    for start in range(0, len(present), self.chunk_size):
+                        self.handler.move_messages(
+                            present[start:start + self.chunk_size], destination, folder
+                        )
+                except Exception as e:
+                    if is_connection_error(e):
+                        raise
+                    unmoved.extend(present)
+                    error = str(e)
+            if failed and not error:
+                error = "server refused the change"
+            return ReplayReport(tuple(changes.ids), tuple(failed), tuple(conflicts),
+                                tuple(unmoved), error=error, modseqs=tuple(modseqs))
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            logger.warning("Replaying changes to %s failed: %s", folder, e)
+            return ReplayReport(tuple(changes.ids), tuple(flag_changes),
+                                unmoved=tuple(moves), error=str(e))
+
+    def _send(self, entry: Dict) -> ReplayReport:
+        try:
+            self.handler.deliver(entry["to"], entry["subject"], entry["body"])
+            return ReplayReport((entry["id"],), sent=(entry["subject"],))
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            logger.warning("Sending a queued message failed: %s", e)
+            return ReplayReport((entry["id"],), unsent=((entry["subject"], str(e)),))
+
+    def close(self):
+        if self.handler:
+            self.handler.disconnect()
+            self.handler = None
+
+
+def _by_folder(emails: List[Dict]) -> Dict[Tuple[str, int], List[Dict]]:
+    groups: Dict[Tuple[str, int], List[Dict]] = {}
+    for email in emails:
+        key = (email.get('folder', "INBOX"), email.get('uidvalidity', 0))
+        groups.setdefault(key, []).append(email)
+    return groups
+
+
+class JournalSync(QObject):
+    """Journals changes and replays them one batch at a time"""
+
+    # Flag changes to roll back, and why
+    failed = pyqtSignal(list, str)
+    # UIDs whose move or delete didn't happen, and why
+    unmoved = pyqtSignal(list, str)
+    # Subject of a queued message that went out
+    sent = pyqtSignal(str)
+    # Subject of a queued message the server refused, and why
+    unsent = pyqtSignal(str, str)
+    # Whether the server is reachable, and entries still pending
+    state_changed = pyqtSignal(bool, int)
+
+    def __init__(self, handler: EmailHandler, journal: OfflineJournal,
+                 delay_ms: int = 300, parent=None):
+        super().__init__(parent)
+        self.journal = journal
+        self.busy = False
+        self.offline = False
+        self.stopping = False
+        self.retry_ms = RETRY_MIN_MS
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay_ms)
+        self.timer.timeout.connect(self.flush)
+        self.retry_timer = QTimer(self)
+        self.retry_timer.setSingleShot(True)
+        self.retry_timer.timeout.connect(self.flush)
+
+        self.thread = QThread()
+        self.worker = ReplayWorker(handler, own_modseqs=journal.own_modseqs)
+        self.worker.moveToThread(self.thread)
+        self.worker.replayed.connect(self.handle_replayed)
+        self.worker.finished.connect(self.handle_finished)
+        self.thread.start()
+        if len(journal):
+            # Left over from the last session
+            self.timer.start()
+
+    @property
+    def pending(self) -> int:
+        return len(self.journal)
+
+    def change(self, emails: List[Dict], flag: str, add: bool):
+        """Journal setting (add) or clearing a flag on messages."""
+        for (folder, uidvalidity), group in _by_folder(emails).items():
+            self.journal.append(
+                "flags", folder=folder, uidvalidity=uidvalidity,
+                uids=[email['uid'] for email in group], flag=flag, add=add,
+                modseqs=[email.get('modseq', 0) for email in group]
+            )
+        self._schedule()
+
+    def move(self, emails: List[Dict], action: str, target=None):
+        """Journal archiving, deleting or (action "move") moving messages to target."""
+        for (folder, uidvalidity), group in _by_folder(emails).items():
+            self.journal.append(
+                "move", folder=folder, uidvalidity=uidvalidity,
+                uids=[email['uid'] for email in group], action=action, target=target
+            )
+        self._schedule()
+
+    def send(self, to_addr: str, subject: str, body: str):
+        """Journal a message for sending."""
+        self.journal.append("send", to=to_addr, subject=subject, body=body)
+        self._schedule()
+
+    def _schedule(self):
+        self.state_changed.emit(not self.offline, self.pending)
+        if not self.offline:
+            self.timer.start()
+
+    def retry_now(self):
+        """The server answered another request; replay without waiting out the backoff."""
+        if self.retry_timer.isActive():
+            self.retry_timer.stop()
+            self.retry_ms = RETRY_MIN_MS
+            self.flush()
+
+    def flush(self):
+        """Replay the oldest pending entries, unless a batch is still out."""
+        if self.busy or self.stopping or self.worker is None or not self.pending:
+            return
+        self.busy = True
+        self.worker.requested.emit(self.journal.pending(REPLAY_BATCH))
+
+    @pyqtSlot(object)
+    def handle_replayed(self, report: ReplayReport):
+        self.journal.record_modseqs(report.modseqs)
+        self.journal.complete(report.done)
+        # A change journaled since supersedes the one that didn't take
+        superseded = {
+            (uid, flag) for (_, _, uid), flags in self.journal.pending_flags().items()
+            for flag in flags
+        }
+        conflicts = [change for change in report.conflicts if change[:2] not in superseded]
+        if conflicts:
+            self.failed.emit(conflicts, "changed on the server meanwhile")
+        failed = [change for change in report.failed if change[:2] not in superseded]
+        if failed:
+            self.failed.emit(failed, report.error)
+        if report.unmoved:
+            self.unmoved.emit(list(report.unmoved), report.error)
+        for subject in report.sent:
+            self.sent.emit(subject)
+        for subject, error in report.unsent:
+            self.unsent.emit(subject, error)
+
+    @pyqtSlot(str, bool)
+    def handle_finished(self, error: str, offline: bool):
+        self.busy = False
+        if error:
+            # Back off whatever the error, or a refused login would spin
+            self.offline = offline
+            if not self.stopping:
+                self.retry_timer.start(self.retry_ms)
+            self.retry_ms = min(self.retry_ms * 2, RETRY_MAX_MS)
+        else:
+            self.offline = False
+            self.retry_ms = RETRY_MIN_MS
+        self.state_changed.emit(not self.offline, self.pending)
+        if not error:
+            # Later batches and changes made while this one was out
+            self.flush()
+
+    def stop(self):
+        """Close the connection without the GUI thread waiting on the server.
+
+        One last batch is handed to the worker thread and given up to
+        STOP_REPLAY_MS; whatever doesn't make it stays journaled and is
+        replayed in the next session.
+        """
+        if self.worker is None:
+            return
+        self.stopping = True
+        self.timer.stop()
+        self.retry_timer.stop()
+        thread, worker = self.thread, self.worker
+        worker.deadline = time.monotonic() + STOP_REPLAY_MS / 1000
+        if self.pending and not self.offline and not self.busy:
+            self.busy = True
+            worker.requested.emit(self.journal.pending(REPLAY_BATCH))
+        # Outcomes arriving after this object is gone still reach the
+        # journal, so a message sent in the last moment isn't sent again
+        journal = self.journal
+
+        def record(report):
+            journal.record_modseqs(report.modseqs)
+            journal.complete(report.done)
+        worker.replayed.connect(record)
+        # Log out in the worker's thread once it is done
+        thread.finished.connect(worker.close, Qt.ConnectionType.DirectConnection)
+        _stopping.add((thread, worker))
+        thread.finished.connect(lambda: _release(thread, worker))
+        thread.quit()
+        if thread.wait(STOP_REPLAY_MS + 500):
+            # Record the last batch now; the event loop may not run again
+            QCoreApplication.sendPostedEvents(self, QEvent.Type.MetaCall.value)
+        else:
+            logger.debug("Journal replay still busy; letting it finish")
+        self.worker = None
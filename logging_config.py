@@ -0,0 +1,82 @@
+"""
+Leveled logging for Mail Buddy.
+
+Modules log through ``logging.getLogger("mail_buddy.<module>")`` with lazy
+%-style arguments, so a disabled debug call costs one level check. Records
+that pass go through a QueueHandler to a background QueueListener, so the
+GUI and worker threads never block on the terminal.
+
+Levels are read from MAIL_BUDDY_LOG, either a single level ("DEBUG") or
+per-module settings ("email_worker=DEBUG,email_window=INFO,WARNING"), and
+can be changed at runtime with set_level().
+"""
+
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+ROOT_LOGGER = "mail_buddy"
+DEFAULT_LEVEL = logging.WARNING
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s.%(funcName)s: %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+
+def get_logger(module: str) -> logging.Logger:
+    """Logger for a module, e.g. get_logger("email_worker")."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{module}")
+
+
+def set_level(level, module: Optional[str] = None):
+    """Set the level for one module, or for all of Mail Buddy."""
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    name = f"{ROOT_LOGGER}.{module}" if module else ROOT_LOGGER
+    logging.getLogger(name).setLevel(level)
+
+
+def apply_level_spec(spec: str):
+    """Apply a MAIL_BUDDY_LOG style spec such as 'email_worker=DEBUG,INFO'."""
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        module, _, level = part.rpartition("=")
+        set_level(level, module or None)
+
+
+def setup_logging(stream=None):
+    """Install the queue-based handler once; safe to call repeatedly."""
+    global _listener
+    if _listener is not None:
+        return
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(DEFAULT_LEVEL)
+    root.propagate = False
+
+    output = logging.StreamHandler(stream)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    root.addHandler(QueueHandler(log_queue))
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    apply_level_spec(os.environ.get("MAIL_BUDDY_LOG", ""))
+
+
+def shutdown_logging():
+    """Flush queued records and stop the background listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def debug_enabled() -> bool:
+    return logging.getLogger(ROOT_LOGGER).isEnabledFor(logging.DEBUG)
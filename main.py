@@ -1,15 +1,22 @@
 import sys
+
+# First, so startup milestones are measured from as early as possible
+import instrumentation
+
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QPushButton, QMessageBox, QCheckBox
 )
 from PyQt6.QtCore import Qt, QThread
 from PyQt6.QtGui import QCursor, QIcon
-from dotenv import load_dotenv
 
-from email_window import EmailWindow
+import styles
+# EmailWindow and EmailWorker (and the IMAP/MIME stack behind them) are
+# imported when first needed, so the login window shows sooner
 from credentials_manager import CredentialsManager
-from email_worker import EmailWorker
+from logging_config import get_logger, setup_logging
+
+logger = get_logger("main")
 
 
 class LoginWindow(QMainWindow):
@@ -18,7 +25,9 @@ class LoginWindow(QMainWindow):
         self.credentials_manager = CredentialsManager()
         self.worker = None
         self.thread = None
+        self.painted = False
         
+        self.setObjectName("login_window")
         self.setWindowTitle("Mail Buddy - Login")
         # Set window icon to bear emoji
         self.setWindowIcon(QIcon("icon.png"))
@@ -34,14 +43,8 @@ class LoginWindow(QMainWindow):
         layout = QVBoxLayout(central_widget)
         layout.setSpacing(10)
         
-        # Set rounded corners and gradient background
-        central_widget.setStyleSheet("""
-            QWidget {
-                background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
-                                          stop:0 #e6f2ff, stop:1 #ffffff);
-                border-radius: 10px;
-            }
-        """)
+        # Rounded corners and gradient background come from the app stylesheet
+        central_widget.setObjectName("login_central")
         
         # Add mascot
         # with open('mascot.txt', 'r') as f:
@@ -59,20 +62,7 @@ MAIL BUDDY
 Your friendly email companion!
                                """)
         mascot_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        mascot_label.setStyleSheet("""
-            QLabel {
-                font-family: 'Courier New', monospace;
-                color: #0078d4;
-                margin: 10px;
-                padding: 0px;
-                font-size: 18px;
-                line-height: 1.0;
-                letter-spacing: 0px;
-                white-space: pre;
-                background: transparent;
-                font-weight: bold;
-            }
-        """)
+        mascot_label.setObjectName("mascot")
         
         layout.addWidget(mascot_label)
         
@@ -100,20 +90,6 @@ Your friendly email companion!
         # Login button
         self.login_button = QPushButton("Login")
         self.login_button.setObjectName("login_button")
-        self.login_button.setStyleSheet("""
-            QPushButton#login_button {
-                background-color: #0078d4;
-                color: white;
-                border: none;
-                font-weight: bold;
-            }
-            QPushButton#login_button:hover {
-                background-color: #106ebe;
-            }
-            QPushButton#login_button:disabled {
-                background-color: #ccc;
-            }
-        """)
         
         # Add widgets to layout
         layout.addWidget(self.email_label)
@@ -128,30 +104,12 @@ Your friendly email companion!
         
         # Connect login button to function
         self.login_button.clicked.connect(self.handle_login)
-        
-        # Apply styling
-        self.setStyleSheet("""
-            QMainWindow {
-                background-color: #f5f5f5;
-            }
-            QLineEdit {
-                padding: 8px;
-                border: 1px solid #ddd;
-                border-radius: 4px;
-                background-color: white;
-            }
-            QLineEdit:focus {
-                border: 1px solid #0078d4;
-            }
-            QLabel {
-                color: #444;
-                font-size: 13px;
-            }
-            QCheckBox {
-                color: #444;
-                font-size: 13px;
-            }
-        """)
+    
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            instrumentation.milestone("login_painted")
     
     def setup_menu(self):
         # Create menu bar
@@ -203,51 +161,52 @@ Your friendly email companion!
             self.login_button.setText("Login")
     
     def handle_login(self):
-        print("[LoginWindow.handle_login] Starting login process")
+        logger.debug("Starting login process")
         email = self.email_input.text()
         password = self.password_input.text()
         
         if not email or not password:
-            print("[LoginWindow.handle_login] Missing credentials")
+            logger.debug("Missing credentials")
             QMessageBox.warning(self, "Error", "Please fill in all fields")
             return
         
         # Clean up any existing thread/worker
         if self.thread and self.thread.isRunning():
-            print("[LoginWindow.handle_login] Cleaning up existing thread")
+            logger.debug("Cleaning up existing thread")
             try:
                 self.thread.started.disconnect()
                 self.worker.connected.disconnect()
                 self.worker.error.disconnect()
                 self.worker.finished.disconnect()
             except Exception as e:
-                print(f"[LoginWindow.handle_login] Disconnect error: {str(e)}")
+                logger.warning("Disconnect error: %s", e)
             self.thread.quit()
             self.thread.wait()
-            print("[LoginWindow.handle_login] Thread cleanup complete")
+            logger.debug("Thread cleanup complete")
         
         if self.worker:
-            print("[LoginWindow.handle_login] Deleting old worker")
+            logger.debug("Deleting old worker")
             self.worker.deleteLater()
         
         if self.thread:
-            print("[LoginWindow.handle_login] Deleting old thread")
+            logger.debug("Deleting old thread")
             self.thread.deleteLater()
         
         # Set loading state
         self.set_loading(True)
         
         # Create worker and thread
-        print("[LoginWindow.handle_login] Creating new worker and thread")
+        logger.debug("Creating new worker and thread")
+        from email_worker import EmailWorker
         self.worker = EmailWorker()
         self.thread = QThread()
         
         # Move worker to thread BEFORE connecting signals
         self.worker.moveToThread(self.thread)
-        print("[LoginWindow.handle_login] Worker moved to thread")
+        logger.debug("Worker moved to thread")
         
         # Connect worker signals
-        print("[LoginWindow.handle_login] Connecting signals")
+        logger.debug("Connecting signals")
         self.worker.connected.connect(self.handle_connection_result)
         self.worker.error.connect(self.handle_error)
         self.worker.finished.connect(self.cleanup_thread)
@@ -258,14 +217,14 @@ Your friendly email companion!
         )
         
         # Start the thread
-        print("[LoginWindow.handle_login] Starting thread")
+        logger.debug("Starting thread")
         self.thread.start()
-        print("[LoginWindow.handle_login] Thread started")
+        logger.debug("Thread started")
     
     def handle_connection_result(self, success, handler):
-        print(f"[LoginWindow.handle_connection_result] Connection result: {success}")
+        logger.debug("Connection result: %s", success)
         if success:
-            print("[LoginWindow.handle_connection_result] Saving credentials")
+            logger.debug("Saving credentials")
             # Save credentials if remember me is checked
             self.credentials_manager.save_credentials(
                 self.email_input.text(),
@@ -273,14 +232,15 @@ Your friendly email companion!
                 self.remember_checkbox.isChecked()
             )
             
-            print("[LoginWindow.handle_connection_result] Opening email window")
+            logger.debug("Opening email window")
             # Open main window
+            from email_window import EmailWindow
             self.email_window = EmailWindow(self.email_input.text())
             self.email_window.email_handler = handler
             self.email_window.show()
             self.close()
         else:
-            print("[LoginWindow.handle_connection_result] Login failed")
+            logger.info("Login failed")
             QMessageBox.warning(
                 self,
                 "Error",
@@ -289,26 +249,26 @@ Your friendly email companion!
             )
     
     def handle_error(self, error_msg):
-        print(f"[LoginWindow.handle_error] Error: {error_msg}")
+        logger.error("Error: %s", error_msg)
         QMessageBox.warning(self, "Error", str(error_msg))
     
     def cleanup_thread(self):
         """Clean up thread and worker after operation is complete"""
-        print("[LoginWindow.cleanup_thread] Starting cleanup")
+        logger.debug("Starting cleanup")
         self.set_loading(False)
         
         if self.thread:
-            print("[LoginWindow.cleanup_thread] Cleaning up thread")
+            logger.debug("Cleaning up thread")
             self.thread.quit()
             self.thread.wait()
             self.thread.deleteLater()
             self.thread = None
         
         if self.worker:
-            print("[LoginWindow.cleanup_thread] Cleaning up worker")
+            logger.debug("Cleaning up worker")
             self.worker.deleteLater()
             self.worker = None
-        print("[LoginWindow.cleanup_thread] Cleanup complete")
+        logger.debug("Cleanup complete")
     
     def handle_logout(self):
         # Clear saved credentials and reset fields
@@ -322,61 +282,13 @@ Your friendly email companion!
 
 
 def main():
+    from dotenv import load_dotenv
     load_dotenv()
+    setup_logging()
     app = QApplication(sys.argv)
     
-    # Set application-wide style
-    app.setStyleSheet("""
-        QMainWindow {
-            background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
-                                      stop:0 #e6f2ff, stop:1 #ffffff);
-        }
-        QPushButton {
-            border-radius: 5px;
-            background-color: white;
-            color: #0078d4;
-            border: 1px solid #0078d4;
-            padding: 8px;
-        }
-        QPushButton:hover {
-            background-color: #f0f8ff;
-        }
-        QPushButton#login_button {
-            background-color: #0078d4;
-            color: white;
-            border: none;
-            font-weight: bold;
-        }
-        QPushButton#login_button:hover {
-            background-color: #106ebe;
-        }
-        QPushButton#login_button:disabled {
-            background-color: #ccc;
-        }
-        QPushButton#toggle_button {
-            background-color: white;
-            color: #0078d4;
-            border: 1px solid #ccc;
-            padding: 5px;
-        }
-        QPushButton#toggle_button:hover {
-            background-color: #f0f8ff;
-            border-color: #0078d4;
-        }
-        QLineEdit {
-            border-radius: 5px;
-            padding: 8px;
-            border: 1px solid #ccc;
-            background-color: white;
-        }
-        QLineEdit:focus {
-            border: 1px solid #0078d4;
-        }
-        QCheckBox {
-            border-radius: 3px;
-            background: transparent;
-        }
-    """)
+    # One stylesheet for the whole application, see styles.py
+    styles.apply(app)
     
     window = LoginWindow()
     window.show()
@@ -0,0 +1,101 @@
+"""
+MIME decoding of fetched messages, in a process pool for large batches.
+
+Parsing RFC 822 messages and decoding charsets is CPU-bound and holds the
+GIL, so decoding a big initial sync on the worker thread competes with the
+GUI thread. decode_messages() hands large batches to a ProcessPoolExecutor
+instead: raw bytes go to the workers in chunks (pickling a bytes object is
+a single copy) and compact record dicts come back. The waiting thread
+releases the GIL while it blocks on the results.
+
+Small batches are decoded inline, since starting and feeding worker
+processes costs more than it saves. The pool is started on first use with
+the "spawn" method, because forking a process that runs Qt threads is not
+safe, and shut down at exit.
+
+MAIL_BUDDY_DECODE_WORKERS sets the pool size (default: one per CPU); 1
+disables the pool.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import header_decoder
+import instrumentation
+from logging_config import get_logger
+
+logger = get_logger("mime_decoder")
+
+WORKERS = int(os.environ.get("MAIL_BUDDY_DECODE_WORKERS", "0")) or os.cpu_count() or 1
+
+# Batches smaller than this (in messages or bytes) are decoded inline
+PARALLEL_MIN_MESSAGES = 200
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+# Work items per worker, so a slow chunk doesn't leave the others idle
+CHUNKS_PER_WORKER = 4
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+RawMessage = Tuple[str, bytes]
+
+
+def _decode_chunk(messages: Sequence[RawMessage]) -> List[Dict]:
+    # Runs in a worker process; imported here to avoid a circular import
+    from email_handler import message_to_record
+    return [message_to_record(msg_id, raw) for msg_id, raw in messages]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.debug("Started MIME decode pool with %s workers", WORKERS)
+        return _pool
+
+
+def shutdown():
+    """Stop the worker processes, if any were started."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+atexit.register(shutdown)
+
+
+def decode_messages(messages: Sequence[RawMessage]) -> List[Dict]:
+    """Decode (id, raw bytes) pairs into list records, in input order."""
+    total_bytes = sum(len(raw) for _, raw in messages)
+    if WORKERS <= 1 or (len(messages) < PARALLEL_MIN_MESSAGES
+                        and total_bytes < PARALLEL_MIN_BYTES):
+        return _decode_chunk(messages)
+
+    chunk_size = max(1, -(-len(messages) // (WORKERS * CHUNKS_PER_WORKER)))
+    chunks = [messages[i:i + chunk_size] for i in range(0, len(messages), chunk_size)]
+    with instrumentation.span("mime_parse"):
+        try:
+            pool = _get_pool()
+            records = []
+            for decoded in pool.map(_decode_chunk, chunks):
+                # Unpickled strings are new copies; share them again
+                records.extend(map(header_decoder.intern_record, decoded))
+        except (BrokenProcessPool, OSError) as e:
+            # A broken pool (e.g. a killed worker) must not lose the sync
+            logger.warning("MIME decode pool failed, decoding inline: %s", e)
+            shutdown()
+            return _decode_chunk(messages)
+    instrumentation.count("pool_decoded_messages", len(records))
+    return records
@@ -0,0 +1,285 @@
+"""
+Durable journal of changes waiting to reach the server.
+
+Flag changes, moves and deletes, and outgoing mail are applied to the
+window's records at once and appended here first, one JSON object per
+line, flushed and fsynced. JournalSync replays the pending entries when the
+server answers and marks them done as it confirms them, so nothing is lost
+to a dropped connection or a crash. Replaying an entry twice is harmless:
+stores are idempotent and moves skip messages already gone from the folder.
+
+Completions are lines of their own ({"done": [3, 4]}). Once nothing is
+pending, or done lines pile up, the file is rewritten with just the
+pending entries. A last line cut short by a crash is skipped.
+
+The MODSEQ each of the app's own stores left on a message is kept next to
+the journal (<account>.modseqs.json, the newest MAX_OWN_MODSEQS), so after
+a restart a pending change isn't mistaken for a conflict with the app's
+own earlier one.
+
+Queued outgoing messages are stored in the journal in plain text. The
+files are created readable and writable by the user only (0600).
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from body_cache import CACHE_DIR
+from logging_config import get_logger
+
+logger = get_logger("offline_journal")
+
+JOURNAL_DIR = os.path.join(CACHE_DIR, "journal")
+
+# Rewrite the file once it holds this many lines beyond the pending entries
+COMPACT_AFTER = 1000
+
+# MODSEQs of the app's own stores remembered per account, newest kept
+MAX_OWN_MODSEQS = 10000
+
+OPS = ("flags", "move", "send")
+
+
+def _open_private(path: str, mode: str):
+    """Open a file for writing ("w" or "a") that only this user can read."""
+    flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if mode == "a" else os.O_TRUNC)
+    fd = os.open(path, flags, 0o600)
+    if hasattr(os, "fchmod"):
+        # Files written before this was enforced
+        os.fchmod(fd, 0o600)
+    return os.fdopen(fd, mode, encoding="utf-8")
+
+
+class FolderChanges:
+    """Coalesced flag changes and moves for one folder"""
+
+    def __init__(self):
+        self.ids: List[int] = []
+        # (uid, flag) -> (add, modseq when the change was made); last change wins
+        self.flags: Dict[Tuple[int, str], Tuple[bool, int]] = {}
+        # (action, target) -> UIDs
+        self.moves: Dict[Tuple[str, Optional[str]], List[int]] = {}
+
+    def uids(self) -> List[int]:
+        uids = {uid for uid, _ in self.flags}
+        for moved in self.moves.values():
+            uids.update(moved)
+        return sorted(uids)
+
+
+def coalesce(entries: Iterable[Dict]) -> Tuple[Dict[Tuple[str, int], FolderChanges], List[Dict]]:
+    """Group journal entries into per-(folder, UIDVALIDITY) changes, and sends.
+
+    A message's flag keeps the modseq of its first pending change: that is
+    the server state the user last saw.
+    """
+    groups: Dict[Tuple[str, int], FolderChanges] = {}
+    sends = []
+    for entry in entries:
+        if entry["op"] == "send":
+            sends.append(entry)
+            continue
+        changes = groups.setdefault((entry["folder"], entry["uidvalidity"]), FolderChanges())
+        changes.ids.append(entry["id"])
+        if entry["op"] == "flags":
+            modseqs = entry.get("modseqs") or [0] * len(entry["uids"])
+            for uid, modseq in zip(entry["uids"], modseqs):
+                key = (uid, entry["flag"])
+                first = changes.flags.get(key, (None, modseq))[1]
+                changes.flags[key] = (entry["add"], first)
+        else:
+            changes.moves.setdefault((entry["action"], entry.get("target")), []).extend(entry["uids"])
+    return groups, sends
+
+
+class OfflineJournal:
+    """Append-only file of pending changes, with the pending ones in memory
+
+    Used from the GUI thread only; the replay worker gets copies.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Entry id -> entry, oldest first
+        self.entries: Dict[int, Dict] = {}
+        self.next_id = 1
+        self.lines = 0
+        self._file = None
+        self.modseqs_path = os.path.splitext(path)[0] + ".modseqs.json"
+        # (folder, UIDVALIDITY, UID) -> MODSEQ after the app's own store,
+        # oldest first
+        self.own_modseqs: Dict[Tuple[str, int, int], int] = {}
+        self._load()
+        self._load_modseqs()
+
+    @classmethod
+    def for_account(cls, email_address: str) -> "OfflineJournal":
+        """Journal in a per-account file under CACHE_DIR."""
+        account = hashlib.sha1(email_address.lower().encode("utf-8")).hexdigest()[:16]
+        return cls(os.path.join(JOURNAL_DIR, account + ".jsonl"))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _load(self):
+        damaged = False
+        line = ""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self.lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        damaged = True
+                        continue
+                    if "done" in record:
+                        for entry_id in record["done"]:
+                            self.entries.pop(entry_id, None)
+                    else:
+                        self.entries[record["id"]] = record
+                        self.next_id = max(self.next_id, record["id"] + 1)
+            # A torn last line may still parse
+            damaged = damaged or (line != "" and not line.endswith("\n"))
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.error("Failed to read the offline journal: %s", e)
+            return
+        if damaged:
+            # Appending after a torn line would tear the next one too
+            logger.warning("Skipped a damaged line in the offline journal")
+            self._compact()
+        logger.debug("%s journal entries pending", len(self.entries))
+
+    def _load_modseqs(self):
+        try:
+            with open(self.modseqs_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for folder, uidvalidity, uid, modseq in data["modseqs"]:
+                self.own_modseqs[(folder, uidvalidity, uid)] = modseq
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error("Failed to read the journal's MODSEQs: %s", e)
+
+    def _write(self, record: Dict):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+            self._file = _open_private(self.path, "a")
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.lines += 1
+
+    def append(self, op: str, **fields) -> Dict:
+        """Record a change durably before it is applied; returns the entry."""
+        if op not in OPS:
+            raise ValueError(f"Unknown journal operation {op!r}")
+        entry = {"id": self.next_id, "op": op, **fields}
+        self._write(entry)
+        self.next_id += 1
+        self.entries[entry["id"]] = entry
+        return entry
+
+    def pending(self, limit: Optional[int] = None) -> List[Dict]:
+        """Pending entries, oldest first."""
+        entries = list(self.entries.values())
+        return entries if limit is None else entries[:limit]
+
+    def pending_flags(self) -> Dict[Tuple[str, int, int], Dict[str, bool]]:
+        """(folder, UIDVALIDITY, UID) -> {flag: add} of the pending flag changes."""
+        flags: Dict[Tuple[str, int, int], Dict[str, bool]] = {}
+        for entry in self.entries.values():
+            if entry["op"] == "flags":
+                for uid in entry["uids"]:
+                    key = (entry["folder"], entry["uidvalidity"], uid)
+                    flags.setdefault(key, {})[entry["flag"]] = entry["add"]
+        return flags
+
+    def complete(self, ids: Iterable[int]):
+        """Mark entries done once the server has them."""
+        ids = [entry_id for entry_id in ids if entry_id in self.entries]
+        if not ids:
+            return
+        self._write({"done": ids})
+        for entry_id in ids:
+            del self.entries[entry_id]
+        if not self.entries or self.lines - len(self.entries) > COMPACT_AFTER:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the file with only the pending entries."""
+        self.close()
+        try:
+            if not self.entries:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                self.lines = 0
+                return
+            temp_path = self.path + ".tmp"
+            with _open_private(temp_path, "w") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            self.lines = len(self.entries)
+        except OSError as e:
+            logger.error("Failed to compact the offline journal: %s", e)
+
+    def record_modseqs(self, modseqs: Iterable[Tuple[str, int, int, int]]):
+        """Remember (folder, UIDVALIDITY, UID, MODSEQ) left by the app's own stores."""
+        modseqs = [entry for entry in modseqs
+                   if self.own_modseqs.get(tuple(entry[:3])) != entry[3]]
+        if not modseqs:
+            # Nothing new, e.g. a report seen twice while stopping
+            return
+        for folder, uidvalidity, uid, modseq in modseqs:
+            key = (folder, uidvalidity, uid)
+            # Re-inserted so the newest are kept
+            self.own_modseqs.pop(key, None)
+            self.own_modseqs[key] = modseq
+        while len(self.own_modseqs) > MAX_OWN_MODSEQS:
+            del self.own_modseqs[next(iter(self.own_modseqs))]
+        try:
+            os.makedirs(os.path.dirname(self.modseqs_path), mode=0o700, exist_ok=True)
+            temp_path = self.modseqs_path + ".tmp"
+            with _open_private(temp_path, "w") as f:
+                json.dump({"modseqs": [list(key) + [modseq]
+                                       for key, modseq in self.own_modseqs.items()]}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.modseqs_path)
+        except OSError as e:
+            logger.error("Failed to save the journal's MODSEQs: %s", e)
+
+    def overlay(self, records: List[Dict]) -> List[Dict]:
+        """Freshly synced records as they will be once the pending changes
+        reach the server: moved messages dropped and flags changed."""
+        if not self.entries:
+            return records
+        flags = self.pending_flags()
+        moved = {
+            (entry["folder"], entry["uidvalidity"], uid)
+            for entry in self.entries.values() if entry["op"] == "move"
+            for uid in entry["uids"]
+        }
+        result = []
+        for record in records:
+            key = (record.get('folder'), record.get('uidvalidity'), record.get('uid'))
+            if key in moved:
+                continue
+            changes = flags.get(key)
+            if changes:
+                record['flags'] = [f for f in record.get('flags', ()) if f not in changes] \
+                    + [flag for flag, add in changes.items() if add]
+            result.append(record)
+        return result
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,394 @@
+"""
+Background prefetch of message bodies after a header-only sync.
+
+The window tells the scheduler which messages are likely to be opened next:
+rows in the viewport, neighbours of the selection and unread messages, in
+that order. The scheduler fetches them in small batches over its own IMAP
+connections, so the sync connection is never blocked. Two budgets keep
+prefetching cheap:
+
+* concurrency: at most ``concurrency`` batches in flight. Given an
+  AsyncioBridge, the batches are pipelined on one asyncio connection
+  (AsyncBodyFetcher); otherwise each gets a thread and connection of its
+  own, bounded by the provider's connection limit;
+* bytes: at most ``bytes_per_minute`` of message data (by RFC822.SIZE)
+  requested over any sliding minute.
+
+Messages the user opens explicitly jump the queue and ignore the byte
+budget. Retargeting drops queued messages that left the target set, so
+scrolling away cancels their prefetch; batches already on the wire finish
+and are kept. Messages whose batch failed are left out of the queue for
+RETRY_BACKOFF seconds, doubling with each failure, and after MAX_ATTEMPTS
+failures are only fetched when the user opens them.
+"""
+
+import asyncio
+import socket
+import sys
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PyQt6.QtCore import Qt, QObject, QThread, QTimer, pyqtSignal, pyqtSlot
+
+import instrumentation
+import mime_decoder
+from async_imap import AsyncIMAPClient
+from email_handler import EmailHandler
+from logging_config import get_logger
+from provider_profiles import ProviderProfile
+from qt_asyncio import AsyncioBridge
+
+logger = get_logger("prefetch")
+
+# Seconds before a message whose fetch failed is queued again; doubles per failure
+RETRY_BACKOFF = 30
+# Failed fetches after which a message is no longer prefetched
+MAX_ATTEMPTS = 5
+
+# Stopped threads that were still busy, with their workers, kept until they
+# finish: a QThread destroyed while running aborts the process
+_stopping = set()
+
+
+def _release(thread: QThread, worker: "BodyFetchWorker"):
+    thread.wait()
+    _stopping.discard((thread, worker))
+
+
+class BodyFetchWorker(QObject):
+    """Fetches bodies on its own IMAP connection in a background thread"""
+
+    requested = pyqtSignal(list)
+    bodies_fetched = pyqtSignal(int, dict)
+    failed = pyqtSignal(int, list, str)
+
+    def __init__(self, slot: int, base_handler: EmailHandler, folder: str):
+        super().__init__()
+        self.slot = slot
+        self.base_handler = base_handler
+        self.folder = folder
+        self.handler = None
+        # Set from the GUI thread by stop(); batches still queued are skipped
+        self.cancelled = False
+        self.requested.connect(self.fetch)
+
+    @pyqtSlot(list)
+    def fetch(self, uids):
+        if self.cancelled:
+            return
+        try:
+            if self.handler is None:
+                # Connect lazily, inside the worker thread
+                self.handler = self.base_handler.clone_imap()
+            with instrumentation.span("prefetch"):
+                bodies = self.handler.fetch_bodies(uids, self.folder)
+            self.bodies_fetched.emit(self.slot, bodies)
+        except Exception as e:
+            logger.warning("Prefetch of %s messages failed: %s", len(uids), e)
+            # Reconnect on the next request
+            self.close()
+            self.failed.emit(self.slot, uids, str(e))
+
+    def close(self):
+        if self.handler:
+            self.handler.disconnect()
+            self.handler = None
+
+    def interrupt(self):
+        """Unblock a fetch waiting on the server; called from another thread."""
+        handler = self.handler
+        try:
+            handler.imap.sock.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):
+            pass
+
+
+class AsyncBodyFetcher(QObject):
+    """Fetches bodies for every slot over one pipelined asyncio connection"""
+
+    bodies_fetched = pyqtSignal(int, dict)
+    failed = pyqtSignal(int, list, str)
+
+    def __init__(self, bridge: AsyncioBridge, base_handler: EmailHandler, folder: str):
+        super().__init__()
+        self.bridge = bridge
+        self.base_handler = base_handler
+        self.folder = folder
+        # Task opening the connection; only touched on the bridge's loop
+        self._connecting = None
+        self.futures = set()
+
+    @staticmethod
+    def supports(profile: ProviderProfile) -> bool:
+        """Whether AsyncIMAPClient can log in to this provider."""
+        settings = profile.imap
+        return settings.auth == "password" and (
+            settings.tls != "starttls" or sys.version_info >= (3, 11)
+        )
+
+    def fetch(self, slot: int, uids: List[int]):
+        future = self.bridge.submit(
+            self._fetch(uids),
+            lambda bodies: self.bodies_fetched.emit(slot, bodies),
+            lambda error: self._failed(slot, uids, error),
+        )
+        self.futures.add(future)
+        future.add_done_callback(self.futures.discard)
+
+    def _failed(self, slot: int, uids: List[int], error: Exception):
+        logger.warning("Prefetch of %s messages failed: %s", len(uids), error)
+        self.failed.emit(slot, uids, str(error))
+
+    async def _client(self) -> AsyncIMAPClient:
+        task = self._connecting
+        if task is None or (task.done() and (
+                task.cancelled() or task.exception() or task.result().broken)):
+            # Reconnect after a failure; batches waiting meanwhile share it
+            task = self._connecting = asyncio.ensure_future(self._connect())
+        return await asyncio.shield(task)
+
+    async def _connect(self) -> AsyncIMAPClient:
+        settings = self.base_handler.profile.imap
+        client = AsyncIMAPClient(settings.host, settings.port, settings.tls)
+        try:
+            await client.connect()
+            await client.login(settings.resolve_username(self.base_handler.email_address),
+                               self.base_handler.password)
+            if self.base_handler.compression:
+                await client.compress()
+        except BaseException:
+            await client.close()
+            raise
+        return client
+
+    async def _fetch(self, uids: List[int]) -> Dict[int, Dict]:
+        client = await self._client()
+        with instrumentation.span("prefetch"):
+            raw = await client.fetch_bodies(uids, self.folder)
+        # Decoding is CPU work; keep it off the loop the other batches share
+        records = await asyncio.get_running_loop().run_in_executor(
+            None, mime_decoder.decode_messages, [(str(uid), raw[uid]) for uid in sorted(raw)]
+        )
+        return {int(record["id"]): record for record in records}
+
+    async def _close(self):
+        task = self._connecting
+        self._connecting = None
+        if task is not None:
+            try:
+                client = await task
+            except Exception:
+                return
+            await client.logout()
+
+    def close(self):
+        """Cancel batches in flight and log out, without waiting."""
+        for future in list(self.futures):
+            future.cancel()
+        self.bridge.submit(self._close())
+
+
+class PrefetchScheduler(QObject):
+    """Decides which bodies to download next and keeps within budget"""
+
+    bodies_ready = pyqtSignal(dict)
+    fetch_failed = pyqtSignal(list, str)
+
+    def __init__(self, handler: EmailHandler, folder: str = "INBOX",
+                 concurrency: Optional[int] = None,
+                 bytes_per_minute: int = 5_000_000, batch_size: int = 5,
+                 bridge: Optional[AsyncioBridge] = None, parent=None):
+        super().__init__(parent)
+        if bridge is not None and not AsyncBodyFetcher.supports(handler.profile):
+            bridge = None
+        if concurrency is None:
+            # Leave one connection for the sync worker
+            concurrency = 2 if bridge else max(1, min(2, handler.profile.max_connections - 1))
+        self.bytes_per_minute = bytes_per_minute
+        self.batch_size = batch_size
+
+        self.sizes: Dict[int, int] = {}
+        self.loaded = set()
+        self.queue: List[int] = []
+        self.urgent = deque()
+        self.in_flight: Dict[int, List[int]] = {}
+        self.spent = deque()
+        # UID -> (failed fetches, monotonic time it may be queued again)
+        self.failures: Dict[int, Tuple[int, float]] = {}
+
+        self.retry_timer = QTimer(self)
+        self.retry_timer.setSingleShot(True)
+        self.retry_timer.timeout.connect(self.pump)
+
+        self.threads = []
+        self.workers = []
+        self.idle_slots = list(range(concurrency))
+        self.fetcher = None
+        if bridge is not None:
+            self.fetcher = AsyncBodyFetcher(bridge, handler, folder)
+            self.fetcher.bodies_fetched.connect(self.handle_bodies_fetched)
+            self.fetcher.failed.connect(self.handle_failed)
+            return
+        for slot in range(concurrency):
+            thread = QThread()
+            worker = BodyFetchWorker(slot, handler, folder)
+            worker.moveToThread(thread)
+            worker.bodies_fetched.connect(self.handle_bodies_fetched)
+            worker.failed.connect(self.handle_failed)
+            thread.start()
+            self.threads.append(thread)
+            self.workers.append(worker)
+
+    def set_sizes(self, sizes: Dict[int, int]):
+        """Record message sizes, used to charge the byte budget."""
+        self.sizes.update(sizes)
+
+    def mark_loaded(self, uids: Iterable[int]):
+        self.loaded.update(uids)
+
+    def forget(self, uids: Iterable[int]):
+        """Treat bodies as not downloaded, e.g. after a cache eviction."""
+        self.loaded.difference_update(uids)
+
+    def is_pending(self, uid: int) -> bool:
+        return any(uid in batch for batch in self.in_flight.values())
+
+    def update_targets(self, visible: Iterable[int], neighbours: Iterable[int] = (),
+                       unread: Iterable[int] = ()):
+        """Replace the prefetch queue, in priority order."""
+        queue = []
+        seen = set()
+        now = time.monotonic()
+        for group in (visible, neighbours, unread):
+            for uid in group:
+                if uid in seen or uid in self.loaded or self.is_pending(uid) \
+                        or self._backing_off(uid, now):
+                    continue
+                seen.add(uid)
+                queue.append(uid)
+        cancelled = sum(1 for uid in self.queue if uid not in seen)
+        if cancelled:
+            instrumentation.count("prefetch_cancelled", cancelled)
+        self.queue = queue
+        self.pump()
+
+    def _backing_off(self, uid: int, now: float) -> bool:
+        failure = self.failures.get(uid)
+        if failure is None:
+            return False
+        attempts, retry_at = failure
+        return attempts >= MAX_ATTEMPTS or now < retry_at
+
+    def request(self, uid: int):
+        """Fetch a body the user is waiting for, ahead of everything else."""
+        if uid in self.loaded or self.is_pending(uid):
+            return
+        self.urgent.append(uid)
+        if uid in self.queue:
+            self.queue.remove(uid)
+        self.pump()
+
+    def pump(self):
+        """Dispatch batches to idle connections while the budgets allow."""
+        while self.idle_slots:
+            batch = self._next_batch()
+            if not batch:
+                break
+            slot = self.idle_slots.pop()
+            self.in_flight[slot] = batch
+            if self.fetcher:
+                self.fetcher.fetch(slot, batch)
+            else:
+                self.workers[slot].requested.emit(batch)
+
+    def _next_batch(self) -> List[int]:
+        batch = []
+        while self.urgent and len(batch) < self.batch_size:
+            uid = self.urgent.popleft()
+            if uid not in self.loaded:
+                batch.append(uid)
+        if batch:
+            self._charge(batch)
+            return batch
+
+        now = time.monotonic()
+        while self.spent and now - self.spent[0][0] >= 60:
+            self.spent.popleft()
+        spent = sum(size for _, size in self.spent)
+        while self.queue and len(batch) < self.batch_size:
+            size = self.sizes.get(self.queue[0], 0)
+            if spent + size > self.bytes_per_minute and (batch or self.spent):
+                # Out of budget: try again when the oldest charge expires
+                if not batch and not self.retry_timer.isActive():
+                    delay = 60 - (now - self.spent[0][0])
+                    self.retry_timer.start(max(100, int(delay * 1000)))
+                break
+            spent += size
+            batch.append(self.queue.pop(0))
+        if batch:
+            self._charge(batch)
+        return batch
+
+    def _charge(self, batch: List[int]):
+        size = sum(self.sizes.get(uid, 0) for uid in batch)
+        self.spent.append((time.monotonic(), size))
+        instrumentation.count("prefetch_bytes", size)
+
+    def handle_bodies_fetched(self, slot: int, bodies: dict):
+        requested = self.in_flight.pop(slot, [])
+        self.idle_slots.append(slot)
+        self.loaded.update(bodies)
+        for uid in requested:
+            self.failures.pop(uid, None)
+        instrumentation.count("prefetch_messages", len(bodies))
+        missing = [uid for uid in requested if uid not in bodies]
+        if missing:
+            # Expunged on the server since the header sync
+            self.loaded.update(missing)
+        if bodies:
+            self.bodies_ready.emit(bodies)
+        self.pump()
+
+    def handle_failed(self, slot: int, uids: list, error: str):
+        self.in_flight.pop(slot, None)
+        self.idle_slots.append(slot)
+        now = time.monotonic()
+        for uid in uids:
+            attempts = self.failures.get(uid, (0, 0))[0] + 1
+            self.failures[uid] = (attempts, now + RETRY_BACKOFF * 2 ** (attempts - 1))
+            if attempts == MAX_ATTEMPTS:
+                logger.info("Giving up prefetching message %s after %s failures", uid, attempts)
+        instrumentation.count("prefetch_failed", len(uids))
+        self.fetch_failed.emit(uids, error)
+        self.pump()
+
+    def stop(self):
+        """Drop queued work and close the prefetch connections.
+
+        Waits up to two seconds in all; a thread still busy after that is
+        interrupted and left to finish in the background.
+        """
+        self.queue.clear()
+        self.urgent.clear()
+        self.retry_timer.stop()
+        if self.fetcher:
+            self.fetcher.close()
+            self.fetcher = None
+        for thread, worker in zip(self.threads, self.workers):
+            worker.bodies_fetched.disconnect(self.handle_bodies_fetched)
+            worker.failed.disconnect(self.handle_failed)
+            worker.cancelled = True
+            # Log out in the worker's thread once its current batch is done
+            thread.finished.connect(worker.close, Qt.ConnectionType.DirectConnection)
+            _stopping.add((thread, worker))
+            thread.finished.connect(lambda t=thread, w=worker: _release(t, w))
+            thread.quit()
+        deadline = time.monotonic() + 2
+        for thread, worker in zip(self.threads, self.workers):
+            if not thread.wait(max(1, int((deadline - time.monotonic()) * 1000))):
+                logger.debug("Prefetch thread still busy; letting it finish")
+                worker.interrupt()
+        self.threads.clear()
+        self.workers.clear()
+        self.idle_slots.clear()
@@ -0,0 +1,269 @@
+import json
+import os
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional
+
+from logging_config import get_logger
+
+logger = get_logger("provider_profiles")
+
+
+# Tuning defaults per server family. Gmail tolerates large FETCH batches but
+# caps concurrent IMAP sessions per account, Exchange throttles aggressively
+# on both, and a local Dovecot is limited mostly by our own bandwidth.
+PROVIDER_TUNING = {
+    "gmail": {"fetch_batch_size": 100, "max_connections": 4},
+    "exchange": {"fetch_batch_size": 25, "max_connections": 2},
+    "dovecot": {"fetch_batch_size": 200, "max_connections": 8},
+    "generic": {"fetch_batch_size": 50, "max_connections": 2},
+}
+
+TLS_MODES = ("ssl", "starttls", "none")
+AUTH_METHODS = ("password", "plain", "cram-md5", "none")
+
+# Mapping of autoconfig <socketType>/<authentication> values to ours
+_AUTOCONFIG_SOCKET_TYPES = {
+    "SSL": "ssl",
+    "STARTTLS": "starttls",
+    "plain": "none",
+}
+_AUTOCONFIG_AUTH_METHODS = {
+    "password-cleartext": "password",
+    "plain": "password",
+    "password-encrypted": "cram-md5",
+    "secure": "cram-md5",
+    "none": "none",
+}
+
+
+class ServerSettings:
+    """Connection settings for a single IMAP or SMTP endpoint"""
+
+    def __init__(self, host: str, port: int, tls: str = "ssl",
+                 auth: str = "password", username: str = "%EMAILADDRESS%"):
+        if tls not in TLS_MODES:
+            raise ValueError(f"Unsupported TLS mode: {tls}")
+        if auth not in AUTH_METHODS:
+            raise ValueError(f"Unsupported auth method: {auth}")
+        self.host = host
+        self.port = int(port)
+        self.tls = tls
+        self.auth = auth
+        self.username = username
+
+    def resolve_username(self, email_address: str) -> str:
+        """Expand autoconfig placeholders in the login name."""
+        local_part, _, domain = email_address.partition("@")
+        return (self.username
+                .replace("%EMAILADDRESS%", email_address)
+                .replace("%EMAILLOCALPART%", local_part)
+                .replace("%EMAILDOMAIN%", domain))
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ServerSettings":
+        return cls(
+            data["host"],
+            data["port"],
+            data.get("tls", "ssl"),
+            data.get("auth", "password"),
+            data.get("username", "%EMAILADDRESS%"),
+        )
+
+
+class ProviderProfile:
+    """Endpoints, capability hints and throttling limits for one provider"""
+
+    def __init__(self, name: str, imap: ServerSettings, smtp: ServerSettings,
+                 domains: Optional[List[str]] = None, kind: str = "generic",
+                 capabilities: Optional[List[str]] = None,
+                 fetch_batch_size: Optional[int] = None,
+                 max_connections: Optional[int] = None):
+        tuning = PROVIDER_TUNING.get(kind, PROVIDER_TUNING["generic"])
+        self.name = name
+        self.imap = imap
+        self.smtp = smtp
+        self.domains = [d.lower() for d in (domains or [])]
+        self.kind = kind
+        # Capabilities we expect the server to advertise; the live
+        # CAPABILITY response always takes precedence once connected.
+        self.capabilities = [c.upper() for c in (capabilities or [])]
+        self.fetch_batch_size = int(fetch_batch_size or tuning["fetch_batch_size"])
+        self.max_connections = int(max_connections or tuning["max_connections"])
+
+    def has_capability(self, name: str) -> bool:
+        return name.upper() in self.capabilities
+
+    @classmethod
+    def from_dict(cls, name: str, data: Dict) -> "ProviderProfile":
+        return cls(
+            name,
+            ServerSettings.from_dict(data["imap"]),
+            ServerSettings.from_dict(data["smtp"]),
+            domains=data.get("domains"),
+            kind=data.get("kind", "generic"),
+            capabilities=data.get("capabilities"),
+            fetch_batch_size=data.get("fetch_batch_size"),
+            max_connections=data.get("max_connections"),
+        )
+
+
+def guess_provider_kind(hostname: str) -> str:
+    """Guess the server family from a hostname for tuning defaults."""
+    hostname = hostname.lower()
+    if hostname.endswith(("gmail.com", "googlemail.com")):
+        return "gmail"
+    if "outlook" in hostname or "office365" in hostname or "exchange" in hostname:
+        return "exchange"
+    if "dovecot" in hostname:
+        return "dovecot"
+    return "generic"
+
+
+def parse_autoconfig(xml_text: str) -> List[ProviderProfile]:
+    """Parse a Thunderbird-style autoconfig document into profiles."""
+    root = ET.fromstring(xml_text)
+    profiles = []
+    for provider in root.iter("emailProvider"):
+        imap = _parse_autoconfig_server(provider, "incomingServer", "imap")
+        smtp = _parse_autoconfig_server(provider, "outgoingServer", "smtp")
+        if imap is None or smtp is None:
+            continue
+        domains = [d.text.strip() for d in provider.findall("domain") if d.text]
+        profiles.append(ProviderProfile(
+            provider.get("id") or imap.host,
+            imap,
+            smtp,
+            domains=domains,
+            kind=guess_provider_kind(imap.host),
+        ))
+    return profiles
+
+
+def _parse_autoconfig_server(provider, tag, server_type):
+    for server in provider.findall(tag):
+        if server.get("type") != server_type:
+            continue
+        socket_type = server.findtext("socketType", "SSL").strip()
+        authentication = server.findtext("authentication", "password-cleartext").strip()
+        auth = _AUTOCONFIG_AUTH_METHODS.get(authentication)
+        if auth is None:
+            # OAuth2 and friends are not supported, try the next server entry
+            continue
+        return ServerSettings(
+            server.findtext("hostname").strip(),
+            int(server.findtext("port")),
+            _AUTOCONFIG_SOCKET_TYPES.get(socket_type, "ssl"),
+            auth,
+            server.findtext("username", "%EMAILADDRESS%").strip(),
+        )
+    return None
+
+
+def _builtin_profiles() -> Dict[str, ProviderProfile]:
+    return {
+        "gmail": ProviderProfile(
+            "gmail",
+            ServerSettings("imap.gmail.com", 993, "ssl"),
+            ServerSettings("smtp.gmail.com", 587, "starttls"),
+            domains=["gmail.com", "googlemail.com"],
+            kind="gmail",
+            capabilities=["IDLE", "MOVE", "UIDPLUS", "CONDSTORE", "X-GM-EXT-1"],
+        ),
+        "outlook": ProviderProfile(
+            "outlook",
+            ServerSettings("outlook.office365.com", 993, "ssl"),
+            ServerSettings("smtp.office365.com", 587, "starttls"),
+            domains=["outlook.com", "hotmail.com", "live.com"],
+            kind="exchange",
+            capabilities=["IDLE", "MOVE", "UIDPLUS"],
+        ),
+    }
+
+
+class ProviderProfileManager:
+    """Loads provider profiles from the config file and autoconfig XML"""
+
+    def __init__(self, config_file: Optional[str] = None,
+                 autoconfig_dir: Optional[str] = None):
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.config_file = config_file or os.environ.get(
+            "MAIL_BUDDY_PROVIDERS_FILE",
+            os.path.join(base_dir, "provider_profiles.json")
+        )
+        self.autoconfig_dir = autoconfig_dir or os.path.join(base_dir, "autoconfig")
+        self.profiles = _builtin_profiles()
+        self.default_profile = os.environ.get("MAIL_BUDDY_PROVIDER")
+        self.load()
+
+    def load(self):
+        """Load autoconfig files first so the JSON config can override them"""
+        if os.path.isdir(self.autoconfig_dir):
+            for filename in sorted(os.listdir(self.autoconfig_dir)):
+                if not filename.endswith(".xml"):
+                    continue
+                try:
+                    self.load_autoconfig(os.path.join(self.autoconfig_dir, filename))
+                except Exception as e:
+                    logger.error("Failed to load autoconfig %s: %s", filename, e)
+
+        try:
+            if os.path.exists(self.config_file):
+                with open(self.config_file, "r") as f:
+                    data = json.load(f)
+                for name, profile_data in data.get("providers", {}).items():
+                    # A bad entry is skipped; the others still apply
+                    try:
+                        if "imap" not in profile_data and name in self.profiles:
+                            # Tuning-only entry for a builtin or autoconfig profile
+                            self.tune_profile(name, profile_data)
+                        else:
+                            self.add_profile(ProviderProfile.from_dict(name, profile_data))
+                    except Exception as e:
+                        logger.error("Skipping provider profile %s: %s", name, e)
+                if not self.default_profile:
+                    self.default_profile = data.get("default")
+        except Exception as e:
+            logger.error("Failed to load provider profiles: %s", e)
+
+    def load_autoconfig(self, path: str) -> List[ProviderProfile]:
+        """Add all profiles described by an autoconfig XML file"""
+        with open(path, "r", encoding="utf-8") as f:
+            profiles = parse_autoconfig(f.read())
+        for profile in profiles:
+            self.add_profile(profile)
+        return profiles
+
+    def add_profile(self, profile: ProviderProfile):
+        self.profiles[profile.name] = profile
+
+    def tune_profile(self, name: str, tuning: Dict):
+        """Override batch size, concurrency and capability hints of a profile"""
+        profile = self.profiles[name]
+        # Convert everything before changing anything, so a bad value
+        # leaves the profile as it was
+        values = {}
+        if "fetch_batch_size" in tuning:
+            values["fetch_batch_size"] = int(tuning["fetch_batch_size"])
+        if "max_connections" in tuning:
+            values["max_connections"] = int(tuning["max_connections"])
+        if "capabilities" in tuning:
+            values["capabilities"] = [c.upper() for c in tuning["capabilities"]]
+        if "domains" in tuning:
+            values["domains"] = [d.lower() for d in tuning["domains"]]
+        for attribute, value in values.items():
+            setattr(profile, attribute, value)
+
+    def get_profile(self, name: str) -> Optional[ProviderProfile]:
+        return self.profiles.get(name)
+
+    def profile_for_address(self, email_address: str) -> ProviderProfile:
+        """Pick the profile for an address, falling back to Gmail"""
+        if self.default_profile and self.default_profile in self.profiles:
+            return self.profiles[self.default_profile]
+
+        domain = email_address.rpartition("@")[2].lower()
+        for profile in self.profiles.values():
+            if domain in profile.domains:
+                return profile
+        return self.profiles["gmail"]
+
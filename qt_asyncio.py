@@ -0,0 +1,81 @@
+"""
+Bridge between the Qt event loop and an asyncio event loop.
+
+The asyncio loop runs in one background thread for the whole application;
+coroutines are submitted from the GUI thread and their results come back
+through a queued Qt signal, so callbacks always run on the GUI thread.
+This plays the role of qasync without the dependency: AsyncIMAPClient is
+loop-agnostic and also runs unchanged under qasync.QEventLoop.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from logging_config import get_logger
+
+logger = get_logger("qt_asyncio")
+
+
+class AsyncioBridge(QObject):
+    # callback, value
+    finished = pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.loop = asyncio.new_event_loop()
+        self.finished.connect(self._deliver)
+        self._thread = threading.Thread(target=self._run, name="asyncio-bridge",
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro, on_result: Optional[Callable] = None,
+               on_error: Optional[Callable] = None) -> Future:
+        """Schedule a coroutine on the asyncio loop.
+
+        on_result/on_error are called on the GUI thread. The returned
+        future can be cancelled, which cancels the coroutine.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+        def done(f):
+            if f.cancelled():
+                return
+            error = f.exception()
+            if error is not None:
+                logger.debug("Async task failed: %s", error)
+                if on_error:
+                    self.finished.emit(on_error, error)
+            elif on_result:
+                self.finished.emit(on_result, f.result())
+
+        future.add_done_callback(done)
+        return future
+
+    def _deliver(self, callback, value):
+        callback(value)
+
+    def stop(self, timeout: float = 2.0):
+        """Cancel outstanding tasks and stop the loop thread."""
+        if not self.loop.is_running():
+            return
+
+        async def shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout)
+        except Exception as e:
+            logger.debug("Async shutdown incomplete: %s", e)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
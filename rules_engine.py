@@ -0,0 +1,358 @@
+"""
+Local mail rules applied as messages are synced.
+
+A rule pairs conditions (sender domain, subject regex, size bounds, a header
+being present) with actions (add a label, mark read, move to a folder,
+hide). Every condition of a rule must hold for its actions to run.
+
+RuleSet compiles its rules into one matcher instead of testing them one by
+one. Each rule is a bit in an integer mask. Sender domains are looked up in
+a dict of domain -> mask and headers likewise, so those conditions cost a
+few hash lookups however many rules use them. Subject patterns are joined
+into a single alternation that screens out the usual subject matching none
+of them in one regex search. Only rules still standing after that are
+tested individually. The actions for each combination of matching rules
+are merged once and cached.
+
+Labels and hiding are worked out on every sync. Marking read and moving
+change the server, so they run once per message: the RuleSet records, per
+folder, the UID ranges whose actions have run, and a message is acted on
+only when its UID falls outside them. Consecutive pages join into one
+range, so the record stays a few numbers however much mail is synced. It
+is saved per account under CACHE_DIR, so a restart neither repeats the
+actions (undoing a manual mark-unread) nor skips mail that arrived while
+the app was closed.
+
+Rules live in rules.json next to this file, or in MAIL_BUDDY_RULES_FILE:
+
+    {"rules": [
+        {"name": "Newsletters",
+         "match": {"sender_domain": ["substack.com"], "header": "List-Unsubscribe"},
+         "actions": {"label": "Newsletter", "mark_read": true}},
+        {"name": "Receipts",
+         "match": {"subject": "\\\\b(receipt|invoice)\\\\b", "max_size": 200000},
+         "actions": {"move": "Receipts"}}
+    ]}
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from bisect import bisect_right
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from body_cache import CACHE_DIR
+from logging_config import get_logger
+
+logger = get_logger("rules_engine")
+
+# Per-account files of the UID ranges whose rule actions have run
+STATE_DIR = os.path.join(CACHE_DIR, "rules")
+
+# Serializes saves from the RuleSet copies of one process
+_state_lock = threading.Lock()
+
+CONDITIONS = ("sender_domain", "subject", "min_size", "max_size", "header")
+ACTIONS = ("label", "mark_read", "move", "hide")
+
+# Numbered or named back-references can't be joined into one alternation:
+# group numbers shift and names may clash
+_BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=|\\g<")
+
+
+def sender_domain(email_data: Dict) -> str:
+    address = email_data.get('from_address') or email_data.get('from') or ""
+    return address.rpartition("@")[2].strip(" <>").lower()
+
+
+def _domain_suffixes(domain: str):
+    """"mail.example.com", "example.com", "com": a rule for a domain covers its subdomains."""
+    parts = domain.split(".")
+    return (".".join(parts[i:]) for i in range(len(parts)))
+
+
+def _add_range(ranges: List[List[int]], low: int, high: int) -> List[List[int]]:
+    """Sorted, disjoint [low, high] UID ranges with one more merged in."""
+    merged = []
+    for start, end in sorted(ranges + [[low, high]]):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _bits(mask: int):
+    """Indexes of the set bits of mask, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class RuleMatch(NamedTuple):
+    """Merged actions of every rule a message matched"""
+    labels: Tuple[str, ...] = ()
+    mark_read: bool = False
+    move: Optional[str] = None
+    hide: bool = False
+
+
+NO_MATCH = RuleMatch()
+
+
+class Rule:
+    """Conditions that must all hold, and the actions to take when they do"""
+
+    def __init__(self, name: str, sender_domain=None, subject: Optional[str] = None,
+                 min_size: Optional[int] = None, max_size: Optional[int] = None,
+                 header: Optional[str] = None, label: Optional[str] = None,
+                 mark_read: bool = False, move: Optional[str] = None, hide: bool = False):
+        if isinstance(sender_domain, str):
+            sender_domain = [sender_domain]
+        self.name = name
+        self.sender_domains = tuple(d.strip().lstrip("@").lower() for d in sender_domain or ())
+        try:
+            self.subject = re.compile(subject, re.IGNORECASE) if subject else None
+        except re.error as e:
+            raise ValueError(f"Rule {name!r}: bad subject pattern: {e}")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.header = header.lower() if header else None
+        self.label = label
+        self.mark_read = bool(mark_read)
+        self.move = move
+        self.hide = bool(hide)
+        if not (self.sender_domains or self.subject or self.header
+                or min_size is not None or max_size is not None):
+            raise ValueError(f"Rule {name!r} has no conditions")
+        if not (label or mark_read or move or hide):
+            raise ValueError(f"Rule {name!r} has no actions")
+
+    @property
+    def has_size(self) -> bool:
+        return self.min_size is not None or self.max_size is not None
+
+    def size_matches(self, size: int) -> bool:
+        return ((self.min_size is None or size >= self.min_size)
+                and (self.max_size is None or size <= self.max_size))
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Rule":
+        match = data.get("match", {})
+        actions = data.get("actions", {})
+        unknown = (set(match) - set(CONDITIONS)) | (set(actions) - set(ACTIONS))
+        if unknown:
+            raise ValueError(f"Rule {data.get('name')!r}: unknown keys {sorted(unknown)}")
+        return cls(data.get("name") or "unnamed", **match, **actions)
+
+
+class RuleSet:
+    """Rules compiled into one matcher, and the UIDs they have acted on"""
+
+    def __init__(self, rules: Sequence[Rule] = (), state_file: Optional[str] = None):
+        self.rules = list(rules)
+        # Rule mask -> merged actions
+        self._results: Dict[int, RuleMatch] = {0: NO_MATCH}
+        # Folder -> (UIDVALIDITY, sorted [low, high] UID ranges acted on)
+        self.state_file = state_file
+        self._applied: Dict[str, Tuple[int, List[List[int]]]] = self._read_state()
+        self._compile()
+
+    def __len__(self):
+        return len(self.rules)
+
+    def copy(self) -> "RuleSet":
+        """The same rules with state of their own, e.g. for another connection."""
+        return RuleSet(self.rules, self.state_file)
+
+    @staticmethod
+    def state_path(email_address: str) -> str:
+        account = hashlib.sha1(email_address.lower().encode("utf-8")).hexdigest()[:16]
+        return os.path.join(STATE_DIR, account + ".json")
+
+    @classmethod
+    def load(cls, config_file: Optional[str] = None,
+             email_address: Optional[str] = None) -> "RuleSet":
+        """Rules from the rules file; an unreadable file or bad rule is logged and skipped.
+
+        With email_address, the ranges acted on are kept in that account's
+        state file.
+        """
+        config_file = config_file or os.environ.get(
+            "MAIL_BUDDY_RULES_FILE",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json")
+        )
+        rules = []
+        try:
+            if os.path.exists(config_file):
+                with open(config_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                for entry in data.get("rules", []):
+                    try:
+                        rules.append(Rule.from_dict(entry))
+                    except (TypeError, ValueError) as e:
+                        logger.error("Skipping rule: %s", e)
+        except Exception as e:
+            logger.error("Failed to load rules: %s", e)
+        logger.debug("Loaded %s rules", len(rules))
+        return cls(rules, cls.state_path(email_address) if email_address else None)
+
+    @property
+    def header_fields(self) -> Tuple[str, ...]:
+        """Headers the rules test for, which header sync must fetch."""
+        return tuple(self._headers)
+
+    def _compile(self):
+        self._domains: Dict[str, int] = {}
+        self._headers: Dict[str, int] = {}
+        # Rules with no condition of a kind pass that kind of test
+        self._any_domain = self._any_header = 0
+        self._subject_mask = self._size_mask = 0
+        combinable = []
+        screened = 0
+        for i, rule in enumerate(self.rules):
+            bit = 1 << i
+            for domain in rule.sender_domains:
+                self._domains[domain] = self._domains.get(domain, 0) | bit
+            if not rule.sender_domains:
+                self._any_domain |= bit
+            if rule.header:
+                self._headers[rule.header] = self._headers.get(rule.header, 0) | bit
+            else:
+                self._any_header |= bit
+            if rule.subject:
+                self._subject_mask |= bit
+                if not _BACKREFERENCE.search(rule.subject.pattern):
+                    combinable.append(rule.subject.pattern)
+                    screened |= bit
+            if rule.has_size:
+                self._size_mask |= bit
+
+        # A subject matching none of the joined patterns matches none of
+        # those rules; rules left out of the join are always tested
+        self._subject_screen = None
+        self._screened = 0
+        if combinable:
+            try:
+                self._subject_screen = re.compile(
+                    "|".join(f"(?:{pattern})" for pattern in combinable), re.IGNORECASE
+                )
+                self._screened = screened
+            except re.error:
+                logger.debug("Subject patterns can't be joined; testing them one by one")
+
+    def match(self, email_data: Dict) -> RuleMatch:
+        """Merged actions of the rules a message matches."""
+        candidates = self._any_domain
+        if self._domains:
+            domain = sender_domain(email_data)
+            if domain:
+                for suffix in _domain_suffixes(domain):
+                    candidates |= self._domains.get(suffix, 0)
+        if self._headers and candidates:
+            present = self._any_header
+            for name in email_data.get('headers', ()):
+                present |= self._headers.get(name, 0)
+            candidates &= present
+
+        if candidates & self._subject_mask:
+            subject = email_data.get('subject') or ""
+            if candidates & self._screened and self._subject_screen.search(subject) is None:
+                candidates &= ~self._screened
+            for i in _bits(candidates & self._subject_mask):
+                if not self.rules[i].subject.search(subject):
+                    candidates &= ~(1 << i)
+
+        if candidates & self._size_mask:
+            size = email_data.get('size', 0)
+            for i in _bits(candidates & self._size_mask):
+                if not self.rules[i].size_matches(size):
+                    candidates &= ~(1 << i)
+
+        result = self._results.get(candidates)
+        if result is None:
+            result = self._results[candidates] = self._merge(candidates)
+        return result
+
+    def _merge(self, mask: int) -> RuleMatch:
+        labels: List[str] = []
+        mark_read = hide = False
+        move = None
+        for i in _bits(mask):
+            rule = self.rules[i]
+            if rule.label and rule.label not in labels:
+                labels.append(rule.label)
+            mark_read = mark_read or rule.mark_read
+            hide = hide or rule.hide
+            # The first rule that moves a message decides where it goes
+            move = move or rule.move
+        return RuleMatch(tuple(labels), mark_read, move, hide)
+
+    def applied(self, folder: str, uidvalidity: int, uid: int) -> bool:
+        """Whether the rules' server actions have run for a message."""
+        validity, ranges = self._applied.get(folder, (None, ()))
+        if validity != uidvalidity:
+            return False
+        index = bisect_right(ranges, [uid, float("inf")]) - 1
+        return index >= 0 and uid <= ranges[index][1]
+
+    def mark_applied(self, folder: str, uidvalidity: int, low: int, high: int,
+                     failed: Iterable[int] = ()):
+        """Record that server actions have run for every UID in [low, high].
+
+        UIDs in failed are left out, so their actions run again on the
+        next sync.
+        """
+        validity, ranges = self._applied.get(folder, (uidvalidity, []))
+        if validity != uidvalidity:
+            # The folder was rebuilt; its old UIDs mean nothing now
+            ranges = []
+        for uid in sorted({uid for uid in failed if low <= uid <= high}):
+            if low < uid:
+                ranges = _add_range(ranges, low, uid - 1)
+            low = uid + 1
+        if low <= high:
+            ranges = _add_range(ranges, low, high)
+        self._applied[folder] = (uidvalidity, ranges)
+        self._save_state()
+
+    def _read_state(self) -> Dict[str, Tuple[int, List[List[int]]]]:
+        if not self.state_file:
+            return {}
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {folder: (entry["uidvalidity"], [list(r) for r in entry["ranges"]])
+                    for folder, entry in data.items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error("Failed to read the rules state: %s", e)
+            return {}
+
+    def _save_state(self):
+        if not self.state_file:
+            return
+        with _state_lock:
+            # Another copy may have saved ranges since this one was read
+            for folder, (validity, ranges) in self._read_state().items():
+                mine = self._applied.get(folder)
+                if mine is None:
+                    self._applied[folder] = (validity, ranges)
+                elif mine[0] == validity:
+                    for low, high in ranges:
+                        mine = (validity, _add_range(mine[1], low, high))
+                    self._applied[folder] = mine
+            data = {folder: {"uidvalidity": validity, "ranges": ranges}
+                    for folder, (validity, ranges) in self._applied.items()}
+            try:
+                os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+                temp_path = self.state_file + ".tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, separators=(",", ":"))
+                os.replace(temp_path, self.state_file)
+            except OSError as e:
+                logger.error("Failed to save the rules state: %s", e)
@@ -12,6 +12,7 @@ class FilterDialog(QDialog):
     
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.setObjectName("filter_dialog")
         self.setWindowTitle("Filter Emails")
         self.setFixedSize(300, 200)
         self.setup_ui()
@@ -55,33 +56,6 @@ class FilterDialog(QDialog):
         apply_button.clicked.connect(self.apply_filters)
         layout.addWidget(apply_button)
         
-        # Style
-        self.setStyleSheet("""
-            QDialog {
-                background-color: white;
-            }
-            QLabel {
-                color: #444;
-                font-size: 13px;
-            }
-            QComboBox, QDateEdit {
-                padding: 5px;
-                border: 1px solid #ddd;
-                border-radius: 4px;
-            }
-            QPushButton {
-                background-color: #0078d4;
-                color: white;
-                border: none;
-                padding: 8px;
-                border-radius: 4px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #106ebe;
-            }
-        """)
-        
         # Connect signals
         self.date_filter.currentTextChanged.connect(self.handle_date_filter_change)
     
@@ -117,11 +91,14 @@ class CompactSearchWidget(QWidget):
     """Compact search widget with filter button"""
     
     search_changed = pyqtSignal(str)
+    # Search text and {message key: score} of every fuzzy index match, or None
+    search_ranked = pyqtSignal(str, object)
     date_filter_changed = pyqtSignal(QDate, QDate)
     refresh_clicked = pyqtSignal()
     
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.search_index = None
         self.setup_ui()
         
     def setup_ui(self):
@@ -132,51 +109,18 @@ class CompactSearchWidget(QWidget):
         # Refresh button with circular arrow icon
         refresh_button = QPushButton("↻")
         refresh_button.setFixedSize(30, 30)
-        refresh_button.setStyleSheet("""
-            QPushButton {
-                background: transparent;
-                border: none;
-                font-size: 18px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                color: #0078d4;
-                background-color: #f0f0f0;
-                border-radius: 15px;
-            }
-        """)
+        refresh_button.setObjectName("refresh_button")
         
         # Search input with magnifying glass icon in placeholder
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("🔍 Search emails...")
         self.search_input.setFixedHeight(30)
-        self.search_input.setStyleSheet("""
-            QLineEdit {
-                border: 1px solid #ddd;
-                border-radius: 15px;
-                padding: 5px 10px;
-                background: white;
-            }
-            QLineEdit:focus {
-                border-color: #0078d4;
-            }
-        """)
+        self.search_input.setObjectName("search_input")
         
         # Filter button with improved hover effect
         filter_button = QPushButton("⚙")
         filter_button.setFixedSize(30, 30)
-        filter_button.setStyleSheet("""
-            QPushButton {
-                background: transparent;
-                border: none;
-                font-size: 16px;
-            }
-            QPushButton:hover {
-                color: #0078d4;
-                background-color: #f0f0f0;
-                border-radius: 15px;
-            }
-        """)
+        filter_button.setObjectName("filter_button")
         
         # Add widgets to layout
         layout.addWidget(refresh_button)
@@ -187,10 +131,28 @@ class CompactSearchWidget(QWidget):
         self.filter_dialog = FilterDialog(self)
         
         # Connect signals
-        self.search_input.textChanged.connect(self.search_changed.emit)
+        self.search_input.textChanged.connect(self.handle_text_changed)
         filter_button.clicked.connect(self.show_filter_dialog)
         refresh_button.clicked.connect(self.refresh_clicked.emit)
         self.filter_dialog.filter_changed.connect(self.date_filter_changed.emit)
     
+    def set_search_index(self, index):
+        """Match messages with a TrigramIndex as the search text changes"""
+        self.search_index = index
+    
+    def search(self, text):
+        """All fuzzy matches for text as {key: score}, or None without an index
+
+        The list stays in its sort order, so the matches are a filter, not
+        a ranking: capping them would drop rows arbitrarily.
+        """
+        if self.search_index is None or not text.strip():
+            return None
+        return dict(self.search_index.search(text))
+    
+    def handle_text_changed(self, text):
+        self.search_changed.emit(text)
+        self.search_ranked.emit(text, self.search(text))
+    
     def show_filter_dialog(self):
         self.filter_dialog.exec() 
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Typo-tolerant search over message senders and subjects.
+
+TrigramIndex keeps an inverted index from character trigrams to message
+keys. A query is split into words and each word into trigrams. Only the
+messages listed under those trigrams are scored, so a lookup touches the
+candidates that share text with the query instead of every message.
+
+A message matches a query word when it contains at least ``threshold`` of
+that word's trigrams, which tolerates a swapped or wrong letter ("recieve"
+finds "receive"). The last word is treated as a prefix still being typed
+("joh" finds "Johnson"). Scores are the mean over the query's words.
+
+The index is updated one message at a time as mail is added or removed,
+and never rebuilt per query.
+"""
+
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, FrozenSet, Hashable, List, Set, Tuple
+
+_WORD = re.compile(r"\w+")
+
+# Fraction of a query word's trigrams a message must contain
+DEFAULT_THRESHOLD = 0.5
+
+
+def normalize(text: str) -> str:
+    """Casefold and strip accents, so "Zoë" and "zoe" index alike."""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+@lru_cache(maxsize=65536)
+def word_trigrams(word: str) -> FrozenSet[str]:
+    """Trigrams of one word, padded so short words and word edges count."""
+    padded = f"  {word} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def text_trigrams(text: str) -> FrozenSet[str]:
+    return frozenset().union(*map(word_trigrams, _WORD.findall(normalize(text))))
+
+
+def query_words(query: str) -> List[Tuple[FrozenSet[str], int]]:
+    """(trigrams, trigrams needed for a full score) for each query word.
+
+    The last word may be a prefix still being typed, so its closing
+    trigram counts as a bonus rather than a requirement.
+    """
+    words = [word_trigrams(word) for word in _WORD.findall(normalize(query))]
+    return [
+        (grams, max(len(grams) - 1, 1) if i == len(words) - 1 else len(grams))
+        for i, grams in enumerate(words)
+    ]
+
+
+class TrigramIndex:
+    """Inverted trigram index from message text to message keys"""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.postings: Dict[str, Set[Hashable]] = defaultdict(set)
+        self.documents: Dict[Hashable, FrozenSet[str]] = {}
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, key):
+        return key in self.documents
+
+    def add(self, key: Hashable, text: str):
+        """Index (or re-index) the text of one message."""
+        trigrams = text_trigrams(text)
+        old = self.documents.get(key)
+        if old == trigrams:
+            return
+        if old is not None:
+            self._unlink(key, old - trigrams)
+            trigrams_to_link = trigrams - old
+        else:
+            trigrams_to_link = trigrams
+        for trigram in trigrams_to_link:
+            self.postings[trigram].add(key)
+        self.documents[key] = trigrams
+
+    def remove(self, key: Hashable):
+        trigrams = self.documents.pop(key, None)
+        if trigrams is not None:
+            self._unlink(key, trigrams)
+
+    def _unlink(self, key, trigrams):
+        for trigram in trigrams:
+            keys = self.postings.get(trigram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[trigram]
+
+    def clear(self):
+        self.postings.clear()
+        self.documents.clear()
+
+    def search(self, query: str, limit: int = 0) -> List[Tuple[Hashable, float]]:
+        """Keys matching every word of the query, best first.
+
+        Returns (key, score) pairs with scores in (0, 1]; limit caps how
+        many are returned (0 for all).
+        """
+        words = query_words(query)
+        if not words:
+            return []
+        # A message holding enough of a word's trigrams holds at least one
+        # of its rarest ones, so only those postings need reading. The
+        # word with the fewest such postings supplies the candidates.
+        probes = [self._probe(grams, needed) for grams, needed in words]
+        probe = min(probes, key=lambda keys: sum(len(self.postings[g]) for g in keys))
+        candidates = set().union(*(self.postings[g] for g in probe))
+        scored = []
+        for key in candidates:
+            trigrams = self.documents[key]
+            total = 0.0
+            for grams, needed in words:
+                share = len(grams & trigrams) / needed
+                if share < self.threshold:
+                    break
+                total += min(share, 1.0)
+            else:
+                scored.append((key, total / len(words)))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit] if limit else scored
+
+    def _probe(self, grams: FrozenSet[str], needed: int) -> List[str]:
+        required = max(math.ceil(self.threshold * needed), 1)
+        present = sorted((g for g in grams if g in self.postings),
+                         key=lambda g: len(self.postings[g]))
+        if len(present) < required:
+            return []
+        return present[:len(present) - required + 1]
+
+    def score(self, key: Hashable, query: str) -> float:
+        """Score of one indexed message for a query; 0.0 if it doesn't match."""
+        trigrams = self.documents.get(key)
+        words = query_words(query)
+        if trigrams is None or not words:
+            return 0.0
+        total = 0.0
+        for grams, needed in words:
+            share = len(grams & trigrams) / needed
+            if share < self.threshold:
+                return 0.0
+            total += min(share, 1.0)
+        return total / len(words)
@@ -0,0 +1,255 @@
+"""
+Saved searches shown as smart folders.
+
+A SavedSearch is a predicate over list records: a sender substring, a
+keyword, a date range and flags that must be set or clear. The keyword is
+tested by the window's search-box predicate (fuzzy sender and subject
+matches, or a substring of subject, sender or body), so a saved search
+holds the messages the search showed. SmartFolders tests each message
+against every saved search when the message is added to the window, and
+again when its body arrives after a header-only sync, and keeps each
+folder's members in a date-ordered SortIndex together with its unread
+count. A folder shown in another sort order gets a SortIndex for that order
+too, built the first time and kept in step from then on. Opening a folder
+reads an index and counts are always current; nothing rescans the mailbox
+or re-sorts the members.
+
+Searches are stored as JSON in smart_folders.json next to this file, or in
+MAIL_BUDDY_SMART_FOLDERS_FILE:
+
+    {"smart_folders": [
+        {"name": "Invoices", "sender": "billing", "keyword": "invoice",
+         "since": "2025-01-01", "until": null,
+         "flags": [], "not_flags": ["\\\\Seen"]}
+    ]}
+"""
+
+import json
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from logging_config import get_logger
+from sort_index import SORT_ORDERS, SortIndex, sort_key
+
+logger = get_logger("smart_folders")
+
+
+def _day_start(value: Optional[str]) -> Optional[int]:
+    """Local midnight of an ISO date as seconds since the epoch."""
+    if not value:
+        return None
+    return int(datetime.combine(date.fromisoformat(value), time()).timestamp())
+
+
+def is_unread(email_data: Dict) -> bool:
+    return '\\Seen' not in email_data.get('flags', ())
+
+
+def contains_text(email_data: Dict, text: str) -> bool:
+    """Whether text is in a message's subject, sender or body."""
+    searchable = (f"{email_data.get('subject') or ''} {email_data.get('from') or ''} "
+                  f"{email_data.get('content') or ''}")
+    return text.casefold() in searchable.casefold()
+
+
+class SavedSearch:
+    """Predicate for one smart folder; empty criteria match everything"""
+
+    def __init__(self, name: str, sender: str = "", keyword: str = "",
+                 since: Optional[str] = None, until: Optional[str] = None,
+                 flags: Optional[List[str]] = None,
+                 not_flags: Optional[List[str]] = None):
+        if not name:
+            raise ValueError("A saved search needs a name")
+        self.name = name
+        self.sender = sender
+        self.keyword = keyword
+        self.since = since
+        self.until = until
+        self.flags = list(flags or [])
+        self.not_flags = list(not_flags or [])
+        # Matching state derived once from the criteria
+        self._sender = sender.casefold()
+        self._keyword = keyword.casefold()
+        self._start = _day_start(since)
+        # until is inclusive: the range ends at the next midnight
+        self._end = _day_start(
+            (date.fromisoformat(until) + timedelta(days=1)).isoformat()
+        ) if until else None
+
+    def matches(self, email_data: Dict,
+                text_matches: Callable[[Dict, str], bool] = contains_text) -> bool:
+        flags = email_data.get('flags', ())
+        if any(flag not in flags for flag in self.flags):
+            return False
+        if any(flag in flags for flag in self.not_flags):
+            return False
+        if self._start is not None or self._end is not None:
+            seconds = email_data['parsed_date'].toSecsSinceEpoch()
+            if self._start is not None and seconds < self._start:
+                return False
+            if self._end is not None and seconds >= self._end:
+                return False
+        if self._sender and self._sender not in (email_data.get('from') or "").casefold():
+            return False
+        if self._keyword and not text_matches(email_data, self._keyword):
+            return False
+        return True
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SavedSearch":
+        return cls(
+            data["name"],
+            sender=data.get("sender", ""),
+            keyword=data.get("keyword", ""),
+            since=data.get("since"),
+            until=data.get("until"),
+            flags=data.get("flags"),
+            not_flags=data.get("not_flags"),
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "sender": self.sender,
+            "keyword": self.keyword,
+            "since": self.since,
+            "until": self.until,
+            "flags": self.flags,
+            "not_flags": self.not_flags,
+        }
+
+
+class SmartFolders:
+    """Saved searches and their incrementally maintained members"""
+
+    def __init__(self, config_file: Optional[str] = None,
+                 text_matches: Callable[[Dict, str], bool] = contains_text):
+        self.config_file = config_file or os.environ.get(
+            "MAIL_BUDDY_SMART_FOLDERS_FILE",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "smart_folders.json")
+        )
+        # Keyword test, the window's search-box predicate
+        self.text_matches = text_matches
+        self.searches: Dict[str, SavedSearch] = {}
+        # Folder name -> members newest first, and how many are unread
+        self.members: Dict[str, SortIndex] = {}
+        # (folder name, sort order) -> members in that order, for orders
+        # other than date that a folder has been shown in
+        self._ordered: Dict[Tuple[str, str], SortIndex] = {}
+        self.unread: Dict[str, int] = {}
+        # id(record) -> [(folder name, counted as unread)], for removal
+        self._memberships: Dict[int, List] = {}
+        self.load()
+
+    def __iter__(self):
+        return iter(self.searches.values())
+
+    def __len__(self):
+        return len(self.searches)
+
+    def load(self):
+        try:
+            if os.path.exists(self.config_file):
+                with open(self.config_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                for entry in data.get("smart_folders", []):
+                    self._add(SavedSearch.from_dict(entry))
+        except Exception as e:
+            logger.error("Failed to load smart folders: %s", e)
+
+    def save(self):
+        try:
+            with open(self.config_file, "w", encoding="utf-8") as f:
+                json.dump({"smart_folders": [s.to_dict() for s in self.searches.values()]},
+                          f, indent=2)
+        except Exception as e:
+            logger.error("Failed to save smart folders: %s", e)
+
+    def _add(self, search: SavedSearch):
+        self.searches[search.name] = search
+        self.members[search.name] = SortIndex(sort_key)
+        self.unread[search.name] = 0
+
+    def _fill(self, search: SavedSearch, emails):
+        """Set a folder's members from a full pass over emails."""
+        matched = [email_data for email_data in emails
+                   if search.matches(email_data, self.text_matches)]
+        self.members[search.name] = SortIndex(sort_key, matched)
+        self._drop_orders(search.name)
+        self.unread[search.name] = 0
+        for email_data in matched:
+            unread = is_unread(email_data)
+            self.unread[search.name] += unread
+            self._memberships.setdefault(id(email_data), []).append((search.name, unread))
+
+    def add_search(self, search: SavedSearch, emails=()):
+        """Save a search and fill its folder from the messages loaded so far."""
+        if search.name in self.searches:
+            self.remove_search(search.name)
+        self._add(search)
+        self._fill(search, emails)
+        self.save()
+
+    def _drop_orders(self, name: str):
+        for key in [key for key in self._ordered if key[0] == name]:
+            del self._ordered[key]
+
+    def ordered(self, name: str, order: str) -> SortIndex:
+        """A folder's members in one of SORT_ORDERS."""
+        if order == "date":
+            return self.members[name]
+        index = self._ordered.get((name, order))
+        if index is None:
+            index = self._ordered[(name, order)] = SortIndex(
+                SORT_ORDERS[order].key, self.members[name].emails
+            )
+        return index
+
+    def _orders_of(self, name: str) -> List[SortIndex]:
+        return [index for (folder, _), index in self._ordered.items() if folder == name]
+
+    def remove_search(self, name: str):
+        self.searches.pop(name, None)
+        self.members.pop(name, None)
+        self._drop_orders(name)
+        self.unread.pop(name, None)
+        for memberships in self._memberships.values():
+            memberships[:] = [m for m in memberships if m[0] != name]
+        self.save()
+
+    def _test(self, search: SavedSearch, email_data: Dict):
+        if search.matches(email_data, self.text_matches):
+            unread = is_unread(email_data)
+            self.members[search.name].insert(email_data)
+            for index in self._orders_of(search.name):
+                index.insert(email_data)
+            self.unread[search.name] += unread
+            self._memberships.setdefault(id(email_data), []).append((search.name, unread))
+
+    def add(self, email_data: Dict):
+        """Test a newly added or changed message against every saved search."""
+        for search in self.searches.values():
+            self._test(search, email_data)
+
+    def retest(self, email_data: Dict):
+        """Test a message again after its text changed, e.g. its body arrived."""
+        self.remove(email_data)
+        self.add(email_data)
+
+    def remove(self, email_data: Dict):
+        for name, unread in self._memberships.pop(id(email_data), ()):
+            self.members[name].remove(email_data)
+            for index in self._orders_of(name):
+                index.remove(email_data)
+            self.unread[name] -= unread
+
+    def rebuild(self, emails):
+        """Recompute every folder from scratch, e.g. after a full reload."""
+        self._memberships.clear()
+        for search in self.searches.values():
+            self._fill(search, emails)
+
+    def contains(self, name: str, email_data: Dict) -> bool:
+        return any(folder == name for folder, _ in self._memberships.get(id(email_data), ()))
@@ -0,0 +1,138 @@
+"""
+Preview snippets for the message list, built from a partial body fetch.
+
+Header sync asks for BODYSTRUCTURE and the first SNIPPET_BYTES of body
+part 1 (``BODY.PEEK[1]<0.2048>``) alongside the headers, so a preview costs
+no extra round trip for ordinary messages. text_part() finds the part that
+should supply the preview (the first text/plain, else the first text/html);
+when that is not part 1, as in multipart/mixed messages with a nested
+alternative, the caller fetches its first bytes separately.
+
+make_snippet() undoes the transfer encoding of the truncated bytes, decodes
+the charset, drops markup, quoted replies, attribution lines and the
+signature, and collapses whitespace into a preview of at most SNIPPET_CHARS
+characters.
+"""
+
+import base64
+import binascii
+import html
+import quopri
+import re
+from typing import List, NamedTuple, Optional
+
+# Body bytes fetched per message and the length of the stored preview
+SNIPPET_BYTES = 2048
+SNIPPET_CHARS = 150
+
+_TAG = re.compile(r"<(script|style|blockquote)\b.*?</\1\s*>|<[^>]*>", re.IGNORECASE | re.DOTALL)
+_UNCLOSED_TAG = re.compile(r"<[^>]*$")
+_ATTRIBUTION = re.compile(r"^(on\b.*\bwrote:|-+\s*original message\s*-+)$", re.IGNORECASE)
+
+
+class TextPart(NamedTuple):
+    """Where the preview text of a message lives and how it is encoded"""
+    section: str
+    subtype: str
+    encoding: str
+    charset: str
+
+
+def _lower(value) -> str:
+    return value.lower() if isinstance(value, str) else ""
+
+
+def _charset(params) -> str:
+    if isinstance(params, list):
+        for i in range(0, len(params) - 1, 2):
+            if _lower(params[i]) == "charset" and isinstance(params[i + 1], str):
+                return params[i + 1]
+    return "utf-8"
+
+
+def _text_parts(structure, section: str, found: List[TextPart]):
+    if not isinstance(structure, list) or not structure:
+        return
+    if isinstance(structure[0], list):
+        # Multipart: child parts, then the subtype and extension data
+        index = 1
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            _text_parts(child, f"{section}.{index}" if section else str(index), found)
+            index += 1
+        return
+    if _lower(structure[0]) == "text" and len(structure) > 5:
+        # Text parts: type, subtype, params, id, description, encoding,
+        # size, lines, then MD5 and disposition as extension data
+        disposition = structure[9] if len(structure) > 9 else None
+        if isinstance(disposition, list) and _lower(disposition[0]) == "attachment":
+            return
+        found.append(TextPart(section or "1", _lower(structure[1]),
+                              _lower(structure[5]), _charset(structure[2])))
+
+
+def text_part(bodystructure) -> Optional[TextPart]:
+    """Pick the part to preview from a parsed BODYSTRUCTURE."""
+    found: List[TextPart] = []
+    _text_parts(bodystructure, "", found)
+    for part in found:
+        if part.subtype == "plain":
+            return part
+    return found[0] if found else None
+
+
+def _decode_transfer(data: bytes, encoding: str) -> bytes:
+    if encoding == "base64":
+        data = b"".join(data.split())
+        try:
+            # Drop the trailing incomplete quantum left by truncation
+            return base64.b64decode(data[:len(data) // 4 * 4])
+        except (binascii.Error, ValueError):
+            return b""
+    if encoding == "quoted-printable":
+        # Drop an escape sequence cut off by truncation
+        cut = data.rfind(b"=", len(data) - 2)
+        return quopri.decodestring(data[:cut] if cut >= 0 else data)
+    return data
+
+
+def clean_text(text: str, html_markup: bool = False) -> str:
+    """Reduce body text to a one-line preview."""
+    if html_markup:
+        text = _UNCLOSED_TAG.sub("", _TAG.sub(" ", text))
+        text = html.unescape(text)
+    kept = []
+    length = 0
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped in ("--", "__"):
+            # Signature separator: nothing after it is content
+            break
+        if not stripped or stripped.startswith(">") or _ATTRIBUTION.match(stripped):
+            continue
+        stripped = " ".join(stripped.split())
+        kept.append(stripped)
+        length += len(stripped) + 1
+        if length > SNIPPET_CHARS:
+            break
+    text = " ".join(kept)
+    if len(text) > SNIPPET_CHARS:
+        cut = text.rfind(" ", 0, SNIPPET_CHARS)
+        text = text[:cut if cut > SNIPPET_CHARS // 2 else SNIPPET_CHARS].rstrip() + "…"
+    return text
+
+
+def make_snippet(data: bytes, part: Optional[TextPart] = None) -> str:
+    """Build a preview from the first bytes of a body part."""
+    if not data:
+        return ""
+    if part is None:
+        part = TextPart("1", "plain", "7bit", "utf-8")
+    raw = _decode_transfer(data, part.encoding)
+    try:
+        text = raw.decode(part.charset, "replace")
+    except LookupError:
+        text = raw.decode("utf-8", "replace")
+    # A multibyte character cut off by truncation decodes to U+FFFD
+    return clean_text(text.rstrip("�"), part.subtype == "html")
@@ -0,0 +1,105 @@
+"""
+Sort orders for the message list and the indexes that maintain them.
+
+Each order is a key function whose keys sort ascending into display order
+and end with the message identity, so no two messages tie. EmailWindow
+keeps its messages in date order (the header table and the date filter
+rely on that); every other order the user has picked gets a SortIndex, a
+sorted list of keys kept in step with the messages by bisect. Switching
+back to an order reads its index instead of sorting again, and new mail
+costs a binary search per index.
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple
+
+_REPLY_PREFIX = re.compile(r"^\s*((re|fwd?|aw|wg|sv)(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+
+
+def row_key(email_data):
+    """Identity of a message across refreshes"""
+    return email_data.get('uid', email_data.get('id'))
+
+
+def sort_key(email_data):
+    """Newest first, ties broken by message identity"""
+    return (-email_data['parsed_date'].toSecsSinceEpoch(), str(row_key(email_data)))
+
+
+def sender_key(email_data):
+    """Senders A to Z by display name, each newest first"""
+    name = email_data.get('from_name') or email_data.get('from') or ""
+    return (name.casefold(),) + sort_key(email_data)
+
+
+def subject_key(email_data):
+    """Subjects A to Z ignoring Re:/Fwd: prefixes, so threads group"""
+    subject = _REPLY_PREFIX.sub("", email_data.get('subject') or "")
+    return (subject.casefold(),) + sort_key(email_data)
+
+
+def size_key(email_data):
+    """Largest first"""
+    return (-email_data.get('size', 0),) + sort_key(email_data)
+
+
+def unread_key(email_data):
+    """Unread mail first, each group newest first"""
+    return ('\\Seen' in email_data.get('flags', ()),) + sort_key(email_data)
+
+
+class SortOrder(NamedTuple):
+    label: str
+    key: Callable
+
+
+SORT_ORDERS: Dict[str, SortOrder] = OrderedDict([
+    ("date", SortOrder("Newest first", sort_key)),
+    ("sender", SortOrder("Sender", sender_key)),
+    ("subject", SortOrder("Subject", subject_key)),
+    ("size", SortOrder("Largest first", size_key)),
+    ("unread", SortOrder("Unread first", unread_key)),
+])
+
+
+class SortIndex:
+    """Messages kept sorted by one key function"""
+
+    def __init__(self, key: Callable, emails=()):
+        self.key = key
+        pairs = sorted(((key(email), email) for email in emails), key=lambda pair: pair[0])
+        self.keys: List = [k for k, _ in pairs]
+        self.emails: List[Dict] = [email for _, email in pairs]
+        # Key each message was inserted under, so removal still finds it
+        # after the record has been edited
+        self._inserted_keys = {id(email): k for k, email in pairs}
+
+    def __len__(self):
+        return len(self.emails)
+
+    def key_of(self, email: Dict):
+        """Key a message was inserted under, or None."""
+        return self._inserted_keys.get(id(email))
+
+    def insert(self, email: Dict) -> int:
+        """Add a message; returns its position."""
+        key = self.key(email)
+        index = bisect_right(self.keys, key)
+        self.keys.insert(index, key)
+        self.emails.insert(index, email)
+        self._inserted_keys[id(email)] = key
+        return index
+
+    def remove(self, email: Dict) -> int:
+        """Drop a message; returns the position it had, or -1."""
+        key = self._inserted_keys.pop(id(email), None)
+        if key is None:
+            return -1
+        index = bisect_left(self.keys, key)
+        if index < len(self.emails) and self.emails[index] is email:
+            del self.keys[index]
+            del self.emails[index]
+            return index
+        return -1
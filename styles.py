@@ -0,0 +1,322 @@
+"""
+Application theme: colours, fonts and the one stylesheet Mail Buddy uses.
+
+The stylesheet is built once at import and set on the QApplication by
+apply(). Windows and dialogs don't call setStyleSheet themselves; they set
+object names (and the "class" property) that the stylesheet selects on.
+Setting a sheet on a widget makes Qt re-polish its whole subtree, so the
+old per-widget sheets made every window construction pay for styling
+several times over.
+
+Message list rows are painted by EmailItemDelegate with the QColor and
+QFont objects from RowStyle, not by stylesheet rules.
+"""
+
+from string import Template
+
+from PyQt6.QtGui import QColor, QFont, QFontMetrics
+from PyQt6.QtWidgets import QApplication
+
+COLORS = {
+    "accent": "#0078d4",
+    "accent_hover": "#106ebe",
+    "accent_tint": "#f0f8ff",
+    "text": "#444",
+    "muted": "#666",
+    "border": "#ddd",
+    "border_strong": "#ccc",
+    "disabled": "#ccc",
+    "panel": "white",
+    "status": "#f8f9fa",
+    "hover": "#f5f5f5",
+    "button_hover": "#f0f0f0",
+    "selected": "#e1f0ff",
+    "star": "#e3a008",
+    "gradient_top": "#e6f2ff",
+    "gradient_bottom": "#ffffff",
+}
+
+_TEMPLATE = Template("""
+QMainWindow {
+    background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
+                                stop:0 $gradient_top, stop:1 $gradient_bottom);
+}
+QPushButton {
+    border-radius: 5px;
+    background-color: white;
+    color: $accent;
+    border: 1px solid $accent;
+    padding: 8px;
+}
+QPushButton:hover {
+    background-color: $accent_tint;
+}
+QPushButton#login_button {
+    background-color: $accent;
+    color: white;
+    border: none;
+    font-weight: bold;
+}
+QPushButton#login_button:hover {
+    background-color: $accent_hover;
+}
+QPushButton#login_button:disabled {
+    background-color: $disabled;
+}
+QPushButton#toggle_button {
+    background-color: white;
+    color: $accent;
+    border: 1px solid $border_strong;
+    padding: 5px;
+}
+QPushButton#toggle_button:hover {
+    background-color: $accent_tint;
+    border-color: $accent;
+}
+QLineEdit {
+    border-radius: 5px;
+    padding: 8px;
+    border: 1px solid $border_strong;
+    background-color: white;
+}
+QLineEdit:focus {
+    border: 1px solid $accent;
+}
+QCheckBox {
+    border-radius: 3px;
+    background: transparent;
+}
+
+/* Login window */
+QMainWindow#login_window {
+    background-color: $hover;
+}
+QWidget#login_central {
+    background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
+                                stop:0 $gradient_top, stop:1 $gradient_bottom);
+    border-radius: 10px;
+}
+QMainWindow#login_window QLineEdit {
+    padding: 8px;
+    border: 1px solid $border;
+    border-radius: 4px;
+    background-color: white;
+}
+QMainWindow#login_window QLineEdit:focus {
+    border: 1px solid $accent;
+}
+QMainWindow#login_window QLabel, QMainWindow#login_window QCheckBox {
+    color: $text;
+    font-size: 13px;
+    background: transparent;
+}
+QMainWindow#login_window QLabel#mascot {
+    font-family: 'Courier New', monospace;
+    color: $accent;
+    margin: 10px;
+    padding: 0px;
+    font-size: 18px;
+    font-weight: bold;
+}
+
+/* Inbox window */
+QLabel#loading_label {
+    color: $muted;
+    font-size: 16px;
+    padding: 20px;
+}
+QWidget#top_bar {
+    background-color: $panel;
+}
+QPushButton#refresh_button, QPushButton#filter_button {
+    background: transparent;
+    border: none;
+    font-size: 16px;
+}
+QPushButton#refresh_button {
+    font-size: 18px;
+    font-weight: bold;
+}
+QPushButton#refresh_button:hover, QPushButton#filter_button:hover {
+    color: $accent;
+    background-color: $button_hover;
+    border-radius: 15px;
+}
+QLineEdit#search_input {
+    border: 1px solid $border;
+    border-radius: 15px;
+    padding: 5px 10px;
+    background: white;
+}
+QLineEdit#search_input:focus {
+    border-color: $accent;
+}
+QPushButton#compose_button {
+    background-color: $accent;
+    color: white;
+    border: none;
+    padding: 8px;
+    border-radius: 4px;
+    font-weight: bold;
+    margin-bottom: 10px;
+}
+QPushButton#compose_button:hover {
+    background-color: $accent_hover;
+}
+QListWidget#email_list {
+    background-color: white;
+    border: 1px solid $border;
+    border-radius: 4px;
+}
+QWidget#email_header {
+    background-color: $panel;
+    border: 1px solid $border;
+    border-radius: 4px;
+}
+QWidget#email_header QLabel {
+    background-color: $panel;
+    border: 1px solid $border;
+    border-radius: 4px;
+    margin-bottom: 10px;
+    color: $text;
+    font-size: 13px;
+}
+QWidget#email_header QLabel[class="header_label"] {
+    font-weight: bold;
+    color: $muted;
+    min-width: 60px;
+    max-width: 60px;
+}
+QWidget#email_header QLabel#from_value {
+    font-weight: bold;
+}
+QWidget#email_header QLabel#date_value {
+    color: $muted;
+}
+QFrame#header_separator {
+    background-color: $border;
+    border: 1px solid $border;
+}
+QTextEdit#content_view {
+    background-color: white;
+    border: 1px solid $border;
+    border-radius: 4px;
+    padding: 10px;
+    font-size: 13px;
+}
+QMainWindow#email_window QSplitter::handle {
+    background-color: $border;
+    margin: 1px;
+}
+QMainWindow#email_window QSplitter::handle:hover {
+    background-color: $border_strong;
+}
+QMainWindow#email_window QStatusBar {
+    background-color: $status;
+    border-top: 1px solid $border;
+    padding: 5px;
+    color: $muted;
+}
+
+/* Dialogs */
+QDialog#compose_dialog {
+    background-color: $hover;
+}
+QDialog#compose_dialog QLineEdit, QDialog#compose_dialog QTextEdit {
+    background-color: white;
+    border: 1px solid $border;
+    border-radius: 4px;
+    padding: 8px;
+    font-size: 13px;
+}
+QDialog#compose_dialog QLineEdit:focus, QDialog#compose_dialog QTextEdit:focus {
+    border: 1px solid $accent;
+}
+QDialog#compose_dialog QPushButton {
+    padding: 8px;
+    border-radius: 4px;
+    font-weight: bold;
+}
+QDialog#compose_dialog QPushButton#send_button {
+    background-color: $accent;
+    color: white;
+    border: none;
+}
+QDialog#compose_dialog QPushButton#send_button:hover {
+    background-color: $accent_hover;
+}
+QDialog#compose_dialog QPushButton#cancel_button {
+    background-color: $button_hover;
+    border: 1px solid $border;
+}
+QDialog#compose_dialog QPushButton#cancel_button:hover {
+    background-color: #e5e5e5;
+}
+QDialog#filter_dialog, QDialog#diagnostics_panel {
+    background-color: white;
+}
+QDialog#compose_dialog QLabel, QDialog#filter_dialog QLabel,
+QDialog#diagnostics_panel QLabel, QDialog#diagnostics_panel QCheckBox {
+    color: $text;
+    font-size: 13px;
+}
+QDialog#filter_dialog QComboBox, QDialog#filter_dialog QDateEdit {
+    padding: 5px;
+    border: 1px solid $border;
+    border-radius: 4px;
+}
+QDialog#filter_dialog QPushButton {
+    background-color: $accent;
+    color: white;
+    border: none;
+    padding: 8px;
+    border-radius: 4px;
+    font-weight: bold;
+}
+QDialog#filter_dialog QPushButton:hover {
+    background-color: $accent_hover;
+}
+QDialog#diagnostics_panel QTableWidget {
+    border: 1px solid $border;
+    border-radius: 4px;
+}
+""")
+
+STYLESHEET = _TEMPLATE.substitute(COLORS)
+
+
+def apply(app=None):
+    """Set the application stylesheet, unless it is already set."""
+    app = app or QApplication.instance()
+    if app is not None and app.styleSheet() != STYLESHEET:
+        app.setStyleSheet(STYLESHEET)
+
+
+class RowStyle:
+    """Colours and fonts for painting message list rows, built once per list"""
+
+    background = QColor(COLORS["panel"])
+    hover = QColor(COLORS["hover"])
+    selected = QColor(COLORS["selected"])
+    selected_edge = QColor(COLORS["accent"])
+    divider = QColor(COLORS["border_strong"])
+    sender_color = QColor("#000")
+    date_color = QColor(COLORS["muted"])
+    snippet_color = QColor(COLORS["muted"])
+    label_color = QColor(COLORS["accent"])
+    star_color = QColor(COLORS["star"])
+
+    def __init__(self, base_font: QFont):
+        self.sender_font = QFont(base_font)
+        self.sender_font.setBold(True)
+        self.sender_font.setPointSize(10)
+        self.sender_metrics = QFontMetrics(self.sender_font)
+        self.read_sender_font = QFont(self.sender_font)
+        self.read_sender_font.setBold(False)
+        self.read_sender_metrics = QFontMetrics(self.read_sender_font)
+        self.subject_font = QFont(base_font)
+        self.subject_font.setBold(False)
+        self.subject_font.setPointSize(9)
+        self.subject_metrics = QFontMetrics(self.subject_font)
+        self.date_font = QFont(self.subject_font)
+        self.date_font.setPointSize(8)
@@ -0,0 +1,137 @@
+"""
+Synthetic mailbox generator used by the benchmarks and the fake mail server.
+
+Messages are deterministic for a given seed so benchmark runs are comparable.
+"""
+
+import random
+from email import charset
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import format_datetime, formataddr
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from snippets import clean_text
+
+SENDERS = [
+    ("Alice Johnson", "alice@example.com"),
+    ("Bob Smith", "bob.smith@example.org"),
+    ("Carol Nguyen", "carol@corp.example"),
+    ("GitHub", "noreply@github.com"),
+    ("Weekly Digest", "newsletter@news.example"),
+    ("Jürgen Müller", "juergen@example.de"),
+    ("株式会社サンプル", "info@example.jp"),
+    ("Support Team", "support@service.example"),
+    ("Dave O'Brien", "dave@example.ie"),
+    ("Billing", "invoices@billing.example"),
+]
+
+SUBJECTS = [
+    "Weekly newsletter: what's new this week",
+    "Re: Project status update",
+    "Invoice #{n} is ready",
+    "Meeting notes from {day}",
+    "[repo] Pull request #{n} opened",
+    "Your order has shipped",
+    "Rückmeldung zum Angebot",
+    "ご注文ありがとうございます",
+    "Lunch on {day}?",
+    "Action required: please review the attached document",
+]
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+
+WORDS = (
+    "the quick brown fox jumps over lazy dog mail server inbox message "
+    "project status update meeting notes review please thanks regards "
+    "attached document schedule receive invoice order shipped weekly"
+).split()
+
+# Quoted-printable keeps synthetic bodies as compressible as real text mail
+UTF8_QP = charset.Charset("utf-8")
+UTF8_QP.body_encoding = charset.QP
+
+# Approximate body sizes in bytes for each size distribution
+SIZE_DISTRIBUTIONS = ("small", "mixed", "large")
+
+
+def _body_size(rng: random.Random, distribution: str) -> int:
+    if distribution == "small":
+        return int(rng.uniform(200, 2000))
+    if distribution == "large":
+        return int(rng.lognormvariate(11, 0.8))  # ~60 KB median
+    # Real inboxes: mostly short mails with a long tail of big newsletters
+    return min(int(rng.lognormvariate(8, 1.2)), 2_000_000)
+
+
+def _body_text(rng: random.Random, size: int) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    lines = []
+    for start in range(0, len(words), 12):
+        lines.append(" ".join(words[start:start + 12]))
+    if rng.random() < 0.3:
+        lines.append("")
+        lines.append("On Monday someone wrote:")
+        lines.extend("> " + line for line in lines[:3])
+    lines.append("")
+    lines.append("-- ")
+    lines.append("Sent from Mail Buddy")
+    return "\n".join(lines)
+
+
+def generate_message(index: int, rng: random.Random, distribution: str = "mixed",
+                     now: datetime = None) -> bytes:
+    """Build one RFC 822 message as bytes."""
+    now = now or datetime(2025, 3, 1, tzinfo=timezone.utc)
+    name, address = rng.choice(SENDERS)
+    subject = rng.choice(SUBJECTS).format(n=index, day=rng.choice(DAYS))
+    text = _body_text(rng, _body_size(rng, distribution))
+
+    if rng.random() < 0.5:
+        msg = MIMEMultipart("alternative")
+        msg.attach(MIMEText(text, "plain", UTF8_QP))
+        msg.attach(MIMEText(f"<html><body><pre>{text}</pre></body></html>", "html", UTF8_QP))
+    else:
+        msg = MIMEText(text, "plain", UTF8_QP)
+
+    msg["From"] = formataddr((name, address))
+    msg["To"] = "me@local.test"
+    msg["Subject"] = Header(subject, "utf-8") if not subject.isascii() else subject
+    msg["Date"] = format_datetime(now - timedelta(minutes=index * 37 + rng.randint(0, 30)))
+    msg["Message-ID"] = f"<{index}.{rng.getrandbits(32)}@synthetic.local>"
+    return msg.as_bytes()
+
+
+def generate_messages(count: int, distribution: str = "mixed", seed: int = 1) -> List[bytes]:
+    """Generate 'count' messages, oldest first."""
+    rng = random.Random(seed)
+    return [generate_message(count - i, rng, distribution) for i in range(count)]
+
+
+def generate_records(count: int, seed: int = 1) -> List[Dict]:
+    """Generate records shaped like EmailHandler.get_emails results."""
+    rng = random.Random(seed)
+    now = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    records = []
+    for i in range(count):
+        name, address = rng.choice(SENDERS)
+        subject = rng.choice(SUBJECTS).format(n=i, day=rng.choice(DAYS))
+        content = _body_text(rng, int(rng.uniform(200, 2000)))
+        records.append({
+            "id": str(i + 1),
+            "subject": subject,
+            "from": formataddr((name, address)),
+            "from_name": name,
+            "from_address": address,
+            "date": format_datetime(now - timedelta(minutes=(count - i) * 37)),
+            "content": content,
+            "snippet": clean_text(content),
+        })
+    return records